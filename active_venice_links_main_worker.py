@@ -1,76 +1,228 @@
 from selenium_airbnb_active_venice_links_scraper import (
     generate_links_to_scrape,
     get_available_rooms_at_link,
+    get_number_of_rooms_at_link,
+)
+from search_planner import (
+    plan_price_bands,
+    plan_search_links,
+    load_price_band_plan,
+    save_price_band_plan,
+)
+from driver_pool import DriverPool, run_with_pooled_driver
+from http_search_scraper import HttpSearchClient
+from task_scheduler import run_bounded
+from job_queue import (
+    JobQueueConsumer,
+    enqueue_jobs,
+    split_job_finishes,
+    save_job_finishes,
+    release_flushed_jobs,
+)
+from scraper_runs import (
+    parse_campaign_args,
+    start_campaign,
+    get_campaign_counts,
+    make_scraper_run,
+    split_scraper_runs,
+    save_scraper_runs,
 )
-import threading
 from datetime import datetime
 import logging
-import sqlalchemy
-from models import Base, db_url, save_or_update_airbnb_room_instance
 from sqlalchemy.orm import Session
-import queue
+from models import Base, bulk_save_or_update_airbnb_room_instances
+from market_aggregates import move_room_areas
+from migrations import migrate_scraper_runs
+from db_engine import create_db_engine
+from persistence_writer import PersistenceWriter
+from rate_limiter import rate_limiter
+from dom_waits import wait_stats
+from postgres_bulk_load import (
+    is_copy_backend_enabled,
+    copy_save_or_update_airbnb_room_instances,
+)
 
+args = parse_campaign_args("Scrape the rooms found by the search links")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("main_logger")
 
-result_queue = queue.Queue()
-
 # db loading and creating all tables
-engine = sqlalchemy.create_engine(
-    db_url, echo=False
-)  # We have also specified a parameter create_engine.echo, which will instruct the Engine to log all of the SQL it emits to a Python logger that will write to standard out.
+engine = create_db_engine()
+# all the writes go through the persistence writer thread and its own connection (see create_db_engine)
+writer_engine = create_db_engine(writer=True)
 Base.metadata.create_all(engine)
+migrate_scraper_runs(engine)
+USE_COPY_BACKEND = is_copy_backend_enabled(engine)  # postgres: COPY to a staging table and set based merge
 
-session = Session(engine)
 
+def write_batch(objects_to_write, session):
+    scraper_runs, objects_to_write = split_scraper_runs(objects_to_write)
+    job_finishes, objects_to_write = split_job_finishes(objects_to_write)
+    move_room_areas(session, objects_to_write)  # before the rooms upsert merges their new area
+    if USE_COPY_BACKEND:
+        copy_save_or_update_airbnb_room_instances(objects_to_write, session)
+    else:
+        bulk_save_or_update_airbnb_room_instances(objects_to_write, session)
+    save_scraper_runs(scraper_runs, session)
+    save_job_finishes(job_finishes, session)
+
+
+persistence_writer = PersistenceWriter(
+    writer_engine, write_function=write_batch, after_flush_function=release_flushed_jobs
+)
+# objects put in the queue by the scrapers are written while scraping is still running
+result_queue = persistence_writer.queue
+
+SCRAPER_NAME = "active_links"
 links_to_scrape = generate_links_to_scrape()[:15]
-logger.info(f"number of links to scrape: {len(links_to_scrape)}")
-
-MAX_BATCH_SIZE = 10
-links_to_scrape_batches = [
-    links_to_scrape[i : i + MAX_BATCH_SIZE]
-    for i in range(0, len(links_to_scrape), MAX_BATCH_SIZE)
-]
-
-
-def run_threads():
-    threads = []
-    all_drivers = []
-    for links_to_scrape_batch in links_to_scrape_batches:
-        for link_to_scrape in links_to_scrape_batch:
-            t = threading.Thread(
-                target=get_available_rooms_at_link,
-                kwargs={"link_to_get": link_to_scrape, "result_queue": result_queue},
-            )
-            t.start()
-            threads.append(t)
 
-        drivers = [t.join() for t in threads]
-        all_drivers += drivers
+HEADLESS = None
+MAX_CONCURRENT_WORKERS = 10
+SEARCH_MODE = "browser"  # "browser" (selenium, DriverPool) or "http" (plain requests, no browser)
+USE_ADAPTIVE_PRICE_BANDS = False  # count rooms to plan the price bands, starting from the plan saved by the previous run
+USE_SEARCH_TILING = False  # split the area box in quadrants (and dense tiles by price) until every search is under the results cap
+USE_JOB_QUEUE = False  # share the links with the other links worker processes through the airbnb_scrape_jobs table
+
+
+def scrape_one(driver_pool, link_to_scrape):
+    return run_with_pooled_driver(
+        driver_pool,
+        get_available_rooms_at_link,
+        link_to_get=link_to_scrape,
+        result_queue=result_queue,
+    )
+
+
+def scrape_one_http(http_search_client, link_to_scrape):
+    return http_search_client.get_available_rooms_at_link(
+        link_to_get=link_to_scrape, result_queue=result_queue
+    )
+
+
+def log_outcome(outcome):
+    if outcome.is_success:
+        logger.info(
+            "[%s] done in %.1f sec. rate: %.2f requests/sec",
+            outcome.item,
+            outcome.duration_sec,
+            rate_limiter.current_rate,
+        )
+    else:
+        logger.error(
+            "[%s] failed after %.1f sec: %s",
+            outcome.item,
+            outcome.duration_sec,
+            outcome.error,
+        )
+
 
-    all_objects_to_write = []
-    while not result_queue.empty():
-        record_to_insert = result_queue.get()
-        all_objects_to_write.append(record_to_insert)
-    return all_objects_to_write
+def record_outcome(outcome):
+    log_outcome(outcome)
+    result_queue.put(make_scraper_run(SCRAPER_NAME, campaign_id, outcome))
+
+
+def plan_links_to_scrape(count_rooms_at_link):
+    if USE_SEARCH_TILING:
+        return plan_search_links(count_rooms_at_link, max_workers=MAX_CONCURRENT_WORKERS)
+    if not USE_ADAPTIVE_PRICE_BANDS:
+        return links_to_scrape
+    price_bands = plan_price_bands(
+        count_rooms_at_link,
+        initial_price_bands=load_price_band_plan(),
+        max_workers=MAX_CONCURRENT_WORKERS,
+    )
+    save_price_band_plan(price_bands)
+    planned_links_to_scrape = generate_links_to_scrape(
+        [i for i in price_bands if i.number_of_rooms != 0]
+    )
+    logger.info(f"number of planned links to scrape: {len(planned_links_to_scrape)}")
+    return planned_links_to_scrape
+
+
+def start_links_campaign(count_rooms_at_link):
+    """
+    campaign id and links to scrape. the links of the campaign are saved when it starts and recorded in
+    airbnb_scrapers_runs as they complete. --resume scrapes the saved links which did not succeed, without planning
+    them again (the price bands or tiles counted now could differ from the campaign's)
+    """
+    campaign_id, links_to_scrape = start_campaign(
+        engine,
+        SCRAPER_NAME,
+        lambda: plan_links_to_scrape(count_rooms_at_link),
+        args.resume,
+        args.campaign_id,
+    )
+    logger.info(f"campaign {campaign_id}. number of links to scrape: {len(links_to_scrape)}")
+    return campaign_id, links_to_scrape
+
+
+def run_threads(links_to_scrape, task_function):
+    if not USE_JOB_QUEUE:
+        return run_bounded(
+            links_to_scrape,
+            task_function=task_function,
+            max_workers=MAX_CONCURRENT_WORKERS,
+            on_outcome=record_outcome,
+        )
+    # the links not in the queue yet are added, then every process claims them one lease at a time
+    with Session(engine) as session, session.begin():
+        enqueue_jobs(session, SCRAPER_NAME, links_to_scrape)
+    # jobs are finished by the persistence writer, in the batch of their objects
+    with JobQueueConsumer(
+        engine, SCRAPER_NAME, result_queue=result_queue
+    ) as job_queue_consumer:
+
+        def on_outcome(outcome):
+            record_outcome(outcome)
+            job_queue_consumer.on_outcome(outcome)
+
+        return run_bounded(
+            job_queue_consumer,
+            task_function=task_function,
+            max_workers=MAX_CONCURRENT_WORKERS,
+            on_outcome=on_outcome,
+        )
 
 
 t0 = datetime.now()
 logger.info("start to run threads")
-all_objects_to_write = run_threads()
-t1 = datetime.now()
+with persistence_writer:
+    if SEARCH_MODE == "http":
+        with HttpSearchClient(pool_maxsize=MAX_CONCURRENT_WORKERS) as http_search_client:
+            campaign_id, planned_links_to_scrape = start_links_campaign(
+                http_search_client.get_number_of_rooms_at_link
+            )
+            outcomes = run_threads(
+                planned_links_to_scrape,
+                lambda link_to_scrape: scrape_one_http(
+                    http_search_client, link_to_scrape
+                ),
+            )
+    else:
+        with DriverPool(size=MAX_CONCURRENT_WORKERS, headless=HEADLESS) as driver_pool:
+            campaign_id, planned_links_to_scrape = start_links_campaign(
+                lambda link_to_count: run_with_pooled_driver(
+                    driver_pool,
+                    get_number_of_rooms_at_link,
+                    link_to_get=link_to_count,
+                )
+            )
+            outcomes = run_threads(
+                planned_links_to_scrape,
+                lambda link_to_scrape: scrape_one(driver_pool, link_to_scrape),
+            )
+    t1 = datetime.now()
+    logger.info(
+        f"threads run over. time it took: {t1-t0}. failed tasks: {len([i for i in outcomes if not i.is_success])}"
+    )
+    logger.info(f"rate limiter: {rate_limiter.get_stats()}")
+    wait_stats.log_summary()  # where the wall-clock time of the scrapers went
+    logger.info("waiting for the remaining objects to be written")
+t2 = datetime.now()
 logger.info(
-    f"threads run over. time it took: {t1-t0}. num objects: {len(all_objects_to_write)}"
+    f"end to write objects. time it took after threads were over: {t2-t1}. num objects: {persistence_writer.num_objects_written}. failed objects: {persistence_writer.num_objects_failed}"
 )
-
-logger.info("start to add new objects")
-for object_to_write in all_objects_to_write:
-    save_or_update_airbnb_room_instance(session=session, instance=object_to_write)
-
-t2 = datetime.now()
-logger.info(f"end to add new objects. time it took: {t2-t1}")
-
-logger.info("start to commit")
-session.commit()
-t3 = datetime.now()
-logger.info(f"end to commit. time it took: {t3-t2}")
+with Session(engine) as session:
+    logger.info(
+        f"campaign {campaign_id}: {get_campaign_counts(session, SCRAPER_NAME, campaign_id)}. rerun with --resume --campaign-id {campaign_id} to retry the failed and missing items"
+    )
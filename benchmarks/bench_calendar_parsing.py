@@ -0,0 +1,100 @@
+"""
+Micro-benchmark of the calendar parsing engine (calendar_parsing) against the previous per-call implementation.
+
+Run from the repo root:
+    python -m benchmarks.bench_calendar_parsing [--corpus temp_df.csv] [--repeat 50]
+
+The corpus is the day aria-labels stored in temp_df.csv (day_label column) plus a few typical pricing form lines.
+The previous implementation is tests/calendar_parsing_reference.py, tests/test_calendar_parsing.py checks both give
+the same results. The warnings logged for the lines matching nothing are silenced while timing.
+"""
+
+import argparse
+import csv
+import time
+import logging
+from datetime import datetime
+
+from calendar_parsing import (
+    get_calendar_day,
+    parse_day_state,
+    parse_pricing_line,
+    parse_day_state_reason,
+)
+from tests.calendar_parsing_reference import (
+    reference_parse_date,
+    reference_parse_pricing_line,
+    reference_parse_state,
+)
+
+PRICING_LINES = [
+    "€120 x 5 nights",
+    "€95 x 2 nights",
+    "Cleaning fee €60",
+    "Airbnb service fee €85",
+    "Weekly stay discount -€42",
+    "Early bird discount -€30",
+    "Taxes €12",
+    "Accommodation €480",
+    "Show price breakdown",
+    "Last minute discount -€25",
+    "Monthly stay discount -€1,200",
+    "$1,050 x 7 nights",
+]
+
+
+def load_corpus(corpus_path):
+    """(month_header, cell_index, day_label) of every day of the corpus"""
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    corpus = []
+    for row in rows:
+        day = datetime.strptime(row["date"], "%Y-%m-%d").date()
+        corpus.append((day.strftime("%B %Y"), day.day - 1, row["day_label"]))
+    return corpus
+
+
+def bench(function, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--corpus", default="temp_df.csv")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    corpus = load_corpus(args.corpus)
+    logging.disable(logging.WARNING)  # "Show price breakdown" and the other lines matching nothing
+
+    cases = [
+        (
+            "day state",
+            lambda: [reference_parse_state(i[2]) for i in corpus],
+            lambda: [parse_day_state(i[2]) for i in corpus],
+        ),
+        (
+            "day date",
+            lambda: [reference_parse_date(i[2]) for i in corpus],
+            lambda: [get_calendar_day(*i) for i in corpus],
+        ),
+        (
+            "pricing lines",
+            lambda: [reference_parse_pricing_line(i, 5) for i in PRICING_LINES],
+            lambda: [parse_pricing_line(i, 5) for i in PRICING_LINES],
+        ),
+    ]
+    print(f"{len(corpus)} day labels, {len(PRICING_LINES)} pricing lines, repeat: {args.repeat}")
+    for name, reference_function, engine_function in cases:
+        reference_sec = bench(reference_function, args.repeat)
+        engine_sec = bench(engine_function, args.repeat)
+        print(
+            f"{name:>14}: {reference_sec * 1000:7.3f} ms -> {engine_sec * 1000:7.3f} ms  ({reference_sec / engine_sec:5.1f}x)"
+        )
+    print(f"day state memo: {parse_day_state_reason.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Page load time and bytes downloaded by chrome with each profile of settings.DRIVER_PROFILES, against a local test page.
+
+Run from the repo root (needs chrome and its driver):
+    python -m benchmarks.bench_driver_profiles [--loads 10] [--images 40] [--profiles full light]
+
+The test page stands in for a room page: the html with the calendar markup the scrapers wait for, a script building
+part of the page, then what the light profile leaves out: images, web fonts, a video, map tiles and a tracker.
+The server slows the heavy resources down (--asset-delay-ms), as a congested cdn would, and counts the bytes it sends.
+The load time is the time until the calendar is in the page, as the scrapers see it (driver.get + dom_waits).
+"""
+
+import time
+import argparse
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support import expected_conditions as EC
+
+from my_webdriver import driver_setup
+from dom_waits import wait_until
+from dom_extraction import CALENDAR_TABLE_DIV_SELECTOR
+
+ASSET_SIZES = {
+    ".jpg": 150_000,
+    ".woff2": 60_000,
+    ".mp4": 1_500_000,
+    ".png": 20_000,  # map tiles
+    ".js": 30_000,
+}
+CONTENT_TYPES = {
+    ".jpg": "image/jpeg",
+    ".woff2": "font/woff2",
+    ".mp4": "video/mp4",
+    ".png": "image/png",
+    ".js": "application/javascript",
+}
+
+
+def make_test_page(number_of_images):
+    images = "".join(
+        f'<img src="/photos/{i}.jpg" width="300" height="200">' for i in range(number_of_images)
+    )
+    map_tiles = "".join(
+        f'<img src="/maps.googleapis.com/tiles/{i}.png">' for i in range(16)
+    )
+    calendar_class = CALENDAR_TABLE_DIV_SELECTOR.lstrip(".")
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+<style>@font-face {{ font-family: "Cereal"; src: url("/fonts/cereal.woff2"); }} body {{ font-family: "Cereal"; }}</style>
+<script src="/app/bundle.js"></script>
+<script async src="/googletagmanager.com/gtm.js"></script>
+</head>
+<body>
+<h1>Room</h1>
+{images}
+<video src="/videos/tour.mp4" autoplay muted></video>
+<div id="map">{map_tiles}</div>
+<div id="calendar"></div>
+<script>
+document.getElementById("calendar").innerHTML = '<div class="{calendar_class}"><h3>August 2024</h3><table></table></div>';
+</script>
+</body>
+</html>
+""".encode("utf-8")
+
+
+def make_test_handler(page, asset_delay_sec, counters):
+    class TestPageHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            extension = "." + path.rsplit(".", 1)[-1] if "." in path else ""
+            if path == "/room":
+                body, content_type = page, "text/html; charset=utf-8"
+            elif extension in ASSET_SIZES:
+                if extension != ".js" or "googletagmanager" in path:
+                    time.sleep(asset_delay_sec)
+                body = (b" " if extension == ".js" else b"\0") * ASSET_SIZES[extension]
+                content_type = CONTENT_TYPES[extension]
+            else:
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+            with counters["lock"]:
+                counters["requests"] += 1
+                counters["bytes"] += len(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return TestPageHandler
+
+
+def run_profile(profile, url, counters, number_of_loads):
+    driver = driver_setup(headless=True, profile=profile)
+    load_times = []
+    try:
+        with counters["lock"]:
+            counters["requests"] = counters["bytes"] = 0
+        for _ in range(number_of_loads):
+            driver.get("about:blank")
+            t0 = time.perf_counter()
+            driver.get(url)
+            wait_until(
+                driver,
+                EC.presence_of_element_located((By.CSS_SELECTOR, CALENDAR_TABLE_DIV_SELECTOR)),
+                "bench_calendar",
+            )
+            load_times.append(time.perf_counter() - t0)
+    finally:
+        driver.quit()
+    return load_times, counters["requests"] / number_of_loads, counters["bytes"] / number_of_loads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--loads", type=int, default=10)
+    parser.add_argument("--images", type=int, default=40)
+    parser.add_argument("--asset-delay-ms", type=int, default=200)
+    parser.add_argument("--profiles", nargs="+", default=["full", "light"])
+    args = parser.parse_args()
+    counters = {"lock": threading.Lock(), "requests": 0, "bytes": 0}
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        make_test_handler(make_test_page(args.images), args.asset_delay_ms / 1000, counters),
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/room"
+    print(f"{args.loads} loads of a page with {args.images} images, assets delayed {args.asset_delay_ms} ms")
+    try:
+        for profile in args.profiles:
+            load_times, requests_per_load, bytes_per_load = run_profile(
+                profile, url, counters, args.loads
+            )
+            print(
+                f"{profile:>6}: load {statistics.median(load_times) * 1000:7.0f} ms (median)"
+                f"  requests {requests_per_load:5.1f}  downloaded {bytes_per_load / 1e6:6.2f} MB per load"
+            )
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
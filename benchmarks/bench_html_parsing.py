@@ -0,0 +1,80 @@
+"""
+Compares the html parsing backends on a search results page.
+
+Run from the repo root:
+    python -m benchmarks.bench_html_parsing [--fixture saved_search_page.html] [--repeat 20]
+
+Without --fixture a synthetic page shaped like an airbnb search results page is generated
+(18 room cards with their meta tags buried in a large amount of unrelated markup and inline json).
+"""
+
+import argparse
+import random
+import time
+
+from html_parsing import ROOM_LINKS_BACKENDS
+
+
+def make_search_page_fixture(
+    num_rooms=18, filler_divs_per_room=300, seed=0, total_rooms=None
+):
+    rng = random.Random(seed)
+    filler = "".join(
+        f'<div class="c{i} atm_9s_1bgihbq dir dir-ltr"><span aria-hidden="true">{rng.random()}</span></div>'
+        for i in range(filler_divs_per_room)
+    )
+    cards = []
+    for _ in range(num_rooms):
+        room_id = rng.randrange(10**6, 10**18)
+        cards.append(
+            f'<div itemprop="itemListElement" itemscope>'
+            f'<meta itemprop="name" content="Apartment in Venice">'
+            f'<meta itemprop="position" content="1">'
+            f'<meta itemprop="url" content="www.airbnb.com/rooms/{room_id}?adults=2&amp;check_in=2024-06-01&amp;previous_page_section_name=1000">'
+            f"{filler}</div>"
+        )
+    inline_json = '{"lat":45.43,"lng":12.33,' + ",".join(
+        f'"k{i}":"{rng.random()}"' for i in range(5000)
+    ) + "}"
+    return (
+        "<!DOCTYPE html><html><head><title>Venice</title>"
+        f'<script type="application/json" id="data-deferred-state">{inline_json}</script>'
+        f'</head><body><div id="site-content">'
+        f'<section><h1><span>{total_rooms or num_rooms} homes</span></h1></section>'
+        f'{"".join(cards)}</div></body></html>'
+    )
+
+
+def bench(function, page_source, repeat):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        function(page_source)
+    return (time.perf_counter() - t0) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fixture", help="saved html of a search results page")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.fixture:
+        with open(args.fixture, "r", encoding="utf-8") as f:
+            page_source = f.read()
+    else:
+        page_source = make_search_page_fixture()
+    print(f"page size: {len(page_source) / 1024:.0f} KiB, repeat: {args.repeat}")
+
+    reference_links = ROOM_LINKS_BACKENDS["html.parser"](page_source)
+    reference_sec = bench(ROOM_LINKS_BACKENDS["html.parser"], page_source, args.repeat)
+    for backend, function in ROOM_LINKS_BACKENDS.items():
+        links = function(page_source)
+        assert links == reference_links, f"{backend} returned different links"
+        sec = bench(function, page_source, args.repeat)
+        print(
+            f"{backend:>12}: {sec * 1000:8.2f} ms/page  {reference_sec / sec:6.1f}x  ({len(links)} links)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Runs the browserless HttpSearchClient, or the selenium scraper it replaces, against a local stand-in of the
+airbnb search pages.
+
+Run from the repo root:
+    python -m benchmarks.bench_http_search [--mode http|browser] [--links 15] [--rooms-per-link 200] [--workers 10]
+
+The stand-in serves gzip compressed generated search pages (see bench_html_parsing.make_search_page_fixture)
+with keep-alive, so the numbers include the real http stack: connection reuse, decompression and parsing.
+In browser mode the pages get the nesting the selenium scraper waits for, and the scraper runs with a DriverPool
+of headless chrome drivers (needs chrome and chromedriver).
+Reports links discovered per wall-clock second and per CPU-second. In browser mode the CPU time of chromedriver
+and chrome is added once the drivers have quit (resource.RUSAGE_CHILDREN, unix only), starting them included.
+"""
+
+import argparse
+import gzip
+import queue
+import resource
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, urlunparse, parse_qs
+
+from benchmarks.bench_html_parsing import make_search_page_fixture
+from driver_pool import DriverPool, run_with_pooled_driver
+from http_search_scraper import HttpSearchClient, get_page_link
+from selenium_airbnb_active_venice_links_scraper import (
+    MAX_HOMES_PER_PAGE,
+    generate_links_to_scrape,
+    get_available_rooms_at_link,
+    get_number_of_pages_to_scrape,
+)
+from task_scheduler import run_bounded
+
+
+def nest_in_divs(html, depth):
+    return "<div>" * depth + html + "</div>" * depth
+
+
+def to_browser_layout(page_source, page_link, page_index, number_of_pages):
+    """
+    the search page fixture in the nesting the xpaths of selenium_airbnb_active_venice_links_scraper wait for:
+    rooms heading, first room card and pagination buttons. the scraper clicks the second button to go to the
+    next page, so the buttons are the current page, the next one, then the others
+    """
+    head, _, content = page_source.partition('<div id="site-content">')
+    heading, _, cards = content.partition("</section>")
+    cards = cards.removesuffix("</div></body></html>")
+    first_card = nest_in_divs(
+        "<div></div>" + nest_in_divs('<a href="#">room</a>', 5), 7
+    )
+    page_numbers = list(range(1, number_of_pages + 1))
+    page_numbers.remove(page_index + 1)
+    page_numbers.insert(0, page_index + 1)
+    if page_index + 1 < number_of_pages:
+        page_numbers.remove(page_index + 2)
+        page_numbers.insert(1, page_index + 2)
+    buttons = "".join(
+        f'<a href="{get_page_link(page_link, i - 1, [])}">{i}</a>' for i in page_numbers
+    )
+    return (
+        f'{head}<div id="site-content"><div>'
+        f"{nest_in_divs(heading + '</section>', 4)}"
+        f"<div>{first_card}{cards}</div>"
+        f"{nest_in_divs(f'<nav><div>{buttons}</div></nav>', 4)}"
+        "</div></div></body></html>"
+    )
+
+
+def make_stand_in_handler(rooms_per_link, is_browser_layout=False):
+    pages_cache = {}
+    pages_cache_lock = threading.Lock()
+
+    class SearchPageHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            items_offset = query.get("items_offset", ["0"])[0]
+            seed = hash((query["price_min"][0], items_offset))
+            with pages_cache_lock:
+                if self.path not in pages_cache:
+                    page_source = make_search_page_fixture(
+                        seed=seed, total_rooms=rooms_per_link
+                    )
+                    if is_browser_layout:
+                        page_source = to_browser_layout(
+                            page_source,
+                            self.path,
+                            int(items_offset) // MAX_HOMES_PER_PAGE,
+                            get_number_of_pages_to_scrape(rooms_per_link),
+                        )
+                    pages_cache[self.path] = gzip.compress(page_source.encode("utf-8"))
+                body = pages_cache[self.path]
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Encoding", "gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SearchPageHandler
+
+
+def to_stand_in_link(link, base_url):
+    """same replacement of scheme and host as HttpSearchClient.to_request_url"""
+    base_url = urlparse(base_url)
+    return urlunparse(urlparse(link)._replace(scheme=base_url.scheme, netloc=base_url.netloc))
+
+
+def scrape_http(links_to_scrape, base_url, result_queue, workers):
+    with HttpSearchClient(base_url=base_url, pool_maxsize=workers) as client:
+        return run_bounded(
+            links_to_scrape,
+            task_function=lambda link: client.get_available_rooms_at_link(
+                link, result_queue
+            ),
+            max_workers=workers,
+        )
+
+
+def scrape_browser(links_to_scrape, base_url, result_queue, workers):
+    with DriverPool(size=workers, headless=True) as driver_pool:
+        return run_bounded(
+            [to_stand_in_link(i, base_url) for i in links_to_scrape],
+            task_function=lambda link: run_with_pooled_driver(
+                driver_pool,
+                get_available_rooms_at_link,
+                link_to_get=link,
+                result_queue=result_queue,
+            ),
+            max_workers=workers,
+        )
+
+
+def get_children_cpu_sec():
+    """cpu time of the child processes which exited and were waited for (and of their own children)"""
+    children_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return children_usage.ru_utime + children_usage.ru_stime
+
+
+SCRAPE_FUNCTIONS = {"http": scrape_http, "browser": scrape_browser}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mode", choices=list(SCRAPE_FUNCTIONS), default="http")
+    parser.add_argument("--links", type=int, default=15)
+    parser.add_argument("--rooms-per-link", type=int, default=200)
+    parser.add_argument("--workers", type=int, default=10)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(
+        ("127.0.0.1", 0),
+        make_stand_in_handler(args.rooms_per_link, is_browser_layout=args.mode == "browser"),
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    result_queue = queue.Queue()
+    links_to_scrape = generate_links_to_scrape()[: args.links]
+    wall_t0, cpu_t0 = time.perf_counter(), time.process_time()
+    children_cpu_t0 = get_children_cpu_sec()
+    outcomes = SCRAPE_FUNCTIONS[args.mode](
+        links_to_scrape, base_url, result_queue, args.workers
+    )
+    wall_sec = time.perf_counter() - wall_t0
+    # includes the stand-in server threads, and in browser mode the drivers, which have quit by now
+    cpu_sec = time.process_time() - cpu_t0 + get_children_cpu_sec() - children_cpu_t0
+    server.shutdown()
+
+    num_links = result_queue.qsize()
+    print(
+        f"[{args.mode}] {len(outcomes)} searches ({len([i for i in outcomes if not i.is_success])} failed). "
+        f"{num_links} links in {wall_sec:.2f} sec wall, {cpu_sec:.2f} sec cpu. "
+        f"{num_links / wall_sec:.0f} links/sec, {num_links / cpu_sec:.0f} links/cpu-sec"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark of the postgres COPY write backend (postgres_bulk_load) against the multi-row upsert one (models).
+
+Run from the repo root against a local, disposable postgres database (its airbnb tables are dropped and recreated):
+    python -m benchmarks.bench_postgres_bulk_load --db-url postgresql+psycopg2://postgres@localhost:5432/postgres [--rooms 200] [--days 365] [--rounds 3]
+
+The same synthetic scrape rounds (every room calendar, then random state / price changes) are written with both
+backends. The stored calendar days, transition deltas and json blobs are checked to be the same.
+"""
+
+import random
+import argparse
+import time
+from datetime import date, timedelta
+
+import sqlalchemy
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import (
+    Base,
+    CalendarDayState,
+    AirBnbRoom,
+    AirBnbRoomCalendarDay,
+    AirBnbJsonBlob,
+    AirBnbRoomCalendarDayTransitionDelta,
+    bulk_save_or_update_airbnb_room_instances,
+    bulk_save_or_update_airbnb_dates,
+)
+from postgres_bulk_load import (
+    copy_save_or_update_airbnb_room_instances,
+    copy_save_or_update_airbnb_dates,
+)
+
+BACKENDS = {
+    "upsert": (bulk_save_or_update_airbnb_room_instances, bulk_save_or_update_airbnb_dates),
+    "copy": (copy_save_or_update_airbnb_room_instances, copy_save_or_update_airbnb_dates),
+}
+
+
+def make_scrape_rounds(num_rooms, num_days, num_rounds, change_ratio, seed):
+    """list of rounds of calendar day tuples. after the first round, change_ratio of the days change"""
+    rng = random.Random(seed)
+    first_day = date(2024, 8, 1)
+    states = list(CalendarDayState)
+    days = {}
+    for room_id in range(num_rooms):
+        for day_index in range(num_days):
+            days[(str(room_id), first_day + timedelta(days=day_index))] = None
+    rounds = []
+    for round_index in range(num_rounds):
+        for key in days:
+            if round_index == 0 or rng.random() < change_ratio:
+                state = rng.choice(states)
+                price = float(rng.randint(60, 400)) if state == CalendarDayState.AVAILABLE else None
+                days[key] = (
+                    state,
+                    price,
+                    (
+                        [{"check_in": key[1].isoformat(), "check_out": (key[1] + timedelta(days=2)).isoformat(), "price": price}]
+                        if price
+                        else []
+                    ),
+                    rng.choice([1, 2, 3]),
+                    rng.choice([None, 30.0, 50.0]),
+                    "€" if price else None,
+                    {"round": round_index} if price else {},
+                )
+        rounds.append([(*key, *values) for key, values in days.items()])
+    return rounds
+
+
+def to_instances(scrape_round):
+    return [
+        AirBnbRoomCalendarDay(
+            room_id=room_id,
+            calendar_day=calendar_day,
+            state=state,
+            price=price,
+            latest_prices_array=latest_prices_array,
+            minimum_stay_nights=minimum_stay_nights,
+            cleaning_fee=cleaning_fee,
+            currency=currency,
+            extra_attributes=extra_attributes,
+        )
+        for room_id, calendar_day, state, price, latest_prices_array, minimum_stay_nights, cleaning_fee, currency, extra_attributes in scrape_round
+    ]
+
+
+def snapshot(engine):
+    calendar_days_table = AirBnbRoomCalendarDay.__table__
+    deltas_table = AirBnbRoomCalendarDayTransitionDelta.__table__
+    delta_columns = [i for i in deltas_table.c if i.name not in ("id", "created_at")]
+    with engine.connect() as connection:
+        calendar_days = connection.execute(
+            select(*[i for i in calendar_days_table.c if i.name not in ("created_at", "updated_at")])
+            .order_by(calendar_days_table.c.room_id, calendar_days_table.c.calendar_day)
+        ).all()
+        deltas = connection.execute(
+            select(*delta_columns).order_by(
+                deltas_table.c.room_id, deltas_table.c.calendar_day, deltas_table.c.id
+            )
+        ).all()
+        json_blobs = connection.execute(
+            select(AirBnbJsonBlob.__table__.c.content_hash).order_by("content_hash")
+        ).all()
+        rooms = connection.execute(
+            select(AirBnbRoom.__table__.c.id, AirBnbRoom.__table__.c.number_updates).order_by("id")
+        ).all()
+    return calendar_days, deltas, json_blobs, rooms
+
+
+def run_backend(engine, backend, rounds, num_rooms):
+    write_rooms, write_calendar_days = BACKENDS[backend]
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    timings = []
+    for scrape_round in rounds:
+        rooms = [AirBnbRoom(id=str(i), room_url=f"/rooms/{i}") for i in range(num_rooms)]
+        calendar_days = to_instances(scrape_round)
+        t0 = time.perf_counter()
+        with Session(engine) as session:
+            write_rooms(rooms, session)
+            write_calendar_days(calendar_days, session)
+            session.commit()
+        timings.append(time.perf_counter() - t0)
+    return timings, snapshot(engine)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db-url", required=True)
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--change-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+    engine = sqlalchemy.create_engine(args.db_url, echo=False)
+    rounds = make_scrape_rounds(args.rooms, args.days, args.rounds, args.change_ratio, seed=0)
+
+    print(f"{args.rooms} rooms x {args.days} days, {args.rounds} rounds")
+    snapshots = {}
+    for backend in BACKENDS:
+        timings, snapshots[backend] = run_backend(engine, backend, rounds, args.rooms)
+        print(
+            f"{backend:>7}: "
+            + "  ".join(f"round {i}: {t:6.2f} s ({len(rounds[i]) / t:8.0f} days/s)" for i, t in enumerate(timings))
+        )
+    for name, upsert_rows, copy_rows in zip(
+        ["calendar days", "transition deltas", "json blobs", "rooms"],
+        snapshots["upsert"],
+        snapshots["copy"],
+    ):
+        print(f"{name:>17}: {len(copy_rows)} rows, same as upsert backend: {upsert_rows == copy_rows}")
+
+
+if __name__ == "__main__":
+    main()
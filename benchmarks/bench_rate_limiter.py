@@ -0,0 +1,108 @@
+"""
+Throughput of the scraper threads against a simulated throttling site, without and with the AdaptiveRateLimiter.
+
+Run from the repo root:
+    python -m benchmarks.bench_rate_limiter [--threads 10] [--capacity 20] [--duration 30]
+
+The site serves up to --capacity requests per second, with a latency growing with the load. Once more requests than
+that arrived in the last second it throttles: for --penalty seconds every request hangs until the --timeout and fails,
+as airbnb pages which never load. Time is scaled down (timeouts of a second instead of DEFAULT_LOAD_TIME_WAIT),
+so the limiter runs with settings scaled the same way.
+"""
+
+import time
+import argparse
+import threading
+from collections import deque
+
+from rate_limiter import AdaptiveRateLimiter
+
+
+class SimulatedSite:
+    def __init__(self, capacity_per_sec, base_latency_sec, timeout_sec, penalty_sec):
+        self.capacity_per_sec = capacity_per_sec
+        self.base_latency_sec = base_latency_sec
+        self.timeout_sec = timeout_sec
+        self.penalty_sec = penalty_sec
+        self.arrivals = deque()
+        self.throttled_until = 0.0
+        self.lock = threading.Lock()
+
+    def request(self):
+        with self.lock:
+            now = time.monotonic()
+            self.arrivals.append(now)
+            while self.arrivals[0] < now - 1:
+                self.arrivals.popleft()
+            load = len(self.arrivals) / self.capacity_per_sec
+            if load > 1:
+                self.throttled_until = now + self.penalty_sec
+            is_throttled = now < self.throttled_until
+        if is_throttled:
+            time.sleep(self.timeout_sec)
+            raise TimeoutError("page did not load")
+        time.sleep(self.base_latency_sec * (1 + load))
+
+
+def run_mode(rate_limiter, args):
+    site = SimulatedSite(args.capacity, args.base_latency, args.timeout, args.penalty)
+    counts = {"ok": 0, "failed": 0}
+    counts_lock = threading.Lock()
+    stop_at = time.monotonic() + args.duration
+
+    def scraper_thread():
+        while time.monotonic() < stop_at:
+            try:
+                if rate_limiter is None:
+                    site.request()
+                else:
+                    with rate_limiter.request():
+                        site.request()
+                key = "ok"
+            except TimeoutError:
+                key = "failed"
+            with counts_lock:
+                counts[key] += 1
+
+    threads = [threading.Thread(target=scraper_thread) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--threads", type=int, default=10)
+    parser.add_argument("--capacity", type=float, default=20)
+    parser.add_argument("--base-latency", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=1.0)
+    parser.add_argument("--penalty", type=float, default=2.0)
+    parser.add_argument("--duration", type=float, default=30)
+    args = parser.parse_args()
+    print(
+        f"{args.threads} threads, site capacity {args.capacity} requests/sec, {args.duration} sec per mode"
+    )
+    modes = {
+        "unlimited": None,
+        "adaptive": AdaptiveRateLimiter(
+            initial_rate_per_sec=2,
+            max_rate_per_sec=1000,
+            additive_increase_per_sec=2,
+            target_latency_sec=args.timeout / 3,
+            decrease_cooldown_sec=args.timeout,
+        ),
+    }
+    for mode, rate_limiter in modes.items():
+        counts = run_mode(rate_limiter, args)
+        print(
+            f"{mode:>9}: ok {counts['ok']:6d} ({counts['ok'] / args.duration:6.1f}/sec)  failed {counts['failed']:6d}"
+            + (f"  final rate {rate_limiter.current_rate:6.1f}/sec" if rate_limiter else "")
+        )
+        if rate_limiter:
+            print(f"{'':>11}{rate_limiter.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Memory and time to hold the scraped calendars of many rooms: a dict per day deep copied from a template and converted
+to AirBnbRoomCalendarDay in the scraper thread (as the calendar scraper did), against room_calendar.RoomCalendar.
+
+Run from the repo root:
+    python -m benchmarks.bench_room_calendar [--rooms 200] [--days 180] [--priced-share 0.5]
+
+The memory is the peak traced by tracemalloc while the calendars of --rooms rooms wait to be written, as they do in
+the persistence writer queue. The rows are built from the RoomCalendar objects afterwards, as write_batch does.
+"""
+
+import copy
+import time
+import random
+import argparse
+import tracemalloc
+from datetime import date, datetime, timedelta
+
+from models import AirBnbRoomCalendarDay, CalendarDayState
+from room_calendar import RoomCalendar, expand_room_calendars
+
+DAY_DICT_TEMPLATE = {
+    "current_date_state": None,
+    "minimum_stay_nights": None,
+    "latest_prices_array": [],
+    "cleaning_fee": None,
+    "currency": None,
+    "extra_attributes": {},
+    "price": None,
+}
+
+
+def make_scraped_days(number_of_days, priced_share, seed):
+    """(day, state, minimum nights, pricing dict or None) as read from the calendar of one room"""
+    rng = random.Random(seed)
+    first_day = date(2024, 8, 1)
+    scraped_days = []
+    for day_index in range(number_of_days):
+        state = rng.choice([CalendarDayState.AVAILABLE, CalendarDayState.UNAVAILABLE])
+        num_nights = rng.choice([1, 2, 3])
+        pricing_dict = None
+        if state == CalendarDayState.AVAILABLE and rng.random() < priced_share:
+            pricing_dict = {
+                "price": float(rng.randint(50, 300)),
+                "cleaning_fee": 30.0,
+                "currency": "EUR",
+                "airbnb_service_fee": 25.0,
+            }
+        scraped_days.append((first_day + timedelta(days=day_index), state, num_nights, pricing_dict))
+    return scraped_days
+
+
+def build_day_dicts(room_id, scraped_days):
+    days = {}
+    for day, state, num_nights, pricing_dict in scraped_days:
+        days.setdefault(day, copy.deepcopy(DAY_DICT_TEMPLATE))
+        days[day]["current_date_state"] = state
+        days[day]["minimum_stay_nights"] = num_nights
+        if pricing_dict is None:
+            continue
+        pricing_dict = dict(pricing_dict)
+        price = pricing_dict.pop("price", None)
+        days[day]["cleaning_fee"] = pricing_dict.pop("cleaning_fee", None)
+        days[day]["currency"] = pricing_dict.pop("currency", None)
+        days[day]["extra_attributes"] = pricing_dict
+        for night_index in range(num_nights):
+            covered_day = day + timedelta(days=night_index)
+            days.setdefault(covered_day, copy.deepcopy(DAY_DICT_TEMPLATE))
+            days[covered_day]["latest_prices_array"].append(
+                {
+                    "check_in": day.strftime("%Y-%m-%d"),
+                    "check_out": (day + timedelta(days=num_nights)).strftime("%Y-%m-%d"),
+                    "price": price,
+                }
+            )
+            for key in ("cleaning_fee", "currency"):
+                if days[covered_day][key] is None:
+                    days[covered_day][key] = days[day][key]
+    price_checked_at = datetime.now().isoformat(timespec="seconds")
+    return [
+        AirBnbRoomCalendarDay(
+            room_id=room_id,
+            calendar_day=day,
+            state=details["current_date_state"],
+            minimum_stay_nights=details["minimum_stay_nights"],
+            price=(
+                sum(i["price"] for i in details["latest_prices_array"]) / len(details["latest_prices_array"])
+                if details["latest_prices_array"]
+                else None
+            ),
+            latest_prices_array=details["latest_prices_array"],
+            cleaning_fee=details["cleaning_fee"],
+            currency=details["currency"],
+            extra_attributes=(
+                {**details["extra_attributes"], "price_checked_at": price_checked_at}
+                if details["latest_prices_array"]
+                else details["extra_attributes"]
+            ),
+        )
+        for day, details in days.items()
+    ]
+
+
+def build_room_calendar(room_id, scraped_days):
+    room_calendar = RoomCalendar(room_id)
+    for day, state, num_nights, pricing_dict in scraped_days:
+        room_calendar.set_day(day, state, num_nights)
+        if pricing_dict is not None:
+            room_calendar.add_stay_pricing(day, num_nights, pricing_dict)
+    return room_calendar.finish()
+
+
+def measure(build_function, scraped_days_by_room):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    queued = [build_function(str(room_id), days) for room_id, days in scraped_days_by_room.items()]
+    build_sec = time.perf_counter() - t0
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return queued, build_sec, peak_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--priced-share", type=float, default=0.5)
+    args = parser.parse_args()
+    scraped_days_by_room = {
+        room_id: make_scraped_days(args.days, args.priced_share, seed=room_id)
+        for room_id in range(args.rooms)
+    }
+    print(f"{args.rooms} rooms x {args.days} days, {args.priced_share:.0%} of the available days priced")
+    _, build_sec, peak_bytes = measure(build_day_dicts, scraped_days_by_room)
+    print(f"{'day dicts':>13}: build {build_sec:6.2f} sec  peak memory {peak_bytes / 1e6:7.1f} MB")
+    room_calendars, build_sec, peak_bytes = measure(build_room_calendar, scraped_days_by_room)
+    t0 = time.perf_counter()
+    rows = expand_room_calendars(room_calendars)
+    to_rows_sec = time.perf_counter() - t0
+    print(
+        f"{'RoomCalendar':>13}: build {build_sec:6.2f} sec  peak memory {peak_bytes / 1e6:7.1f} MB"
+        f"  ({len(rows)} rows built by the writer in {to_rows_sec:.2f} sec)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Concurrent write benchmark of the sqlite writer mode (db_engine.create_db_engine) against a default sqlalchemy engine.
+
+Run from the repo root:
+    python -m benchmarks.bench_sqlite_writer [--processes 3] [--threads 4] [--rooms 20] [--days 120] [--batch-size 50]
+
+Every process (as a links worker and a calendar worker running at the same time) has its scraper threads put
+calendar days in a PersistenceWriter, while reading the stored days as the incremental rescrape does.
+The same load is run on a fresh temporary db for each mode. Failed objects are the ones of batches rolled back
+because of "database is locked".
+"""
+
+import os
+import time
+import random
+import tempfile
+import argparse
+import threading
+import multiprocessing
+from datetime import date, timedelta
+
+import sqlalchemy
+from sqlalchemy.orm import Session
+
+from models import (
+    Base,
+    AirBnbRoom,
+    AirBnbRoomCalendarDay,
+    bulk_save_or_update_airbnb_dates,
+    fetch_room_calendar_days,
+)
+from db_engine import create_db_engine
+from persistence_writer import PersistenceWriter
+
+
+def make_engines(mode, url):
+    if mode == "default":
+        engine = sqlalchemy.create_engine(url)
+        return engine, engine
+    return create_db_engine(url), create_db_engine(url, writer=True)
+
+
+def scrape_room(engine, room_id, num_days, result_queue):
+    """stand-in of a calendar scrape: reads the stored days of the room, then produces its days"""
+    with Session(engine) as session:
+        fetch_room_calendar_days(session, room_id)
+    for day_index in range(num_days):
+        result_queue.put(
+            AirBnbRoomCalendarDay(
+                room_id=room_id,
+                calendar_day=date(2024, 8, 1) + timedelta(days=day_index),
+                state=random.choice(["AVAILABLE", "UNAVAILABLE"]),
+                price=float(random.randint(60, 300)),
+                latest_prices_array=[],
+                minimum_stay_nights=1,
+                cleaning_fee=None,
+                currency="€",
+                extra_attributes={},
+            )
+        )
+
+
+def run_process(mode, url, process_index, num_threads, num_rooms, num_days, batch_size, results):
+    engine, writer_engine = make_engines(mode, url)
+    with PersistenceWriter(
+        writer_engine,
+        write_function=bulk_save_or_update_airbnb_dates,
+        batch_size=batch_size,
+        flush_interval_sec=0.2,
+    ) as writer:
+        room_ids = [f"{process_index}-{i}" for i in range(num_rooms)]
+        threads = [
+            threading.Thread(
+                target=lambda ids: [
+                    scrape_room(engine, i, num_days, writer.queue) for i in ids
+                ],
+                args=(room_ids[thread_index::num_threads],),
+            )
+            for thread_index in range(num_threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    results.put((writer.num_objects_written, writer.num_objects_failed))
+
+
+def run_mode(mode, args):
+    db_path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    url = f"sqlite:///{db_path}"
+    engine = sqlalchemy.create_engine(url)
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add_all(
+            AirBnbRoom(id=f"{p}-{i}")
+            for p in range(args.processes)
+            for i in range(args.rooms)
+        )
+        session.commit()
+    results = multiprocessing.Queue()
+    t0 = time.perf_counter()
+    processes = [
+        multiprocessing.Process(
+            target=run_process,
+            args=(mode, url, p, args.threads, args.rooms, args.days, args.batch_size, results),
+        )
+        for p in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - t0
+    written, failed = map(sum, zip(*[results.get() for _ in processes]))
+    return elapsed, written, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--processes", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--rooms", type=int, default=20)
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+    total = args.processes * args.rooms * args.days
+    print(f"{args.processes} processes x {args.threads} threads, {total} calendar days")
+    for mode in ("default", "writer"):
+        elapsed, written, failed = run_mode(mode, args)
+        print(
+            f"{mode:>8}: {elapsed:6.2f} s  written: {written:7d}  failed: {failed:7d}  ({written / elapsed:8.0f} days/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
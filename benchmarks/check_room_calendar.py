@@ -0,0 +1,205 @@
+"""
+Checks that room_calendar.RoomCalendar builds the same calendar day rows as the dict per day of the calendar scraper
+it replaced (the legacy functions below are those of the scraper, only the timestamp of the prices is passed in).
+
+Run from the repo root:
+    python -m benchmarks.check_room_calendar [--calendars 300] [--seed 1]
+
+Each calendar has random days (any state, with or without minimum nights), some of them priced with random
+prices (including missing and nan ones), fees and currencies, read in date order as the scraper does.
+"""
+
+import copy
+import math
+import random
+import argparse
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from models import (
+    AirBnbRoomCalendarDay,
+    CALENDAR_DAY_COLUMNS,
+    CalendarDayState,
+    model_to_row,
+)
+from room_calendar import RoomCalendar, expand_room_calendars
+
+# the dict based scraper kept the time the prices were read in the extra attributes, RoomCalendar in its column
+LEGACY_PRICE_CHECKED_AT_KEY = "price_checked_at"
+CALENDAR_DAYS_DETAILS_EMPTY_TEMPLATE = {
+    "current_date_state": None,
+    "minimum_stay_nights": None,
+    "latest_prices_array": [],
+    "cleaning_fee": None,
+    "currency": None,
+    "extra_attributes": {},
+    "price": None,
+}
+
+
+def calculate_mean(prices):
+    prices_array = np.array(prices, dtype=float)
+    valid_prices = prices_array[~np.isnan(prices_array)]
+    if len(valid_prices) == 0:
+        return None
+    return np.mean(valid_prices)
+
+
+def enrich_calendar_days_details_if_data_is_available(
+    current_date_state, pricing_dict, calendar_days_details, date_button_date, num_nights
+):
+    if current_date_state == CalendarDayState.AVAILABLE:
+        current_price = pricing_dict.pop("price", None)
+        calendar_days_details[date_button_date]["cleaning_fee"] = pricing_dict.pop("cleaning_fee", None)
+        calendar_days_details[date_button_date]["currency"] = pricing_dict.pop("currency", None)
+        calendar_days_details[date_button_date]["extra_attributes"] = pricing_dict
+        for next_day_index in range(0, num_nights):
+            future_day_date = date_button_date + timedelta(days=next_day_index)
+            if future_day_date not in calendar_days_details:
+                calendar_days_details[future_day_date] = copy.deepcopy(CALENDAR_DAYS_DETAILS_EMPTY_TEMPLATE)
+            calendar_days_details[future_day_date]["latest_prices_array"].append(
+                {
+                    "check_in": date_button_date,
+                    "check_out": date_button_date + timedelta(days=num_nights),
+                    "price": current_price,
+                }
+            )
+            for key in ("cleaning_fee", "currency"):
+                if calendar_days_details[future_day_date][key] is None:
+                    calendar_days_details[future_day_date][key] = calendar_days_details[date_button_date][key]
+
+
+def generate_airbnb_calendar_day_list(calendar_days_details, room_id, price_checked_at):
+    calendar_days_details_models = []
+    for day, date_details in calendar_days_details.items():
+        if date_details["latest_prices_array"]:
+            date_details["extra_attributes"] = {
+                **date_details["extra_attributes"],
+                LEGACY_PRICE_CHECKED_AT_KEY: price_checked_at.isoformat(timespec="seconds"),
+            }
+        calendar_days_details_models.append(
+            AirBnbRoomCalendarDay(
+                room_id=room_id,
+                calendar_day=day,
+                state=date_details["current_date_state"],
+                minimum_stay_nights=date_details["minimum_stay_nights"],
+                price=calculate_mean([i["price"] for i in date_details["latest_prices_array"]]),
+                latest_prices_array=[
+                    {
+                        **i,
+                        "check_in": i["check_in"].strftime("%Y-%m-%d"),
+                        "check_out": i["check_out"].strftime("%Y-%m-%d"),
+                    }
+                    for i in date_details["latest_prices_array"]
+                ],
+                cleaning_fee=date_details["cleaning_fee"],
+                currency=date_details["currency"],
+                extra_attributes=date_details["extra_attributes"],
+            )
+        )
+    return calendar_days_details_models
+
+
+def make_random_scraped_days(rng):
+    """(day, state, minimum nights, pricing dict or None) of one room, in date order"""
+    first_day = date(2024, 8, 1) + timedelta(days=rng.randint(0, 30))
+    scraped_days = []
+    for day_index in range(rng.randint(1, 120)):
+        state = rng.choice(list(CalendarDayState) + [None])
+        if state == CalendarDayState.AVAILABLE:
+            num_nights = rng.choice([1, 2, 3, 5])
+        else:
+            num_nights = rng.choice([None, 1, 2, 3, 5])
+        pricing_dict = None if rng.random() < 0.5 else {}
+        if state == CalendarDayState.AVAILABLE and rng.random() < 0.6:
+            pricing_dict = {
+                "price": rng.choice([None, float("nan"), 100.0, 55.5]),
+                "currency": rng.choice(["EUR", None]),
+                "weekly_discount": 3.0,
+            }
+            if rng.random() < 0.7:
+                pricing_dict["cleaning_fee"] = rng.choice([10.0, 20.0])
+        scraped_days.append((first_day + timedelta(days=day_index), state, num_nights, pricing_dict))
+    return scraped_days
+
+
+def build_legacy_rows(room_id, scraped_days, price_checked_at):
+    calendar_days_details = {}
+    for day, state, num_nights, pricing_dict in scraped_days:
+        calendar_days_details.setdefault(day, copy.deepcopy(CALENDAR_DAYS_DETAILS_EMPTY_TEMPLATE))
+        calendar_days_details[day]["current_date_state"] = state
+        calendar_days_details[day]["minimum_stay_nights"] = num_nights
+        if pricing_dict is not None:
+            enrich_calendar_days_details_if_data_is_available(
+                state, dict(pricing_dict), calendar_days_details, day, num_nights
+            )
+    return sorted(
+        (
+            model_to_row(i, CALENDAR_DAY_COLUMNS)
+            for i in generate_airbnb_calendar_day_list(calendar_days_details, room_id, price_checked_at)
+        ),
+        key=lambda row: row["calendar_day"],
+    )
+
+
+def build_room_calendar_rows(room_id, scraped_days, price_checked_at):
+    room_calendar = RoomCalendar(room_id)
+    for day, state, num_nights, pricing_dict in scraped_days:
+        room_calendar.set_day(day, state, num_nights)
+        if pricing_dict is not None and state == CalendarDayState.AVAILABLE:
+            room_calendar.add_stay_pricing(day, num_nights, dict(pricing_dict))
+    return [i._asdict() for i in expand_room_calendars([room_calendar.finish(price_checked_at)])]
+
+
+def find_differences(legacy_rows, rows):
+    """list of (calendar day, column, legacy value, value). price_checked_at moved from the extra attributes to its column"""
+    if len(legacy_rows) != len(rows):
+        return [(None, "number of rows", len(legacy_rows), len(rows))]
+    differences = []
+    for legacy_row, row in zip(legacy_rows, rows):
+        legacy_row = dict(legacy_row, extra_attributes=dict(legacy_row["extra_attributes"]))
+        legacy_price_checked_at = legacy_row["extra_attributes"].pop(LEGACY_PRICE_CHECKED_AT_KEY, None)
+        price_checked_at = row["price_checked_at"] and row["price_checked_at"].isoformat(timespec="seconds")
+        if legacy_price_checked_at != price_checked_at:
+            differences.append((row["calendar_day"], "price_checked_at", legacy_price_checked_at, price_checked_at))
+        for column in CALENDAR_DAY_COLUMNS:
+            legacy_value, value = legacy_row[column], row[column]
+            if column == "price" and legacy_value is not None and value is not None:
+                is_same = math.isclose(legacy_value, value)
+            else:
+                is_same = legacy_value == value
+            if not is_same:
+                differences.append((row["calendar_day"], column, legacy_value, value))
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--calendars", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    price_checked_at = datetime(2024, 8, 1, 12, 30)
+    num_rows = 0
+    num_calendars_differing = 0
+    for calendar_index in range(args.calendars):
+        room_id = str(calendar_index)
+        scraped_days = make_random_scraped_days(rng)
+        legacy_rows = build_legacy_rows(room_id, scraped_days, price_checked_at)
+        rows = build_room_calendar_rows(room_id, scraped_days, price_checked_at)
+        differences = find_differences(legacy_rows, rows)
+        num_rows += len(rows)
+        if differences:
+            num_calendars_differing += 1
+            print(f"calendar {calendar_index}: {len(differences)} differences, first: {differences[0]}")
+    print(
+        f"{args.calendars} randomized calendars ({num_rows} rows): "
+        f"{args.calendars - num_calendars_differing} match the dict based rows, {num_calendars_differing} differ"
+    )
+    if num_calendars_differing:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+KEY_COLUMNS = ["room_id", "calendar_day"]
+# columns which are kept from the stored row when the new value is missing (None, 0, "" or empty list)
+KEEP_STORED_IF_MISSING_COLUMNS = [
+    "price",
+    "currency",
+    "cleaning_fee",
+    "minimum_stay_nights",
+    "latest_prices_array",
+]
+JSON_COLUMNS = ["latest_prices_array", "extra_attributes"]
+
+
+def _is_missing(values):
+    """vectorized `not value` of python objects (None, nan, 0, "", [] and {} are missing)"""
+    return values.isna() | ~values.map(bool, na_action="ignore").eq(True)
+
+
+def _null_aware_not_equal(new_values, old_values):
+    """vectorized `new != old` where two nulls are equal"""
+    both_null = new_values.isna() & old_values.isna()
+    return ~(both_null | (new_values == old_values))
+
+
+def _to_json_strings(values):
+    """canonical json of the values. empty ones are null: extra attributes {} are the same as none"""
+    return values.map(
+        lambda value: json.dumps(value, sort_keys=True, default=str) if value else None,
+        na_action="ignore",
+    )
+
+
+def to_calendar_frame(rows, columns):
+    """DataFrame (object dtype, values untouched) of calendar day rows (dicts or sqlalchemy Rows)"""
+    return pd.DataFrame(
+        [[row[column] for column in columns] for row in rows],
+        columns=columns,
+        dtype=object,
+    )
+
+
+def diff_calendar_days(
+    new_rows, stored_rows, columns, price_change_tolerance_pct=0.1, touch_columns=()
+):
+    """
+    Columnar version of apply_calendar_day_changes for whole calendars (one or many rooms).
+
+    The new days are joined to their stored snapshot and every change is computed for all days at once:
+    state, minimum nights, price over the tolerance, cleaning fee and currency changes give the transition type,
+    missing new values are taken from the stored day. Days which would be written back unchanged are dropped.
+    Every day written gets a transition, VALUE_ONLY_CHANGE when only values below those rules changed
+    (e.g. a price within the tolerance, a new prices array), so the transitions rebuild the stored days.
+
+    :param new_rows: dicts with the calendar days of this run (the last one wins if a day is present more than once)
+    :param stored_rows: stored rows of the same days (dicts or sqlalchemy Rows)
+    :param columns: calendar day columns of new_rows to compare and write
+    :param touch_columns: columns written with the day which do not make it changed (e.g. price_checked_at).
+        a missing new value keeps the stored one
+    :return: (calendar day rows to write, transition rows, touched rows) as lists of dicts. transition rows (one per
+        day written) have a transition_type and the changed_fields: the value columns which differ from the stored day
+        (all of them for a new day). touched rows are the key and touch_columns of the stored days which only differ in touch_columns
+    """
+    if not new_rows:
+        return [], [], []
+    touch_columns = list(touch_columns)
+    new_days = to_calendar_frame(new_rows, columns + touch_columns).drop_duplicates(
+        KEY_COLUMNS, keep="last"
+    )
+    stored_days = to_calendar_frame(stored_rows, columns + touch_columns)
+    stored_days["is_stored"] = True
+    days = new_days.merge(
+        stored_days, on=KEY_COLUMNS, how="left", suffixes=("", "_old")
+    )
+    is_stored = days["is_stored"].notna().to_numpy()
+
+    new_price = pd.to_numeric(days["price"], errors="coerce")
+    old_price = pd.to_numeric(days["price_old"], errors="coerce")
+    state_change = _null_aware_not_equal(days["state"], days["state_old"])
+    min_nights_change = _null_aware_not_equal(
+        days["minimum_stay_nights"], days["minimum_stay_nights_old"]
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        relative_price_change = ((old_price - new_price).abs() / old_price).fillna(
+            np.inf
+        )
+    price_change = np.where(
+        _is_missing(days["price"]),
+        False,  # price not available in new run. previous one will be kept
+        _is_missing(days["price_old"])
+        | (relative_price_change >= price_change_tolerance_pct),
+    )
+    cleaning_fee_change = _null_aware_not_equal(
+        days["cleaning_fee"], days["cleaning_fee_old"]
+    )
+    currency_change = _null_aware_not_equal(days["currency"], days["currency_old"])
+    any_change = (
+        state_change.to_numpy()
+        | min_nights_change.to_numpy()
+        | price_change
+        | cleaning_fee_change.to_numpy()
+        | currency_change.to_numpy()
+    )
+    transition_type = np.select(
+        [~is_stored, any_change & state_change.to_numpy(), any_change],
+        [
+            "NEW_DATE_RECORDED",
+            days["state_old"].astype(str) + " - " + days["state"].astype(str),
+            "ATTRIBUTES_ONLY_CHANGE",
+        ],
+        default="VALUE_ONLY_CHANGE",
+    )
+
+    # values to store: missing new values are kept from the stored day, extra attributes are merged
+    stored_mask = pd.Series(is_stored, index=days.index)
+    for column in KEEP_STORED_IF_MISSING_COLUMNS:
+        keep_stored = _is_missing(days[column]) & stored_mask
+        days[column] = days[column].where(~keep_stored, days[column + "_old"])
+    days["extra_attributes"] = [
+        {**(old or {}), **(new or {})} if stored else new
+        for old, new, stored in zip(
+            days["extra_attributes_old"], days["extra_attributes"], is_stored
+        )
+    ]
+
+    value_columns = [i for i in columns if i not in KEY_COLUMNS]
+    is_changed = ~is_stored
+    column_changes = {}
+    for column in value_columns:
+        if column in JSON_COLUMNS:
+            column_change = _null_aware_not_equal(
+                _to_json_strings(days[column]), _to_json_strings(days[column + "_old"])
+            )
+        else:
+            column_change = _null_aware_not_equal(days[column], days[column + "_old"])
+        column_changes[column] = column_change.to_numpy() | ~is_stored
+        is_changed |= column_changes[column]
+    is_touched = np.zeros(len(days), dtype=bool)
+    for column in touch_columns:
+        is_new_value = days[column].notna() & _null_aware_not_equal(
+            days[column], days[column + "_old"]
+        )
+        is_touched |= is_new_value.to_numpy() & is_stored & ~is_changed
+        days[column] = days[column].where(days[column].notna(), days[column + "_old"])
+
+    days = days[columns + touch_columns].astype(object)
+    days = days.where(days.notna(), None)
+    calendar_day_rows = days[is_changed].to_dict("records")
+    touched_rows = days[is_touched][KEY_COLUMNS + touch_columns].to_dict("records")
+    days = days[columns]
+    # the transition rules compare the raw new values: a day can get one while nothing is written (e.g. a missing
+    # cleaning fee, kept from the stored day). only the days written are recorded
+    transition_rows = days[is_changed].to_dict("records")
+    for transition_row, row_transition_type, row_index in zip(
+        transition_rows, transition_type[is_changed], np.flatnonzero(is_changed)
+    ):
+        transition_row["transition_type"] = str(row_transition_type)
+        transition_row["changed_fields"] = [
+            column for column in value_columns if column_changes[column][row_index]
+        ]
+    return calendar_day_rows, transition_rows, touched_rows
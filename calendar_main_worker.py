@@ -1,79 +1,195 @@
 from selenium_airbnb_calendar_scraper import (
     get_calendar_days_for_provided_room,
 )
-import threading
-from datetime import datetime
+from driver_pool import DriverPool, run_with_pooled_driver
+from task_scheduler import run_bounded
+from datetime import datetime, date
 import logging
-import sqlalchemy
-from models import Base, db_url, save_or_update_airbnb_date
 from sqlalchemy.orm import Session
-import queue
+from models import (
+    Base,
+    bulk_save_or_update_airbnb_dates,
+    fetch_room_calendar_days,
+)
+from market_aggregates import update_market_aggregates
+from migrations import migrate_transition_log, migrate_scraper_runs, migrate_calendar_days
+from db_engine import create_db_engine
+from persistence_writer import PersistenceWriter
+from room_calendar import expand_room_calendars, get_number_of_rows
+from rate_limiter import rate_limiter
+from dom_waits import wait_stats
+from job_queue import (
+    JobQueueConsumer,
+    enqueue_jobs,
+    split_job_finishes,
+    save_job_finishes,
+    release_flushed_jobs,
+)
+from scraper_runs import (
+    parse_campaign_args,
+    start_campaign,
+    get_campaign_counts,
+    make_scraper_run,
+    split_scraper_runs,
+    save_scraper_runs,
+)
+from postgres_bulk_load import (
+    is_copy_backend_enabled,
+    copy_save_or_update_airbnb_dates,
+)
 
+args = parse_campaign_args("Scrape the calendars of the rooms")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("main_logger")
 
-result_queue = queue.Queue()
-
 # db loading and creating all tables
-engine = sqlalchemy.create_engine(
-    db_url, echo=False
-)  # We have also specified a parameter create_engine.echo, which will instruct the Engine to log all of the SQL it emits to a Python logger that will write to standard out.
+engine = create_db_engine()
+# all the writes go through the persistence writer thread and its own connection (see create_db_engine)
+writer_engine = create_db_engine(writer=True)
 Base.metadata.create_all(engine)
+migrate_transition_log(engine)  # indexes of the transition log and legacy transitions of older databases
+migrate_scraper_runs(engine)
+migrate_calendar_days(engine)  # price_checked_at column of databases created before it
+USE_COPY_BACKEND = is_copy_backend_enabled(engine)  # postgres: COPY to staging tables and set based merge
+
+
+def write_batch(objects_to_write, session):
+    scraper_runs, objects_to_write = split_scraper_runs(objects_to_write)
+    job_finishes, objects_to_write = split_job_finishes(objects_to_write)
+    objects_to_write = expand_room_calendars(objects_to_write)
+    if USE_COPY_BACKEND:
+        written_rows, stored_rows_by_key = copy_save_or_update_airbnb_dates(
+            objects_to_write, session
+        )
+    else:
+        written_rows, stored_rows_by_key = bulk_save_or_update_airbnb_dates(
+            objects_to_write, session
+        )
+    update_market_aggregates(session, written_rows, stored_rows_by_key)
+    save_scraper_runs(scraper_runs, session)
+    save_job_finishes(job_finishes, session)
 
-session = Session(engine)
 
-rooms_ids_to_scrape = [14132224]  # 34281543,818914306204706609,
-logger.info(f"number of calendars to scrape: {len(rooms_ids_to_scrape)}")
+# the scrapers put one RoomCalendar per room: batches are sized in calendar days
+persistence_writer = PersistenceWriter(
+    writer_engine,
+    write_function=write_batch,
+    object_size_function=get_number_of_rows,
+    after_flush_function=release_flushed_jobs,
+)
+# objects put in the queue by the scrapers are written while scraping is still running
+result_queue = persistence_writer.queue
+
+SCRAPER_NAME = "calendar"
+# the rooms of the campaign are saved when it starts and recorded in airbnb_scrapers_runs as they complete.
+# --resume scrapes the saved rooms which did not succeed
+campaign_id, rooms_ids_to_scrape = start_campaign(
+    engine,
+    SCRAPER_NAME,
+    lambda: [14132224],  # 34281543,818914306204706609,
+    args.resume,
+    args.campaign_id,
+)
+logger.info(
+    f"campaign {campaign_id}. number of calendars to scrape: {len(rooms_ids_to_scrape)}"
+)
+
+HEADLESS = False
+MAX_CONCURRENT_WORKERS = 5
+INCREMENTAL = True  # only price again the days whose state changed or whose stored price is older than the ttl
+USE_JOB_QUEUE = False  # share the rooms with the other calendar worker processes through the airbnb_scrape_jobs table
 
-MAX_BATCH_SIZE = 5
-rooms_to_scrape_batches = [
-    rooms_ids_to_scrape[i : i + MAX_BATCH_SIZE]
-    for i in range(0, len(rooms_ids_to_scrape), MAX_BATCH_SIZE)
-]
 
+def load_stored_calendar_days(rooms_id_to_scrape):
+    if not INCREMENTAL:
+        return None
+    with Session(engine) as session:
+        return fetch_room_calendar_days(
+            session, rooms_id_to_scrape, from_day=date.today()
+        )
 
-def run_threads():
-    threads = []
-    all_drivers = []
-    for rooms_to_scrape_batch in rooms_to_scrape_batches:
-        for rooms_id_to_scrape in rooms_to_scrape_batch:
-            t = threading.Thread(
-                target=get_calendar_days_for_provided_room,
-                kwargs={
-                    "room_id": rooms_id_to_scrape,
-                    "result_queue": result_queue,
-                    "headless": False,
-                },
-            )
-            t.start()
-            threads.append(t)
 
-        drivers = [t.join() for t in threads]
-        all_drivers += drivers
+def scrape_one(driver_pool, rooms_id_to_scrape):
+    return run_with_pooled_driver(
+        driver_pool,
+        get_calendar_days_for_provided_room,
+        room_id=rooms_id_to_scrape,
+        result_queue=result_queue,
+        stored_calendar_days=load_stored_calendar_days(rooms_id_to_scrape),
+    )
 
-    all_objects_to_write = []
-    while not result_queue.empty():
-        record_to_insert = result_queue.get()
-        all_objects_to_write.append(record_to_insert)
-    return all_objects_to_write
+
+def log_outcome(outcome):
+    if outcome.is_success:
+        logger.info(
+            "[%s] done in %.1f sec. rate: %.2f requests/sec",
+            outcome.item,
+            outcome.duration_sec,
+            rate_limiter.current_rate,
+        )
+    else:
+        logger.error(
+            "[%s] failed after %.1f sec: %s",
+            outcome.item,
+            outcome.duration_sec,
+            outcome.error,
+        )
+
+
+def record_outcome(outcome):
+    log_outcome(outcome)
+    result_queue.put(make_scraper_run(SCRAPER_NAME, campaign_id, outcome))
+
+
+def run_threads(driver_pool):
+    if not USE_JOB_QUEUE:
+        return run_bounded(
+            rooms_ids_to_scrape,
+            task_function=lambda rooms_id_to_scrape: scrape_one(
+                driver_pool, rooms_id_to_scrape
+            ),
+            max_workers=MAX_CONCURRENT_WORKERS,
+            on_outcome=record_outcome,
+        )
+    # the rooms not in the queue yet are added, then every process claims them one lease at a time
+    with Session(engine) as session, session.begin():
+        enqueue_jobs(session, SCRAPER_NAME, rooms_ids_to_scrape)
+    # jobs are finished by the persistence writer, in the batch of their objects
+    with JobQueueConsumer(
+        engine, SCRAPER_NAME, result_queue=result_queue
+    ) as job_queue_consumer:
+
+        def on_outcome(outcome):
+            record_outcome(outcome)
+            job_queue_consumer.on_outcome(outcome)
+
+        return run_bounded(
+            job_queue_consumer,
+            task_function=lambda rooms_id_to_scrape: scrape_one(
+                driver_pool, rooms_id_to_scrape
+            ),
+            max_workers=MAX_CONCURRENT_WORKERS,
+            on_outcome=on_outcome,
+        )
 
 
 t0 = datetime.now()
 logger.info("start to run threads")
-all_objects_to_write = run_threads()
-t1 = datetime.now()
+with persistence_writer:
+    with DriverPool(size=MAX_CONCURRENT_WORKERS, headless=HEADLESS) as driver_pool:
+        outcomes = run_threads(driver_pool)
+    t1 = datetime.now()
+    logger.info(
+        f"threads run over. time it took: {t1-t0}. failed tasks: {len([i for i in outcomes if not i.is_success])}"
+    )
+    logger.info(f"rate limiter: {rate_limiter.get_stats()}")
+    wait_stats.log_summary()  # where the wall-clock time of the scrapers went
+    logger.info("waiting for the remaining objects to be written")
+t2 = datetime.now()
 logger.info(
-    f"threads run over. time it took: {t1-t0}. num objects: {len(all_objects_to_write)}"
+    f"end to write objects. time it took after threads were over: {t2-t1}. num objects: {persistence_writer.num_objects_written}. failed objects: {persistence_writer.num_objects_failed}"
 )
-
-logger.info("start to add new objects")
-for object_to_write in all_objects_to_write:
-    save_or_update_airbnb_date(session=session, new_instance=object_to_write)
-
-t2 = datetime.now()
-logger.info(f"end to add new objects. time it took: {t2-t1}")
-
-logger.info("start to commit")
-session.commit()
-t3 = datetime.now()
-logger.info(f"end to commit. time it took: {t3-t2}")
+with Session(engine) as session:
+    logger.info(
+        f"campaign {campaign_id}: {get_campaign_counts(session, SCRAPER_NAME, campaign_id)}. rerun with --resume --campaign-id {campaign_id} to retry the failed and missing items"
+    )
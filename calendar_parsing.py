@@ -0,0 +1,154 @@
+import re
+import logging
+from datetime import datetime
+from functools import lru_cache
+
+from models import CalendarDayState
+
+logger = logging.getLogger(__name__)
+
+ARIA_LABEL_CACHE_SIZE = 1024
+
+# the alternatives are tried in this order at the start of the reason (anchored lookaheads), so one regex call
+# gives the same priority as trying the patterns one by one. the named groups tell which state matched.
+_DAY_STATE_RE = re.compile(
+    r"""^(?:
+        (?=.*?(?P<unavailable>\bunavailable\b))
+        | (?=.*?(?P<available_min_nights>\bavailable\b.*?(?P<available_num_nights>\d+)\s*-?\s*night.*?\bminimum\b))
+        | (?=.*?(?P<available_select>\bavailable\b.*?\bselect\b.*?\bdate\b))
+        | (?=.*?(?P<available_no_checkout_date>\bavailable\b.*?\bno\b.*?\beligible\b.*?\bcheckout\b.*?(?P<no_checkout_num_nights>\d+)\s*-?\s*night\b))
+        | (?=.*?(?P<checkout_only>\bthis\s+day\s+is\s+only\s+available\s+for\s+checkout\b))
+        | (?=.*?(?P<past_date>\bpast\s+dates?\s+can[’']t\s+be\s+selected\b))
+    )""",
+    re.IGNORECASE | re.VERBOSE,
+)
+_DAY_STATE_GROUPS = {
+    "unavailable": (CalendarDayState.UNAVAILABLE, None),
+    "available_min_nights": (CalendarDayState.AVAILABLE, "available_num_nights"),
+    "available_select": (CalendarDayState.AVAILABLE, None),
+    "available_no_checkout_date": (
+        CalendarDayState.AVAILABLE_NO_CHECKOUT_DATE,
+        "no_checkout_num_nights",
+    ),
+    "checkout_only": (CalendarDayState.CHECKOUT_ONLY, None),
+    "past_date": (CalendarDayState.UNAVAILABLE_DUE_TO_PAST_DATE, None),
+}
+
+_CURRENCY_RE = re.compile(r"[\€\$\£\¥\₹\₩\₽\₺\₴\฿\₵\₦\₫\₪\₱\₲\₡\₣\₭\₮]")
+_AMOUNT_RE = re.compile(r"(\d+[\d,]*)")
+
+# (description, keywords which must all be in the lowercase line). checked in this order
+_PRICING_LINE_RULES = (
+    ("early_bird_discount", frozenset(("early", "bird", "discount"))),
+    ("last_minute_discount", frozenset(("last", "minute", "discount"))),
+    ("accommodation_nightly", frozenset(("accommodation",))),
+    ("airbnb_service_fee", frozenset(("airbnb", "service", "fee"))),
+    ("night_price", frozenset(("night",))),
+    ("weekly_discount", frozenset(("weekly", "discount"))),
+    ("monthly_discount", frozenset(("monthly", "discount"))),
+    ("cleaning_fee", frozenset(("cleaning",))),
+    ("taxes", frozenset(("taxes",))),
+)
+# every keyword of the rules in one alternation: the keywords of a line are found in a single scan
+_PRICING_KEYWORDS_RE = re.compile(
+    "|".join(
+        sorted(
+            {keyword for _, keywords in _PRICING_LINE_RULES for keyword in keywords},
+            key=len,
+            reverse=True,
+        )
+    )
+)
+
+
+def split_day_aria_label(date_button_aria_label):
+    """'1, Thursday, August 2024. Past dates can’t be selected. ' -> ('1, Thursday, August 2024', 'Past dates can’t be selected.')"""
+    date_string, _, reason = date_button_aria_label.partition(".")
+    return date_string, reason.strip()
+
+
+@lru_cache(maxsize=ARIA_LABEL_CACHE_SIZE)
+def parse_day_state_reason(reason):
+    """state and minimum number of nights of the reason part of a day aria-label. memoized: few reasons repeat for every day"""
+    match = _DAY_STATE_RE.match(reason)
+    if match:
+        for group_name, (current_date_state, num_nights_group) in _DAY_STATE_GROUPS.items():
+            if match.group(group_name) is not None:
+                num_nights = (
+                    int(match.group(num_nights_group)) if num_nights_group else 1
+                )
+                return current_date_state, num_nights
+    raise ValueError(f"Input string does not match any known patterns: {reason}")
+
+
+def parse_day_state(date_button_aria_label):
+    """(CalendarDayState, num_nights) of a day aria-label"""
+    try:
+        reason = split_day_aria_label(date_button_aria_label)[1]
+        return parse_day_state_reason(reason or date_button_aria_label)
+    except ValueError:
+        logger.error(
+            f"Input string does not match any known patterns: {date_button_aria_label}"
+        )
+        raise ValueError(
+            f"Input string does not match any known patterns: {date_button_aria_label}"
+        )
+
+
+@lru_cache(maxsize=64)
+def parse_month_header(month_header):
+    """'August 2024' -> date(2024, 8, 1)"""
+    return datetime.strptime(month_header, "%B %Y").date()
+
+
+def parse_day_date(date_string):
+    """'1, Thursday, August 2024' (optionally followed by ', Today') -> date(2024, 8, 1)"""
+    if "Today" in date_string:
+        date_string = date_string.rsplit(",", 1)[0]
+    return datetime.strptime(date_string, "%d, %A, %B %Y").date()
+
+
+def get_calendar_day(month_header, cell_index, date_button_aria_label):
+    """
+    Date of the cell_index-th day cell of a month table, derived from the month header without parsing the label.
+    Falls back to parsing the date of the aria-label if the header can not be used or does not agree with the label.
+    """
+    if month_header:
+        try:
+            calendar_day = parse_month_header(month_header).replace(day=cell_index + 1)
+            if date_button_aria_label.startswith(f"{calendar_day.day},"):
+                return calendar_day
+        except ValueError:
+            pass
+    return parse_day_date(split_day_aria_label(date_button_aria_label)[0])
+
+
+def parse_pricing_line(input_string, num_nights):
+    """one line of the pricing form -> {"description", "amount", "currency", "extra"}. description is "other" if nothing matched"""
+    line_keywords = set(_PRICING_KEYWORDS_RE.findall(input_string.lower()))
+    for description, keywords in _PRICING_LINE_RULES:
+        if keywords <= line_keywords:
+            amount_match = _AMOUNT_RE.search(input_string)
+            if not amount_match:
+                break  # every rule needs an amount
+            amount = int(amount_match.group(1).replace(",", ""))
+            currency_match = _CURRENCY_RE.search(input_string)
+            return {
+                "description": description,
+                "amount": (
+                    amount / num_nights
+                    if description == "accommodation_nightly"
+                    else amount
+                ),
+                "currency": currency_match.group(0) if currency_match else None,
+                "extra": "",
+            }
+    logger.warning(
+        "We did not find any matching pattern in the input string: %s", input_string
+    )
+    return {
+        "description": "other",
+        "amount": None,
+        "currency": None,
+        "extra": input_string.strip(),
+    }
@@ -0,0 +1,53 @@
+import logging
+
+import sqlalchemy
+from sqlalchemy import event
+
+from models import db_url
+from settings import sqlite_settings
+
+logger = logging.getLogger(__name__)
+
+
+def set_sqlite_pragmas(dbapi_connection, pragmas=sqlite_settings):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={pragmas['journal_mode']}")
+    cursor.execute(f"PRAGMA synchronous={pragmas['synchronous']}")
+    cursor.execute(f"PRAGMA cache_size=-{pragmas['cache_size_kib']}")  # negative: size in KiB, not in pages
+    cursor.execute(f"PRAGMA busy_timeout={pragmas['busy_timeout_ms']}")
+    cursor.execute(f"PRAGMA wal_autocheckpoint={pragmas['wal_autocheckpoint_pages']}")
+    cursor.close()
+
+
+def create_db_engine(url=db_url, writer=False, echo=False):
+    """
+    Engine of the scraper db. On sqlite every connection gets the sqlite_settings pragmas (WAL, synchronous=NORMAL,
+    cache size, busy timeout) with a connect event.
+
+    :param writer: engine of the PersistenceWriter. on sqlite it has a single connection, which starts its
+        transactions with BEGIN IMMEDIATE: the write lock is taken (or waited for, up to the busy timeout) before
+        the batch reads the stored rows, so a transaction never has to be upgraded to a write one after another
+        process committed (that fails at once with "database is locked", whatever the busy timeout)
+    """
+    if not url.startswith("sqlite"):
+        return sqlalchemy.create_engine(url, echo=echo)
+    engine = sqlalchemy.create_engine(
+        url,
+        echo=echo,
+        connect_args={"timeout": sqlite_settings["busy_timeout_ms"] / 1000},
+        **({"pool_size": 1, "max_overflow": 0} if writer else {}),
+    )
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        set_sqlite_pragmas(dbapi_connection)
+        if writer:
+            dbapi_connection.isolation_level = None  # pysqlite does not emit its own BEGIN. see on_begin
+
+    if writer:
+
+        @event.listens_for(engine, "begin")
+        def on_begin(connection):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return engine
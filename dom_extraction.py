@@ -0,0 +1,159 @@
+from typing import Any, NamedTuple
+
+# Every WebElement call (find_elements, get_attribute, .text) is one HTTP round trip to the driver.
+# The functions below read everything needed from a table / form with a single execute_script
+# and return plain data (plus the WebElements we still need to click).
+
+_IS_VISIBLE_JS = """
+function isVisible(element) {
+    if (!element) {
+        return false;
+    }
+    const rect = element.getBoundingClientRect();
+    if (rect.width === 0 || rect.height === 0) {
+        return false;
+    }
+    for (let node = element; node && node.nodeType === 1; node = node.parentElement) {
+        const style = window.getComputedStyle(node);
+        if (style.display === "none" || style.visibility === "hidden" || style.opacity === "0") {
+            return false;
+        }
+        if (node !== element && style.overflow !== "visible") {
+            const clip = node.getBoundingClientRect();
+            if (rect.right <= clip.left || rect.left >= clip.right || rect.bottom <= clip.top || rect.top >= clip.bottom) {
+                return false;
+            }
+        }
+    }
+    return true;
+}
+"""
+
+_TABLE_CELLS_JS = """
+function tableCells(table) {
+    const cells = [];
+    for (const cell of table.querySelectorAll("td")) {
+        const label = cell.getAttribute("aria-label");
+        if (label) {
+            cells.push([cell, label, cell.getAttribute("aria-disabled")]);
+        }
+    }
+    return cells;
+}
+"""
+
+CALENDAR_TABLES_JS = (
+    _IS_VISIBLE_JS
+    + _TABLE_CELLS_JS
+    + """
+const tables = [];
+for (const tableDiv of document.querySelectorAll(arguments[0])) {
+    const header = tableDiv.querySelector(arguments[1] + " h3");
+    const table = tableDiv.querySelector("table");
+    const monthHeader = isVisible(header) ? header.innerText.trim() : "";
+    tables.push([
+        monthHeader,
+        table,
+        table && monthHeader && arguments[2] ? tableCells(table) : [],
+    ]);
+}
+return tables;
+"""
+)
+
+TABLE_CELLS_JS = (
+    _TABLE_CELLS_JS
+    + """
+return tableCells(arguments[0]);
+"""
+)
+
+PRICING_LINES_JS = """
+const form = document.querySelector(arguments[0]);
+if (!form) {
+    return null;
+}
+return Array.from(form.querySelectorAll(arguments[1]), (line) => line.innerText.trim());
+"""
+
+PRESENT_SELECTORS_JS = """
+const present = [];
+for (const [name, selector] of Object.entries(arguments[0])) {
+    if (document.querySelector(selector)) {
+        present.push(name);
+    }
+}
+return present;
+"""
+
+CALENDAR_TABLE_DIV_SELECTOR = "._ytfarf"
+CALENDAR_MONTH_HEADER_SELECTOR = "._1qlawxx"
+PRICING_FORM_SELECTOR = "._1n7cvm7"
+PRICING_LINE_SELECTOR = "._14omvfj"
+
+
+class CalendarCell(NamedTuple):
+    """one day button of a calendar table"""
+
+    element: Any  # WebElement, only needed to click the day
+    aria_label: str
+    aria_disabled: str | None
+
+
+class CalendarTable(NamedTuple):
+    """one month of the calendar. month_header is empty when the month is not visible"""
+
+    month_header: str
+    element: Any
+    cells: list[CalendarCell]
+
+
+def _to_cells(raw_cells):
+    return [CalendarCell(*raw_cell) for raw_cell in raw_cells or []]
+
+
+def extract_calendar_tables(driver, with_cells=True):
+    """
+    Reads every month table of the calendar with one execute_script.
+
+    :param with_cells: also read the aria-label and aria-disabled of every day cell of the visible months
+    :return: list of CalendarTable, in page order
+    """
+    raw_tables = driver.execute_script(
+        CALENDAR_TABLES_JS,
+        CALENDAR_TABLE_DIV_SELECTOR,
+        CALENDAR_MONTH_HEADER_SELECTOR,
+        with_cells,
+    )
+    return [
+        CalendarTable(
+            month_header=month_header, element=element, cells=_to_cells(raw_cells)
+        )
+        for month_header, element, raw_cells in raw_tables
+    ]
+
+
+def extract_table_cells(driver, table):
+    """day cells (the ones with an aria-label) of one calendar table, read with one execute_script"""
+    return _to_cells(driver.execute_script(TABLE_CELLS_JS, table))
+
+
+def extract_pricing_lines(driver):
+    """text of every line of the pricing form, read with one execute_script. None if the form is not there"""
+    return driver.execute_script(
+        PRICING_LINES_JS, PRICING_FORM_SELECTOR, PRICING_LINE_SELECTOR
+    )
+
+
+def extract_present_selectors(driver, selectors):
+    """names of the selectors ({name: css selector}) matching an element of the page, checked with one execute_script"""
+    return set(driver.execute_script(PRESENT_SELECTORS_JS, selectors))
+
+
+def extract_visible_month_headers(driver):
+    """month headers of the visible calendar tables, without reading their cells"""
+    return [
+        i.month_header
+        for i in extract_calendar_tables(driver, with_cells=False)
+        if i.month_header
+    ]
@@ -0,0 +1,167 @@
+import time
+import threading
+import logging
+from contextlib import contextmanager
+
+from selenium.common.exceptions import TimeoutException
+from selenium.webdriver.support.ui import WebDriverWait
+
+from dom_extraction import extract_present_selectors, extract_visible_month_headers
+from settings import dom_waits_settings
+
+logger = logging.getLogger(__name__)
+
+_PAGE_READY = "__page_ready__"
+
+
+class WaitStats:
+    """
+    Wall-clock time spent in each named wait or page load, summed over all the scraper threads of the process.
+
+    :Example:
+        with wait_stats.timed("room_page_load"):
+            driver.get(url)
+        wait_stats.log_summary()
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}  # {name: [calls, total sec, max sec, timeouts]}
+
+    def add(self, name, elapsed_sec, is_timeout=False):
+        with self.lock:
+            stats = self.stats.setdefault(name, [0, 0.0, 0.0, 0])
+            stats[0] += 1
+            stats[1] += elapsed_sec
+            stats[2] = max(stats[2], elapsed_sec)
+            stats[3] += is_timeout
+
+    @contextmanager
+    def timed(self, name):
+        t0 = time.monotonic()
+        try:
+            yield
+        except TimeoutException:
+            self.add(name, time.monotonic() - t0, is_timeout=True)
+            raise
+        self.add(name, time.monotonic() - t0)
+
+    def get_summary(self):
+        """{name: {"calls", "total_sec", "mean_sec", "max_sec", "timeouts"}}, by total time spent"""
+        with self.lock:
+            items = sorted(self.stats.items(), key=lambda i: i[1][1], reverse=True)
+        return {
+            name: {
+                "calls": calls,
+                "total_sec": round(total_sec, 2),
+                "mean_sec": round(total_sec / calls, 3),
+                "max_sec": round(max_sec, 2),
+                "timeouts": timeouts,
+            }
+            for name, (calls, total_sec, max_sec, timeouts) in items
+        }
+
+    def log_summary(self):
+        for name, stats in self.get_summary().items():
+            logger.info("wait %s: %s", name, stats)
+
+
+# one per process: every scraper thread adds its waits to it
+wait_stats = WaitStats()
+
+
+def wait_until(
+    driver,
+    condition,
+    name,
+    timeout_sec=dom_waits_settings["timeout_sec"],
+    poll_sec=dom_waits_settings["poll_interval_sec"],
+):
+    """
+    WebDriverWait(driver, timeout_sec).until(condition), checking the condition every poll_sec instead of
+    selenium's 0.5 sec, timed in wait_stats under name. raises TimeoutException
+    """
+    with wait_stats.timed(name):
+        return WebDriverWait(driver, timeout_sec, poll_frequency=poll_sec).until(
+            condition
+        )
+
+
+def poll_selectors(
+    driver,
+    selectors,
+    is_done,
+    timeout_sec,
+    poll_sec=dom_waits_settings["poll_interval_sec"],
+):
+    """
+    Checks which of the selectors ({name: css selector}) are in the page, all of them in one execute_script per poll,
+    until is_done(names present, sec elapsed) or timeout_sec.
+
+    :return: names of the selectors present at the last poll
+    """
+    t0 = time.monotonic()
+    while True:
+        present = extract_present_selectors(driver, selectors)
+        elapsed_sec = time.monotonic() - t0
+        if is_done(present, elapsed_sec) or elapsed_sec >= timeout_sec:
+            return present
+        time.sleep(poll_sec)
+
+
+def wait_for_popups(
+    driver,
+    popup_selectors,
+    page_ready_selector,
+    name="popups",
+    timeout_sec=dom_waits_settings["popup_timeout_sec"],
+    grace_sec=dom_waits_settings["popup_grace_sec"],
+):
+    """
+    Detects whichever of the popups ({name: css selector}) shows up, polling them together.
+    Returns as soon as all of them are there or, when some are missing, grace_sec after the page is ready
+    (page_ready_selector present): a missing popup costs grace_sec instead of a full timeout each.
+
+    :return: names of the popups found
+    """
+    page_ready_at = None
+
+    def is_done(present, elapsed_sec):
+        nonlocal page_ready_at
+        if set(popup_selectors) <= present:
+            return True
+        if _PAGE_READY in present:
+            if page_ready_at is None:
+                page_ready_at = elapsed_sec
+            return elapsed_sec - page_ready_at >= grace_sec
+        return False
+
+    with wait_stats.timed(name):
+        present = poll_selectors(
+            driver,
+            {**popup_selectors, _PAGE_READY: page_ready_selector},
+            is_done,
+            timeout_sec,
+        )
+    return present & set(popup_selectors)
+
+
+def wait_for_calendar_months(
+    driver,
+    old_first_month=None,
+    min_visible_months=2,
+    name="calendar_months",
+    timeout_sec=dom_waits_settings["timeout_sec"],
+):
+    """
+    waits for min_visible_months months of the calendar to be visible, the first one other than old_first_month
+    (e.g. right after the next month click). returns their month headers
+    """
+
+    def are_months_visible(driver):
+        month_headers = extract_visible_month_headers(driver)
+        if len(month_headers) < min_visible_months or month_headers[0] == old_first_month:
+            return False
+        return month_headers
+
+    return wait_until(driver, are_months_visible, name, timeout_sec=timeout_sec)
@@ -0,0 +1,161 @@
+import queue
+import threading
+import logging
+from contextlib import contextmanager
+
+from my_webdriver import driver_setup
+from settings import driver_pool_settings
+
+logger = logging.getLogger(__name__)
+
+
+class DriverPool:
+    """
+    Fixed size pool of pre-warmed chrome webdrivers shared by the scraper threads.
+
+    Drivers are created once (when the pool is started), checked out by a task,
+    reset when they are returned and quit when the pool is shut down.
+    A driver which fails to reset is considered broken: it is quit and replaced with a fresh one.
+    If the replacement can not be created, the next checkout creates it, so the pool keeps its size.
+
+    :Example:
+        with DriverPool(size=5) as pool:
+            with pool.driver() as driver:
+                driver.get(url)
+    """
+
+    def __init__(
+        self,
+        size=driver_pool_settings["size"],
+        headless=None,
+        checkout_timeout_sec=driver_pool_settings["checkout_timeout_sec"],
+        reset_cookies=driver_pool_settings["reset_cookies"],
+        driver_factory=driver_setup,
+    ):
+        assert size > 0, f"pool size must be positive, got {size}"
+        self.size = size
+        self.headless = headless
+        self.checkout_timeout_sec = checkout_timeout_sec
+        self.reset_cookies = reset_cookies
+        self.driver_factory = driver_factory
+        self._idle_drivers = queue.Queue()
+        self._all_drivers = []
+        self._num_missing_drivers = 0  # replacements which failed to be created, retried by checkout
+        self._lock = threading.Lock()
+        self._is_started = False
+        self._is_shut_down = False
+
+    def _create_driver(self):
+        driver = self.driver_factory(headless=self.headless)
+        with self._lock:
+            self._all_drivers.append(driver)
+        return driver
+
+    def _try_create_driver(self):
+        """a new driver, or None if it could not be created (logged). the missing driver is created by a later checkout"""
+        try:
+            return self._create_driver()
+        except Exception as ex:
+            logger.warning(
+                "failed to create driver (%s). retrying on the next checkout",
+                type(ex).__name__,
+            )
+            with self._lock:
+                self._num_missing_drivers += 1
+            return None
+
+    def _discard_driver(self, driver):
+        with self._lock:
+            if driver in self._all_drivers:
+                self._all_drivers.remove(driver)
+        try:
+            driver.quit()
+        except Exception as ex:
+            logger.warning("failed to quit driver: %s", type(ex).__name__)
+
+    def start(self):
+        """pre-warms the pool by starting `size` drivers"""
+        if self._is_started:
+            return self
+        logger.info("starting driver pool with %s drivers", self.size)
+        for _ in range(self.size):
+            self._idle_drivers.put(self._create_driver())
+        self._is_started = True
+        return self
+
+    def checkout(self, timeout=None):
+        """blocks until a driver is free and returns it. must be given back with `release`"""
+        if self._is_shut_down:
+            raise RuntimeError("driver pool has been shut down")
+        if not self._is_started:
+            self.start()
+        with self._lock:
+            is_driver_missing = self._num_missing_drivers > 0
+            self._num_missing_drivers -= is_driver_missing
+        if is_driver_missing:
+            driver = self._try_create_driver()
+            if driver is not None:
+                return driver
+        timeout = self.checkout_timeout_sec if timeout is None else timeout
+        try:
+            return self._idle_drivers.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(
+                f"no driver was released in {timeout} seconds (pool size {self.size})"
+            )
+
+    def reset_driver(self, driver):
+        """brings a driver back to a blank state so that the next task does not see leftovers of the previous one"""
+        if self.reset_cookies:
+            driver.delete_all_cookies()
+        driver.get("about:blank")
+
+    def release(self, driver):
+        """
+        gives a driver back to the pool. if it can not be reset, it is replaced with a new one.
+        never raises: it runs when the task of the driver is done, whose result or exception must go through
+        """
+        if self._is_shut_down:
+            self._discard_driver(driver)
+            return
+        try:
+            self.reset_driver(driver)
+        except Exception as ex:
+            logger.warning(
+                "failed to reset driver (%s). replacing it with a new one",
+                type(ex).__name__,
+            )
+            self._discard_driver(driver)
+            driver = self._try_create_driver()
+            if driver is None:
+                return
+        self._idle_drivers.put(driver)
+
+    @contextmanager
+    def driver(self, timeout=None):
+        driver = self.checkout(timeout=timeout)
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def shutdown(self):
+        """quits every driver created by the pool, including the ones still checked out"""
+        self._is_shut_down = True
+        with self._lock:
+            all_drivers = list(self._all_drivers)
+        logger.info("shutting down driver pool. quitting %s drivers", len(all_drivers))
+        for driver in all_drivers:
+            self._discard_driver(driver)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+
+def run_with_pooled_driver(pool, target, **kwargs):
+    """runs `target(driver=..., **kwargs)` with a driver checked out from `pool`"""
+    with pool.driver() as driver:
+        return target(driver=driver, **kwargs)
@@ -0,0 +1,57 @@
+import html
+import re
+
+from bs4 import BeautifulSoup
+
+from settings import html_parsing_settings
+
+_META_TAG_RE = re.compile(
+    r"<meta\b[^>]*?\bitemprop\s*=\s*[\"']?url(?=[\"'\s/>])[^>]*>", re.IGNORECASE
+)
+_CONTENT_ATTRIBUTE_RE = re.compile(
+    r"\bcontent\s*=\s*(?:\"([^\"]*)\"|'([^']*)'|([^\s>]+))", re.IGNORECASE
+)
+
+
+def room_links_html_parser(page_source):
+    """reference implementation: full pure python BeautifulSoup tree"""
+    page_source_soup = BeautifulSoup(page_source, "html.parser")
+    return [i["content"] for i in page_source_soup.find_all("meta", itemprop="url")]
+
+
+def room_links_stream(page_source):
+    """
+    Targeted extractor: scans the raw html for `<meta itemprop="url" content="...">` tags only,
+    without building any tree. Regex matching runs in C, so other scraper threads are not blocked for long.
+    """
+    room_links = []
+    for meta_tag in _META_TAG_RE.finditer(page_source):
+        content_match = _CONTENT_ATTRIBUTE_RE.search(meta_tag.group(0))
+        if content_match:
+            content = next(i for i in content_match.groups() if i is not None)
+            room_links.append(html.unescape(content))
+    return room_links
+
+
+# the targeted extractor is faster than tree parsers, also compiled ones (see benchmarks/bench_html_parsing.py)
+ROOM_LINKS_BACKENDS = {
+    "stream": room_links_stream,
+    "html.parser": room_links_html_parser,
+}
+
+
+def resolve_backend(backend=None):
+    """Name of the backend to use. "auto" is the fastest one (stream)"""
+    backend = backend or html_parsing_settings["backend"]
+    if backend == "auto":
+        return next(iter(ROOM_LINKS_BACKENDS))
+    if backend not in ROOM_LINKS_BACKENDS:
+        raise ValueError(
+            f"unknown html parsing backend '{backend}'. available: {list(ROOM_LINKS_BACKENDS)}"
+        )
+    return backend
+
+
+def extract_room_links(page_source, backend=None):
+    """`content` of every `meta[itemprop=url]` of a search results page, in page order"""
+    return ROOM_LINKS_BACKENDS[resolve_backend(backend)](page_source)
@@ -0,0 +1,175 @@
+import re
+import json
+import threading
+import logging
+from urllib.parse import urlparse, urlencode, parse_qsl, urlunparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from settings import http_search_settings
+from html_parsing import extract_room_links
+from rate_limiter import rate_limiter
+from selenium_airbnb_active_venice_links_scraper import (
+    MAX_HOMES_PER_PAGE,
+    MAX_PAGES,
+    get_price_min_and_max_from_url,
+    get_number_of_pages_to_scrape,
+    put_rooms_from_links,
+)
+
+logger = logging.getLogger(__name__)
+
+_NUMBER_OF_ROOMS_RE = re.compile(r"(\d[\d,.]*)\+?\s+homes\b")
+_PAGE_CURSORS_RE = re.compile(r"\"pageCursors\"\s*:\s*(\[[^\]]*\])")
+
+
+class HttpSearchClient:
+    """
+    Browserless alternative to get_available_rooms_at_link: downloads the search pages produced by
+    generate_links_to_scrape with plain http requests and parses the served html.
+
+    Connections are kept alive and reused (one requests.Session per thread, each with a pooled adapter),
+    responses are compressed and failed requests are retried with backoff by urllib3.
+    `base_url` replaces scheme and host of the links, so the client can be pointed at a local stand-in server.
+
+    :Example:
+        with HttpSearchClient() as client:
+            client.get_available_rooms_at_link(link, result_queue)
+    """
+
+    def __init__(
+        self,
+        base_url=http_search_settings["base_url"],
+        pool_maxsize=http_search_settings["pool_maxsize"],
+        timeout_sec=http_search_settings["timeout_sec"],
+        max_retries=http_search_settings["max_retries"],
+        headers=http_search_settings["headers"],
+    ):
+        self.base_url = base_url
+        self.pool_maxsize = pool_maxsize
+        self.timeout_sec = timeout_sec
+        self.max_retries = max_retries
+        self.headers = headers
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=Retry(
+                total=self.max_retries,
+                backoff_factor=1,
+                status_forcelist=(429, 500, 502, 503, 504),
+            ),
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(self.headers)
+        with self._lock:
+            self._sessions.append(session)
+        return session
+
+    @property
+    def session(self):
+        """requests.Session of the calling thread"""
+        if not hasattr(self._local, "session"):
+            self._local.session = self._create_session()
+        return self._local.session
+
+    def to_request_url(self, link):
+        if not self.base_url:
+            return link
+        base_url = urlparse(self.base_url)
+        return urlunparse(
+            urlparse(link)._replace(scheme=base_url.scheme, netloc=base_url.netloc)
+        )
+
+    def get_page_source(self, link):
+        with rate_limiter.request():
+            response = self.session.get(self.to_request_url(link), timeout=self.timeout_sec)
+            response.raise_for_status()
+        return response.text
+
+    def get_number_of_rooms_at_link(self, link_to_get):
+        return get_number_of_rooms_from_page_source(self.get_page_source(link_to_get))
+
+    def get_available_rooms_at_link(self, link_to_get, result_queue):
+        """same contract as selenium_airbnb_active_venice_links_scraper.get_available_rooms_at_link"""
+        price_min, price_max = get_price_min_and_max_from_url(link_to_get)
+        page_source = self.get_page_source(link_to_get)
+        number_of_rooms_in_page = get_number_of_rooms_from_page_source(page_source)
+        logger.info(
+            f"[{price_min} - {price_max}] number of rooms: {number_of_rooms_in_page}"
+        )
+        if not number_of_rooms_in_page:
+            logger.info(
+                f"[{price_min} - {price_max}] No rooms with price between {price_min} and {price_max} in selected region."
+            )
+            return []
+        if number_of_rooms_in_page > (MAX_PAGES * MAX_HOMES_PER_PAGE):
+            logger.warning(
+                f"[{price_min} - {price_max}] there are {number_of_rooms_in_page} rooms at this price level. Airbnb shows {MAX_PAGES} pages max with {MAX_HOMES_PER_PAGE} homes per page. so you might be losing some information."
+            )
+        number_of_pages = get_number_of_pages_to_scrape(number_of_rooms_in_page)
+        page_cursors = get_page_cursors_from_page_source(page_source)
+
+        full_list_of_room_links = extract_room_links(page_source)
+        for i in range(1, number_of_pages):
+            page_link = get_page_link(link_to_get, i, page_cursors)
+            all_room_links_one_page = extract_room_links(self.get_page_source(page_link))
+            full_list_of_room_links += all_room_links_one_page
+            logger.info(
+                f"[{price_min} - {price_max}] num link in this page: {len(all_room_links_one_page)}. tot links this price range: {len(full_list_of_room_links)}. Iteration {i+1} out of {number_of_pages}"
+            )
+
+        put_rooms_from_links(full_list_of_room_links, result_queue)
+        return "ok"
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def get_number_of_rooms_from_page_source(page_source):
+    """number in the "XXX homes" heading of a search page. 0 when airbnb has no exact matches"""
+    if "No exact matches" in page_source:
+        return 0
+    num_rooms_match = _NUMBER_OF_ROOMS_RE.search(page_source)
+    if not num_rooms_match:
+        return None
+    return int(num_rooms_match.group(1).replace(",", "").replace(".", ""))
+
+
+def get_page_cursors_from_page_source(page_source):
+    """pagination cursors embedded in the page json (one per result page). empty list if not found"""
+    page_cursors_match = _PAGE_CURSORS_RE.search(page_source)
+    if not page_cursors_match:
+        return []
+    try:
+        return json.loads(page_cursors_match.group(1))
+    except json.JSONDecodeError:
+        return []
+
+
+def get_page_link(link, page_index, page_cursors):
+    """link of the result page `page_index` (0 based). uses the embedded cursors, or items_offset when they are missing"""
+    parsed_link = urlparse(link)
+    query = dict(parse_qsl(parsed_link.query))
+    if page_index < len(page_cursors):
+        query["cursor"] = page_cursors[page_index]
+    else:
+        query["items_offset"] = page_index * MAX_HOMES_PER_PAGE
+    return urlunparse(parsed_link._replace(query=urlencode(query)))
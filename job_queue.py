@@ -0,0 +1,414 @@
+import os
+import socket
+import logging
+import threading
+from typing import Any, NamedTuple
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, update, func, or_, and_, case
+
+from models import AirBnbScrapeJob, ScrapeJobState, get_dialect_insert
+from settings import job_queue_settings
+
+logger = logging.getLogger(__name__)
+
+JOBS_TABLE = AirBnbScrapeJob.__table__
+
+
+def get_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def utc_now():
+    """naive utc time. leases are compared across machines, whose clocks are expected to be in sync (ntp)"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def enqueue_jobs(session, scraper_name, job_keys, requeue_finished=False):
+    """
+    adds the jobs which are not in the queue yet. jobs already in it are left as they are, unless
+    requeue_finished: DONE and FAILED jobs are then set back to PENDING (new round of the same items)
+    """
+    rows = [
+        {"scraper_name": scraper_name, "job_key": str(i), "state": ScrapeJobState.PENDING, "attempts": 0}
+        for i in dict.fromkeys(job_keys)
+    ]
+    if not rows:
+        return
+    insert_statement = get_dialect_insert(session, JOBS_TABLE)
+    if requeue_finished:
+        insert_statement = insert_statement.on_conflict_do_update(
+            index_elements=["scraper_name", "job_key"],
+            set_={
+                "state": ScrapeJobState.PENDING,
+                "attempts": 0,
+                "last_error": None,
+                "updated_at": func.now(),
+            },
+            where=JOBS_TABLE.c.state.in_([ScrapeJobState.DONE, ScrapeJobState.FAILED]),
+        )
+    else:
+        insert_statement = insert_statement.on_conflict_do_nothing(
+            index_elements=["scraper_name", "job_key"]
+        )
+    session.execute(insert_statement, rows)
+
+
+def claimable_jobs_condition(scraper_name, now, max_attempts):
+    return and_(
+        JOBS_TABLE.c.scraper_name == scraper_name,
+        JOBS_TABLE.c.attempts < max_attempts,
+        or_(
+            JOBS_TABLE.c.state == ScrapeJobState.PENDING,
+            and_(
+                JOBS_TABLE.c.state == ScrapeJobState.LEASED,
+                JOBS_TABLE.c.lease_expires_at < now,
+            ),
+        ),
+    )
+
+
+def fail_exhausted_jobs(connection, scraper_name, now, max_attempts):
+    """
+    jobs whose lease expired after their last attempt (the worker holding them crashed) are marked FAILED:
+    they are not claimable anymore, and would otherwise stay LEASED forever. returns the number of jobs failed
+    """
+    return connection.execute(
+        update(JOBS_TABLE)
+        .where(
+            JOBS_TABLE.c.scraper_name == scraper_name,
+            JOBS_TABLE.c.state == ScrapeJobState.LEASED,
+            JOBS_TABLE.c.lease_expires_at < now,
+            JOBS_TABLE.c.attempts >= max_attempts,
+        )
+        .values(
+            state=ScrapeJobState.FAILED,
+            lease_owner=None,
+            lease_expires_at=None,
+            last_error=func.coalesce(JOBS_TABLE.c.last_error, "lease expired on the last attempt"),
+            updated_at=func.now(),
+        )
+    ).rowcount
+
+
+def claim_jobs(
+    engine,
+    scraper_name,
+    worker_id,
+    limit=job_queue_settings["claim_batch_size"],
+    lease_sec=job_queue_settings["lease_sec"],
+    max_attempts=job_queue_settings["max_attempts"],
+):
+    """
+    Atomically leases up to limit claimable jobs (pending, or leased with an expired lease) to worker_id.
+    One UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP LOCKED) RETURNING: on postgres concurrent workers skip the
+    rows being claimed by the others, on sqlite the statement runs under the database write lock.
+    Expired leases which cannot be attempted again are marked FAILED first (fail_exhausted_jobs).
+
+    :return: list of (job id, job key)
+    """
+    now = utc_now()
+    claimable_ids = (
+        select(JOBS_TABLE.c.id)
+        .where(claimable_jobs_condition(scraper_name, now, max_attempts))
+        .order_by(JOBS_TABLE.c.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    with engine.begin() as connection:
+        num_failed = fail_exhausted_jobs(connection, scraper_name, now, max_attempts)
+        if num_failed:
+            logger.warning(
+                "%s %s jobs failed: lease expired on their last attempt", num_failed, scraper_name
+            )
+        claimed_rows = connection.execute(
+            update(JOBS_TABLE)
+            .where(
+                JOBS_TABLE.c.id.in_(claimable_ids.scalar_subquery()),
+                claimable_jobs_condition(scraper_name, now, max_attempts),
+            )
+            .values(
+                state=ScrapeJobState.LEASED,
+                lease_owner=worker_id,
+                lease_expires_at=now + timedelta(seconds=lease_sec),
+                heartbeat_at=now,
+                attempts=JOBS_TABLE.c.attempts + 1,
+                updated_at=func.now(),
+            )
+            .returning(JOBS_TABLE.c.id, JOBS_TABLE.c.job_key)
+        ).all()
+    return [(row.id, row.job_key) for row in claimed_rows]
+
+
+def extend_leases(engine, job_ids, worker_id, lease_sec=job_queue_settings["lease_sec"]):
+    """heartbeat: extends the leases of the jobs still held by worker_id. returns the number of leases extended"""
+    if not job_ids:
+        return 0
+    now = utc_now()
+    with engine.begin() as connection:
+        return connection.execute(
+            update(JOBS_TABLE)
+            .where(
+                JOBS_TABLE.c.id.in_(job_ids),
+                JOBS_TABLE.c.lease_owner == worker_id,
+                JOBS_TABLE.c.state == ScrapeJobState.LEASED,
+            )
+            .values(heartbeat_at=now, lease_expires_at=now + timedelta(seconds=lease_sec))
+        ).rowcount
+
+
+def finish_job_statement(job_id, worker_id, is_success, error, max_attempts):
+    """UPDATE marking a leased job DONE, or after a failure PENDING again (FAILED once it was attempted max_attempts times)"""
+    failed_state = case(
+        (JOBS_TABLE.c.attempts >= max_attempts, ScrapeJobState.FAILED),
+        else_=ScrapeJobState.PENDING,
+    )
+    return (
+        update(JOBS_TABLE)
+        .where(
+            JOBS_TABLE.c.id == job_id,
+            JOBS_TABLE.c.lease_owner == worker_id,
+            JOBS_TABLE.c.state == ScrapeJobState.LEASED,
+        )
+        .values(
+            state=ScrapeJobState.DONE if is_success else failed_state,
+            lease_owner=None,
+            lease_expires_at=None,
+            last_error=error,
+            updated_at=func.now(),
+        )
+    )
+
+
+def _log_lease_lost(job_id, worker_id):
+    logger.warning("[job %s] lease lost before the job was finished by %s", job_id, worker_id)
+
+
+def finish_job(
+    engine,
+    job_id,
+    worker_id,
+    is_success,
+    error=None,
+    max_attempts=job_queue_settings["max_attempts"],
+):
+    """
+    finishes a leased job in its own transaction (see finish_job_statement).
+    nothing is changed if worker_id lost the lease in the meantime. returns True if the job was updated
+    """
+    with engine.begin() as connection:
+        updated_rows = connection.execute(
+            finish_job_statement(job_id, worker_id, is_success, error, max_attempts)
+        ).rowcount
+    if not updated_rows:
+        _log_lease_lost(job_id, worker_id)
+    return bool(updated_rows)
+
+
+class JobFinish(NamedTuple):
+    """
+    persistence writer marker of a job whose task is over. it is put in the queue after the objects of the job,
+    so the job is finished in the same batch as them or after (save_job_finishes): it is not DONE before its
+    objects are written
+    """
+
+    consumer: Any  # JobQueueConsumer which claimed the job
+    job_key: str
+    job_id: int
+    is_success: bool
+    error: str | None = None
+
+
+def split_job_finishes(objects):
+    """(job finishes, other objects) of a persistence writer batch"""
+    job_finishes = [i for i in objects if isinstance(i, JobFinish)]
+    other_objects = [i for i in objects if not isinstance(i, JobFinish)]
+    return job_finishes, other_objects
+
+
+def save_job_finishes(job_finishes, session):
+    """finishes the jobs in the transaction of the persistence writer batch"""
+    for job_finish in job_finishes:
+        consumer = job_finish.consumer
+        updated_rows = session.execute(
+            finish_job_statement(
+                job_finish.job_id,
+                consumer.worker_id,
+                job_finish.is_success,
+                job_finish.error,
+                consumer.max_attempts,
+            )
+        ).rowcount
+        if not updated_rows:
+            _log_lease_lost(job_finish.job_id, consumer.worker_id)
+
+
+def release_flushed_jobs(objects, is_committed):
+    """
+    PersistenceWriter after_flush_function: the jobs finished by the batch are not in progress anymore.
+    if the batch was rolled back their objects were not written, so they are put back in the queue as failed
+    """
+    for job_finish in split_job_finishes(objects)[0]:
+        job_finish.consumer.release_job(job_finish, is_committed)
+
+
+def get_queue_counts(session, scraper_name):
+    """{state: number of jobs} of a scraper queue"""
+    return dict(
+        session.execute(
+            select(JOBS_TABLE.c.state, func.count())
+            .where(JOBS_TABLE.c.scraper_name == scraper_name)
+            .group_by(JOBS_TABLE.c.state)
+        ).all()
+    )
+
+
+def count_leased_by_others(engine, scraper_name, worker_id):
+    """jobs of the other workers whose lease is still valid (the expired ones are claimed or failed by claim_jobs)"""
+    with engine.connect() as connection:
+        return connection.execute(
+            select(func.count()).where(
+                JOBS_TABLE.c.scraper_name == scraper_name,
+                JOBS_TABLE.c.state == ScrapeJobState.LEASED,
+                JOBS_TABLE.c.lease_owner != worker_id,
+                JOBS_TABLE.c.lease_expires_at >= utc_now(),
+            )
+        ).scalar()
+
+
+class JobQueueConsumer:
+    """
+    Iterable of the job keys claimed from the airbnb_scrape_jobs queue of a scraper, to be passed to run_bounded
+    together with on_outcome, which marks each job done or failed. With a result_queue (the persistence writer
+    queue of the objects of the jobs) the job is finished by the writer, with its objects (JobFinish).
+    While the consumer is open a heartbeat thread extends the leases of the jobs claimed and not finished yet.
+    The iteration ends when no job is claimable and none of the jobs claimed is in progress (a failed one is put
+    back in the queue and claimed again). with wait_for_leased, it also waits for the jobs leased by other workers
+    to be finished (or for their lease to expire, then claims them).
+
+    :Example:
+        with JobQueueConsumer(engine, "calendar", result_queue=persistence_writer.queue) as job_queue_consumer:
+            run_bounded(job_queue_consumer, task_function=scrape_one, max_workers=5, on_outcome=job_queue_consumer.on_outcome)
+    """
+
+    def __init__(
+        self,
+        engine,
+        scraper_name,
+        worker_id=None,
+        lease_sec=job_queue_settings["lease_sec"],
+        heartbeat_interval_sec=job_queue_settings["heartbeat_interval_sec"],
+        max_attempts=job_queue_settings["max_attempts"],
+        claim_batch_size=job_queue_settings["claim_batch_size"],
+        poll_interval_sec=job_queue_settings["poll_interval_sec"],
+        wait_for_leased=True,
+        result_queue=None,
+    ):
+        self.engine = engine
+        self.scraper_name = scraper_name
+        self.worker_id = worker_id or get_worker_id()
+        self.lease_sec = lease_sec
+        self.heartbeat_interval_sec = heartbeat_interval_sec
+        self.max_attempts = max_attempts
+        self.claim_batch_size = claim_batch_size
+        self.poll_interval_sec = poll_interval_sec
+        self.wait_for_leased = wait_for_leased
+        self.result_queue = result_queue
+        self.jobs_in_progress = {}  # {job key: job id}
+        self.jobs_lock = threading.Lock()
+        self.job_finished_event = threading.Event()
+        self.stop_event = threading.Event()
+        self.heartbeat_thread = threading.Thread(
+            target=self.run_heartbeat, name="job-queue-heartbeat", daemon=True
+        )
+
+    def __iter__(self):
+        while not self.stop_event.is_set():
+            claimed_jobs = claim_jobs(
+                self.engine,
+                self.scraper_name,
+                self.worker_id,
+                limit=self.claim_batch_size,
+                lease_sec=self.lease_sec,
+                max_attempts=self.max_attempts,
+            )
+            if not claimed_jobs:
+                with self.jobs_lock:
+                    has_jobs_in_progress = bool(self.jobs_in_progress)
+                if has_jobs_in_progress or (
+                    self.wait_for_leased
+                    and count_leased_by_others(self.engine, self.scraper_name, self.worker_id)
+                ):
+                    self.wait_before_claiming()
+                    continue
+                return
+            for job_id, job_key in claimed_jobs:
+                with self.jobs_lock:
+                    self.jobs_in_progress[job_key] = job_id
+                yield job_key
+
+    def wait_before_claiming(self):
+        """waits poll_interval_sec, or less if one of the jobs in progress is finished in the meantime"""
+        self.job_finished_event.wait(self.poll_interval_sec)
+        self.job_finished_event.clear()
+
+    def on_outcome(self, outcome):
+        """run_bounded callback: finishes the job of the outcome item"""
+        job_key = str(outcome.item)
+        with self.jobs_lock:
+            job_id = self.jobs_in_progress.get(job_key)
+        if job_id is None:
+            return
+        job_finish = JobFinish(self, job_key, job_id, outcome.is_success, outcome.error)
+        if self.result_queue is not None:
+            self.result_queue.put(job_finish)  # finished by the writer, see release_job
+            return
+        try:
+            finish_job(
+                self.engine,
+                job_id,
+                self.worker_id,
+                outcome.is_success,
+                error=outcome.error,
+                max_attempts=self.max_attempts,
+            )
+        finally:
+            self.remove_job_in_progress(job_key)
+
+    def release_job(self, job_finish, is_committed):
+        """the batch of the job finish was committed or rolled back (see release_flushed_jobs)"""
+        try:
+            if not is_committed:
+                finish_job(
+                    self.engine,
+                    job_finish.job_id,
+                    self.worker_id,
+                    is_success=False,
+                    error="objects not written: the persistence writer batch was rolled back",
+                    max_attempts=self.max_attempts,
+                )
+        finally:
+            self.remove_job_in_progress(job_finish.job_key)
+
+    def remove_job_in_progress(self, job_key):
+        # a job is in progress until it is finished in the db, so that the iteration waits to claim it again if it failed
+        with self.jobs_lock:
+            self.jobs_in_progress.pop(job_key, None)
+        self.job_finished_event.set()
+
+    def run_heartbeat(self):
+        while not self.stop_event.wait(self.heartbeat_interval_sec):
+            with self.jobs_lock:
+                job_ids = list(self.jobs_in_progress.values())
+            try:
+                extend_leases(self.engine, job_ids, self.worker_id, self.lease_sec)
+            except Exception:
+                logger.exception("failed to extend the leases of %s jobs", len(job_ids))
+
+    def __enter__(self):
+        self.heartbeat_thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop_event.set()
+        self.heartbeat_thread.join()
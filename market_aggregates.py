@@ -0,0 +1,364 @@
+import logging
+import argparse
+import statistics
+from collections import defaultdict
+
+import sqlalchemy
+from sqlalchemy import select, delete
+from sqlalchemy.orm import Session
+
+from models import (
+    db_url,
+    CalendarDayState,
+    AirBnbRoom,
+    AirBnbRoomCalendarDay,
+    AirBnbAreaDayStats,
+    AirBnbRoomMonthOccupancy,
+    upsert_rows,
+    get_dialect_insert,
+)
+from db_engine import create_db_engine
+from settings import AREAS_SETTINGS, market_aggregates_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_AREA_NICKNAME = AREAS_SETTINGS[market_aggregates_settings["default_area"]][
+    "area_nickname"
+]
+AREA_NICKNAME_KEY = "area_nickname"  # key of AirBnbRoom.extra_attributes with the area the room was found in
+
+AVAILABLE_STATES = {CalendarDayState.AVAILABLE, CalendarDayState.AVAILABLE_NO_CHECKOUT_DATE}
+# the night is booked (checkout only days can only be left, not booked)
+UNAVAILABLE_STATES = {CalendarDayState.UNAVAILABLE, CalendarDayState.CHECKOUT_ONLY}
+
+
+def get_price_histogram_key(price):
+    return str(round(price, market_aggregates_settings["price_histogram_decimals"]))
+
+
+def median_from_histogram(price_histogram):
+    """median of the prices of a {price: count} histogram (mean of the two middle prices for an even count)"""
+    prices = sorted(
+        (float(price), count) for price, count in price_histogram.items() if count > 0
+    )
+    total_count = sum(count for _, count in prices)
+    if not total_count:
+        return None
+    middle_positions = {(total_count - 1) // 2, total_count // 2}
+    middle_prices = []
+    position = 0
+    for price, count in prices:
+        for middle_position in sorted(middle_positions):
+            if position <= middle_position < position + count:
+                middle_prices.append(price)
+        position += count
+    return statistics.mean(middle_prices)
+
+
+def calendar_day_contributions(row, area_nickname, sign):
+    """
+    what one stored version of a calendar day adds to the aggregates (sign=1) or removes from them (sign=-1).
+    :return: ((area_nickname, calendar_day), area day counters), ((room_id, month), room month counters)
+    """
+    is_available = row["state"] in AVAILABLE_STATES
+    is_unavailable = row["state"] in UNAVAILABLE_STATES
+    has_price = is_available and row["price"] is not None
+    area_day_counters = {
+        "available_count": sign * is_available,
+        "unavailable_count": sign * is_unavailable,
+        "price_count": sign * has_price,
+        "price_sum": sign * row["price"] if has_price else 0.0,
+        "price_histogram": (
+            {get_price_histogram_key(row["price"]): sign} if has_price else {}
+        ),
+    }
+    room_month_counters = {
+        "available_days": sign * is_available,
+        "unavailable_days": sign * is_unavailable,
+    }
+    return (
+        (area_nickname, row["calendar_day"]),
+        area_day_counters,
+        (str(row["room_id"]), row["calendar_day"].replace(day=1)),
+        room_month_counters,
+    )
+
+
+def _add_counters(total_counters, counters):
+    for name, value in counters.items():
+        if name == "price_histogram":
+            histogram = total_counters.setdefault(name, {})
+            for price, count in value.items():
+                histogram[price] = histogram.get(price, 0) + count
+        else:
+            total_counters[name] = total_counters.get(name, 0) + value
+
+
+def compute_aggregate_deltas(written_rows, stored_rows_by_key, room_areas):
+    """
+    changes of the aggregates caused by the written calendar days: the contribution of the stored version
+    of each day is removed and the one of the written version added.
+
+    :param written_rows: calendar day rows (dicts) as written by bulk_save_or_update_airbnb_dates
+    :param stored_rows_by_key: {(room_id, calendar_day): stored row (sqlalchemy Row or dict)} the written rows replaced
+    :param room_areas: {room_id: area_nickname}. rooms not in it are in DEFAULT_AREA_NICKNAME
+    :return: {(area_nickname, calendar_day): counters}, {(room_id, month): counters}
+    """
+    area_day_deltas = defaultdict(dict)
+    room_month_deltas = defaultdict(dict)
+    for written_row in written_rows:
+        key = (written_row["room_id"], written_row["calendar_day"])
+        area_nickname = room_areas.get(written_row["room_id"], DEFAULT_AREA_NICKNAME)
+        versions = [(written_row, 1)]
+        if key in stored_rows_by_key:
+            stored_row = stored_rows_by_key[key]
+            versions.append((getattr(stored_row, "_mapping", stored_row), -1))
+        for row, sign in versions:
+            area_day_key, area_day_counters, room_month_key, room_month_counters = (
+                calendar_day_contributions(row, area_nickname, sign)
+            )
+            _add_counters(area_day_deltas[area_day_key], area_day_counters)
+            _add_counters(room_month_deltas[room_month_key], room_month_counters)
+    return area_day_deltas, room_month_deltas
+
+
+def _is_zero(counters):
+    return not any(
+        any(counters["price_histogram"].values()) if name == "price_histogram" else value
+        for name, value in counters.items()
+    )
+
+
+def _chunks(deltas, chunk_size):
+    items = list(deltas.items())
+    for chunk_start in range(0, len(items), chunk_size):
+        yield dict(items[chunk_start : chunk_start + chunk_size])
+
+
+def fetch_room_areas(session, room_ids):
+    """
+    {room_id: area_nickname} of the stored rooms. the rooms are locked until the end of the transaction, so that
+    the calendar day writers and the room writers moving them to another area (move_room_areas) take turns
+    """
+    rooms_table = AirBnbRoom.__table__
+    rows = session.execute(
+        select(rooms_table.c.id, rooms_table.c.extra_attributes)
+        .where(rooms_table.c.id.in_(set(room_ids)))
+        .order_by(rooms_table.c.id)
+        .with_for_update()
+    )
+    return {
+        row.id: (row.extra_attributes or {}).get(AREA_NICKNAME_KEY, DEFAULT_AREA_NICKNAME)
+        for row in rows
+    }
+
+
+def lock_aggregate_rows(session, table, key_columns, keys, empty_counters):
+    """
+    stored rows of the aggregate keys, locked until the end of the transaction so that concurrent writers
+    (e.g. calendar workers sharing a job queue) add their deltas one after the other.
+    the missing rows are first inserted empty, then all are read with SELECT ... FOR UPDATE, both in key order
+    so that writers never wait for each other in a cycle. on sqlite the insert takes the database write lock.
+    :return: {key: row}
+    """
+    sorted_keys = sorted(keys)
+    session.execute(
+        get_dialect_insert(session, table).on_conflict_do_nothing(index_elements=key_columns),
+        [{**dict(zip(key_columns, key)), **empty_counters} for key in sorted_keys],
+    )
+    stored_rows = session.execute(
+        select(table)
+        .where(*(table.c[column].in_({key[i] for key in sorted_keys}) for i, column in enumerate(key_columns)))
+        .order_by(*(table.c[column] for column in key_columns))
+        .with_for_update()
+    )
+    return {tuple(row._mapping[column] for column in key_columns): row for row in stored_rows}
+
+
+def apply_area_day_deltas(session, area_day_deltas):
+    """adds the deltas to the stored area day stats (rows locked, see lock_aggregate_rows) and recomputes mean and median"""
+    if not area_day_deltas:
+        return
+    table = AirBnbAreaDayStats.__table__
+    stored_by_key = lock_aggregate_rows(
+        session,
+        table,
+        ["area_nickname", "calendar_day"],
+        area_day_deltas,
+        {"available_count": 0, "unavailable_count": 0, "price_count": 0, "price_sum": 0.0, "price_histogram": {}},
+    )
+    rows = []
+    for (area_nickname, calendar_day), deltas in area_day_deltas.items():
+        stored_row = stored_by_key.get((area_nickname, calendar_day))
+        counters = {
+            "available_count": stored_row.available_count if stored_row else 0,
+            "unavailable_count": stored_row.unavailable_count if stored_row else 0,
+            "price_count": stored_row.price_count if stored_row else 0,
+            "price_sum": stored_row.price_sum if stored_row else 0.0,
+            "price_histogram": dict(stored_row.price_histogram or {}) if stored_row else {},
+        }
+        _add_counters(counters, deltas)
+        counters["price_histogram"] = {
+            price: count for price, count in counters["price_histogram"].items() if count
+        }
+        rows.append(
+            {
+                "area_nickname": area_nickname,
+                "calendar_day": calendar_day,
+                **counters,
+                "mean_price": (
+                    counters["price_sum"] / counters["price_count"]
+                    if counters["price_count"]
+                    else None
+                ),
+                "median_price": median_from_histogram(counters["price_histogram"]),
+            }
+        )
+    upsert_rows(session, table, rows, extra_set={"updated_at": sqlalchemy.func.now()})
+
+
+def apply_room_month_deltas(session, room_month_deltas):
+    """adds the deltas to the stored room month occupancy (rows locked, see lock_aggregate_rows)"""
+    if not room_month_deltas:
+        return
+    table = AirBnbRoomMonthOccupancy.__table__
+    stored_by_key = lock_aggregate_rows(
+        session,
+        table,
+        ["room_id", "calendar_month"],
+        room_month_deltas,
+        {"available_days": 0, "unavailable_days": 0},
+    )
+    rows = []
+    for (room_id, calendar_month), deltas in room_month_deltas.items():
+        stored_row = stored_by_key.get((room_id, calendar_month))
+        available_days = (stored_row.available_days if stored_row else 0) + deltas[
+            "available_days"
+        ]
+        unavailable_days = (stored_row.unavailable_days if stored_row else 0) + deltas[
+            "unavailable_days"
+        ]
+        rows.append(
+            {
+                "room_id": room_id,
+                "calendar_month": calendar_month,
+                "available_days": available_days,
+                "unavailable_days": unavailable_days,
+                "occupancy": (
+                    unavailable_days / (available_days + unavailable_days)
+                    if available_days + unavailable_days
+                    else None
+                ),
+            }
+        )
+    upsert_rows(session, table, rows, extra_set={"updated_at": sqlalchemy.func.now()})
+
+
+def update_market_aggregates(session, written_rows, stored_rows_by_key):
+    """
+    Incremental update of the aggregate tables with the calendar days written by bulk_save_or_update_airbnb_dates
+    (to be called in the same transaction). only the area days and room months of the written days are touched.
+    the rows updated are locked (lock_aggregate_rows), so any number of workers can write at the same time
+    """
+    if not written_rows:
+        return
+    room_areas = fetch_room_areas(session, [i["room_id"] for i in written_rows])
+    area_day_deltas, room_month_deltas = compute_aggregate_deltas(
+        written_rows, stored_rows_by_key, room_areas
+    )
+    # days written again with the same state and price do not change the aggregates
+    apply_area_day_deltas(
+        session, {key: i for key, i in area_day_deltas.items() if not _is_zero(i)}
+    )
+    apply_room_month_deltas(
+        session, {key: i for key, i in room_month_deltas.items() if not _is_zero(i)}
+    )
+
+
+def move_room_areas(session, rooms):
+    """
+    Moves the stored calendar days of the rooms found in another area than the stored one from the area day stats
+    of their old area to those of the new one. the rooms upsert merges the new area_nickname into the stored
+    extra attributes (see bulk_save_or_update_airbnb_room_instances), so this is to be called in the same
+    transaction, before it. rooms not stored yet are in DEFAULT_AREA_NICKNAME, like in compute_aggregate_deltas
+
+    :param rooms: AirBnbRoom about to be written. the first one of a room is the one the upsert keeps
+    """
+    new_room_areas = {}
+    for room in rooms:
+        area_nickname = (room.extra_attributes or {}).get(AREA_NICKNAME_KEY)
+        if area_nickname is not None:
+            new_room_areas.setdefault(str(room.id), area_nickname)
+    if not new_room_areas:
+        return
+    stored_room_areas = fetch_room_areas(session, new_room_areas)
+    moved_room_areas = {
+        room_id: (stored_room_areas.get(room_id, DEFAULT_AREA_NICKNAME), area_nickname)
+        for room_id, area_nickname in new_room_areas.items()
+        if stored_room_areas.get(room_id, DEFAULT_AREA_NICKNAME) != area_nickname
+    }
+    if not moved_room_areas:
+        return
+    calendar_days_table = AirBnbRoomCalendarDay.__table__
+    area_day_deltas = defaultdict(dict)
+    rows = session.execute(
+        select(calendar_days_table).where(calendar_days_table.c.room_id.in_(moved_room_areas))
+    )
+    for row in rows:
+        for area_nickname, sign in zip(moved_room_areas[row.room_id], (-1, 1)):
+            area_day_key, area_day_counters, _, _ = calendar_day_contributions(
+                row._mapping, area_nickname, sign
+            )
+            _add_counters(area_day_deltas[area_day_key], area_day_counters)
+    # the room months do not depend on the area
+    apply_area_day_deltas(
+        session, {key: i for key, i in area_day_deltas.items() if not _is_zero(i)}
+    )
+
+
+def rebuild_market_aggregates(session, chunk_size=1000):
+    """recomputes the aggregate tables from all the stored calendar days (first fill or check of the incremental update)"""
+    session.execute(delete(AirBnbAreaDayStats.__table__))
+    session.execute(delete(AirBnbRoomMonthOccupancy.__table__))
+    calendar_days_table = AirBnbRoomCalendarDay.__table__
+    rooms_table = AirBnbRoom.__table__
+    room_areas = {
+        row.id: (row.extra_attributes or {}).get(AREA_NICKNAME_KEY, DEFAULT_AREA_NICKNAME)
+        for row in session.execute(select(rooms_table.c.id, rooms_table.c.extra_attributes))
+    }
+    area_day_totals = defaultdict(dict)
+    room_month_totals = defaultdict(dict)
+    rows = session.execute(
+        select(calendar_days_table).execution_options(yield_per=chunk_size)
+    )
+    for row in rows:
+        area_day_key, area_day_counters, room_month_key, room_month_counters = (
+            calendar_day_contributions(
+                row._mapping, room_areas.get(row.room_id, DEFAULT_AREA_NICKNAME), 1
+            )
+        )
+        _add_counters(area_day_totals[area_day_key], area_day_counters)
+        _add_counters(room_month_totals[room_month_key], room_month_counters)
+    for area_day_chunk in _chunks(area_day_totals, chunk_size):
+        apply_area_day_deltas(session, area_day_chunk)
+    for room_month_chunk in _chunks(room_month_totals, chunk_size):
+        apply_room_month_deltas(session, room_month_chunk)
+    logger.info(
+        "rebuilt market aggregates: %s area days, %s room months",
+        len(area_day_totals),
+        len(room_month_totals),
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Recompute the market aggregate tables from the stored calendar days"
+    )
+    parser.add_argument("--db-url", default=db_url)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    engine = create_db_engine(args.db_url, writer=True)
+    AirBnbAreaDayStats.metadata.create_all(engine)
+    with Session(engine) as session:
+        rebuild_market_aggregates(session)
+        session.commit()
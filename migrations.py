@@ -0,0 +1,128 @@
+import logging
+
+from sqlalchemy import select, inspect, text
+from sqlalchemy.orm import Session
+
+from models import (
+    Base,
+    AirBnbScraperRun,
+    AirBnbRoomCalendarDay,
+    AirBnbRoomCalendarDayTransition,
+    AirBnbRoomCalendarDayTransitionDelta,
+    CALENDAR_DAY_COLUMNS,
+    CALENDAR_DAY_VALUE_COLUMNS,
+    write_transition_deltas,
+)
+from db_engine import create_db_engine
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 5000
+
+
+def create_transition_log_indexes(engine):
+    """indexes of the transition deltas. create_all only creates them with the table, not on a table created before"""
+    with engine.begin() as connection:
+        for index in AirBnbRoomCalendarDayTransitionDelta.__table__.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def migrate_legacy_transitions(engine, batch_size=MIGRATION_BATCH_SIZE):
+    """
+    Copies the rows of the legacy airbnb_room_calendar_day_transitions table (full copies of the day, one per day
+    because of its (room_id, calendar_day) key) to the transition deltas, keeping their created_at.
+    Each one becomes a delta with all the fields changed. Rows already copied are skipped, so it can be run again.
+
+    :return: number of rows copied
+    """
+    legacy_table = AirBnbRoomCalendarDayTransition.__table__
+    if not inspect(engine).has_table(legacy_table.name):
+        return 0
+    stored_columns = {i["name"] for i in inspect(engine).get_columns(legacy_table.name)}
+    missing_columns = set(legacy_table.columns.keys()) - stored_columns
+    if missing_columns:  # table created by an older version of the models, without calendar days
+        logger.warning(
+            "%s has no columns %s. legacy transitions not migrated",
+            legacy_table.name,
+            sorted(missing_columns),
+        )
+        return 0
+    delta_table = AirBnbRoomCalendarDayTransitionDelta.__table__
+    query = (
+        select(legacy_table)
+        .outerjoin(
+            delta_table,
+            (delta_table.c.room_id == legacy_table.c.room_id)
+            & (delta_table.c.calendar_day == legacy_table.c.calendar_day)
+            & (delta_table.c.created_at == legacy_table.c.created_at)
+            & (delta_table.c.transition_type == legacy_table.c.transition_type),
+        )
+        .where(delta_table.c.id.is_(None))
+    )
+    number_of_rows = 0
+    with Session(engine) as session:
+        legacy_rows = session.execute(query).all()
+        for batch_start in range(0, len(legacy_rows), batch_size):
+            transition_rows = []
+            for legacy_row in legacy_rows[batch_start : batch_start + batch_size]:
+                transition_row = {
+                    column: getattr(legacy_row, column)
+                    for column in CALENDAR_DAY_COLUMNS
+                    + ["created_at", "transition_type"]
+                }
+                transition_row["changed_fields"] = CALENDAR_DAY_VALUE_COLUMNS
+                transition_rows.append(transition_row)
+            write_transition_deltas(session, transition_rows)
+            number_of_rows += len(transition_rows)
+        session.commit()
+    if number_of_rows:
+        logger.info("migrated %s legacy transitions to the transition deltas", number_of_rows)
+    return number_of_rows
+
+
+def migrate_scraper_runs(engine):
+    """adds campaign_id and its index to an airbnb_scrapers_runs table created before campaigns were recorded"""
+    runs_table = AirBnbScraperRun.__table__
+    Base.metadata.create_all(engine, tables=[runs_table])
+    stored_columns = {i["name"] for i in inspect(engine).get_columns(runs_table.name)}
+    with engine.begin() as connection:
+        if "campaign_id" not in stored_columns:
+            connection.execute(
+                text(f"ALTER TABLE {runs_table.name} ADD COLUMN campaign_id VARCHAR")
+            )
+            logger.info("added campaign_id to %s", runs_table.name)
+        for index in runs_table.indexes:
+            index.create(connection, checkfirst=True)
+
+
+def migrate_calendar_days(engine):
+    """adds the price_checked_at column to an airbnb_room_calendar_days table created before it had it"""
+    calendar_days_table = AirBnbRoomCalendarDay.__table__
+    Base.metadata.create_all(engine, tables=[calendar_days_table])
+    stored_columns = {
+        i["name"] for i in inspect(engine).get_columns(calendar_days_table.name)
+    }
+    if "price_checked_at" in stored_columns:
+        return
+    with engine.begin() as connection:
+        connection.execute(
+            text(
+                f"ALTER TABLE {calendar_days_table.name} ADD COLUMN price_checked_at TIMESTAMP"
+            )
+        )
+    logger.info("added price_checked_at to %s", calendar_days_table.name)
+
+
+def migrate_transition_log(engine):
+    """brings an existing database to the append-only transition log: tables, indexes and legacy rows"""
+    Base.metadata.create_all(engine)
+    create_transition_log_indexes(engine)
+    return migrate_legacy_transitions(engine)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    engine = create_db_engine()
+    migrate_transition_log(engine)
+    migrate_scraper_runs(engine)
+    migrate_calendar_days(engine)
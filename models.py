@@ -8,15 +8,29 @@ from sqlalchemy import (
     Float,
     Date,
     Boolean,
+    Index,
+    UniqueConstraint,
 )
+from sqlalchemy import select, insert, update, bindparam, cast, literal
+from sqlalchemy.dialects.postgresql import JSONB, insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from enum import StrEnum
+from collections import defaultdict
+import hashlib
+import json
+import logging
 
-db_url = "sqlite:///data/airbnb.db"
+from calendar_diff import diff_calendar_days
+from settings import database_settings
+
+db_url = database_settings["db_url"]
 
 Base = declarative_base()
 
+logger = logging.getLogger(__name__)
+
 
 class CalendarDayState(StrEnum):
     AVAILABLE = "AVAILABLE"
@@ -28,11 +42,18 @@ class CalendarDayState(StrEnum):
 
 
 class AirBnbScraperRun(Base):
-    """Stores details about each airbnb scraper run"""
+    """
+    Stores details about each airbnb scraper run: one row per item (room or search link) scraped,
+    written with the objects of the item (see scraper_runs). used to resume an interrupted campaign
+    """
 
     __tablename__ = "airbnb_scrapers_runs"
+    __table_args__ = (
+        Index("ix_scrapers_runs_campaign", "scraper_name", "campaign_id", "room_id"),
+    )
     scraper_name = Column(String, primary_key=True)
-    room_id = Column(String, primary_key=True)
+    room_id = Column(String, primary_key=True, comment="room id or search link")
+    campaign_id = Column(String, comment="run of the scraper over all its items, resumed with --resume")
     created_at = Column(
         DateTime,
         default=func.now(),
@@ -51,6 +72,51 @@ class AirBnbScraperRun(Base):
     )
     comment = Column(String, comment = "comment on the execution of the scraping job")
 
+
+class AirBnbScraperCampaign(Base):
+    """
+    Items planned for a campaign of a scraper (see scraper_runs.start_campaign), saved before any of them is scraped.
+    a resumed campaign scrapes the ones without a successful run in airbnb_scrapers_runs, not a new plan
+    """
+
+    __tablename__ = "airbnb_scraper_campaigns"
+    scraper_name = Column(String, primary_key=True)
+    campaign_id = Column(String, primary_key=True)
+    created_at = Column(DateTime, default=func.now(), comment="Timestamp when the campaign was started")
+    items = Column(JSON, comment="room ids or search links of the campaign, in the order they are scraped")
+
+
+class ScrapeJobState(StrEnum):
+    PENDING = "PENDING"
+    LEASED = "LEASED"
+    DONE = "DONE"
+    FAILED = "FAILED"  # failed max_attempts times. not claimed again
+
+
+class AirBnbScrapeJob(Base):
+    """
+    Durable work item (a room or a search link) of a scraper, shared by all the worker processes using the db.
+    Workers claim jobs with a lease which they extend with heartbeats while the job runs: a job whose lease
+    expired (e.g. its worker crashed) can be claimed again. see job_queue
+    """
+
+    __tablename__ = "airbnb_scrape_jobs"
+    __table_args__ = (
+        UniqueConstraint("scraper_name", "job_key"),
+        Index("ix_scrape_jobs_claim", "scraper_name", "state", "lease_expires_at"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    scraper_name = Column(String, nullable=False)
+    job_key = Column(String, nullable=False, comment="room id or search link")
+    state = Column(String, default=ScrapeJobState.PENDING)
+    attempts = Column(Integer, default=0, comment="number of times the job was claimed")
+    lease_owner = Column(String, comment="worker id (host:pid) holding the lease")
+    lease_expires_at = Column(DateTime, comment="utc")
+    heartbeat_at = Column(DateTime, comment="utc")
+    last_error = Column(String)
+    created_at = Column(DateTime, default=func.now())
+    updated_at = Column(DateTime, onupdate=func.now())
+
 class AirBnbRoom(Base):
     """
     Represents an Airbnb room in the database.
@@ -153,6 +219,10 @@ class AirBnbRoomCalendarDay(Base):
         JSON,
         comment="Json with extra attributes",
     )
+    price_checked_at = Column(
+        DateTime,
+        comment="last time the price of the day was read. updated without counting as a change of the day (no transition, same updated_at)",
+    )
 
 
 # class AirBnbRoomCalendarUpdate(Base):
@@ -175,7 +245,7 @@ class AirBnbRoomCalendarDay(Base):
 
 
 class AirBnbRoomCalendarDayTransition(Base):
-    """Stores any change in state for a room calendar day"""
+    """Stores any change in state for a room calendar day (full copy of the day). no longer written: see AirBnbRoomCalendarDayTransitionDelta"""
 
     __tablename__ = "airbnb_room_calendar_day_transitions"
     room_id = Column(String, primary_key=True)
@@ -201,6 +271,94 @@ class AirBnbRoomCalendarDayTransition(Base):
     )
 
 
+class AirBnbAreaDayStats(Base):
+    """Market figures of an area for one calendar day. maintained incrementally by market_aggregates from the calendar day writes"""
+
+    __tablename__ = "airbnb_area_day_stats"
+    area_nickname = Column(String, primary_key=True)
+    calendar_day = Column(Date, primary_key=True)
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    available_count = Column(Integer, comment="rooms for which the day is available")
+    unavailable_count = Column(Integer, comment="rooms for which the night is booked")
+    price_count = Column(Integer, comment="available rooms with a price")
+    price_sum = Column(Float)
+    mean_price = Column(Float)
+    median_price = Column(Float)
+    price_histogram = Column(
+        JSON,
+        comment="{price: number of available rooms} the median is computed from. lets it be updated without scanning the days",
+    )
+
+
+class AirBnbRoomMonthOccupancy(Base):
+    """Occupancy of a room in one calendar month. maintained incrementally by market_aggregates from the calendar day writes"""
+
+    __tablename__ = "airbnb_room_month_occupancy"
+    room_id = Column(String, primary_key=True)
+    calendar_month = Column(Date, primary_key=True, comment="first day of the month")
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    available_days = Column(Integer)
+    unavailable_days = Column(Integer)
+    occupancy = Column(
+        Float, comment="unavailable_days / (available_days + unavailable_days). past days are not counted"
+    )
+
+
+class AirBnbJsonBlob(Base):
+    """Json contents referenced by content hash, so that repeated blobs (e.g. the same prices array) are stored once"""
+
+    __tablename__ = "airbnb_json_blobs"
+    content_hash = Column(
+        String, primary_key=True, comment="sha256 of the canonical json of content"
+    )
+    created_at = Column(DateTime, default=func.now())
+    content = Column(JSON)
+
+
+class AirBnbRoomCalendarDayTransitionDelta(Base):
+    """
+    Compact version of AirBnbRoomCalendarDayTransition. Each row only stores the fields which changed compared to the
+    stored day (changed_fields). the NEW_DATE_RECORDED row of a day stores all of them.
+    every write of a day appends one (VALUE_ONLY_CHANGE if the transition rules found no change), so folding them
+    gives the stored day.
+    Json fields are stored as content hashes of AirBnbJsonBlob. see reconstruct_calendar_day_state
+
+    Append-only time series: rows are never updated, the surrogate id keeps every transition of a day
+    (ordered by created_at, id). see fetch_room_transitions and fetch_transitions_since
+    """
+
+    __tablename__ = "airbnb_room_calendar_day_transition_deltas"
+    __table_args__ = (
+        Index("ix_transition_deltas_created_at", "created_at"),
+        Index("ix_transition_deltas_room_id_created_at", "room_id", "created_at"),
+        Index(
+            "ix_transition_deltas_room_id_calendar_day_created_at",
+            "room_id",
+            "calendar_day",
+            "created_at",
+        ),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    room_id = Column(String)
+    calendar_day = Column(Date)
+    created_at = Column(
+        DateTime,
+        default=func.now(),
+        comment="Timestamp when the room calendar transition was recorded",
+    )
+    transition_type = Column(String)
+    changed_fields = Column(
+        JSON, comment="names of the fields stored in this row. the others did not change"
+    )
+    state = Column(String)
+    price = Column(Float)
+    latest_prices_array_hash = Column(String, ForeignKey(AirBnbJsonBlob.content_hash))
+    minimum_stay_nights = Column(Integer)
+    cleaning_fee = Column(Float)
+    currency = Column(String)
+    extra_attributes_hash = Column(String, ForeignKey(AirBnbJsonBlob.content_hash))
+
+
 def check_calendar_day_changes(
     existing_instance, new_instance, price_change_tolerance_pct
 ):
@@ -208,9 +366,14 @@ def check_calendar_day_changes(
     min_nights_change = (
         existing_instance.minimum_stay_nights != new_instance.minimum_stay_nights
     )
-    price_change = (
-        abs(existing_instance.price - new_instance.price) / existing_instance.price
-    ) >= price_change_tolerance_pct
+    if not new_instance.price:
+        price_change = False  # price not available in new run. previous one will be kept
+    elif not existing_instance.price:
+        price_change = True
+    else:
+        price_change = (
+            abs(existing_instance.price - new_instance.price) / existing_instance.price
+        ) >= price_change_tolerance_pct
     cleaning_fee_change = existing_instance.cleaning_fee != new_instance.cleaning_fee
     currency_change = (
         existing_instance.currency != new_instance.currency
@@ -227,10 +390,235 @@ def check_calendar_day_changes(
     return any_change, state_change
 
 
+def apply_calendar_day_changes(
+    existing_instance, new_instance, price_change_tolerance_pct
+):
+    """compares new_instance with the existing_instance (ORM instance or row of the same table) and updates new_instance in place with the values which should be stored.
+    returns the transition_type to be recorded, or None if nothing relevant changed.
+    """
+    if not existing_instance:  # we do not have any record yet for this day
+        return "NEW_DATE_RECORDED"
+
+    any_change, state_change = check_calendar_day_changes(
+        existing_instance, new_instance, price_change_tolerance_pct
+    )
+    if any_change:  # change. store changes and generate AirBnbRoomCalendarDayTransitionDelta
+        transition_type = (
+            existing_instance.state + " - " + new_instance.state
+            if state_change
+            else "ATTRIBUTES_ONLY_CHANGE"
+        )
+    else:  # no change in considered attributes (extra attributes might have changed. we will store new version if key collision.)
+        transition_type = None
+
+    # some attributes might not longer be present in new state (will be nulls) in that case, we just keep previous atributes.
+    new_instance.price = (
+        new_instance.price if new_instance.price else existing_instance.price
+    )
+    new_instance.currency = (
+        new_instance.currency if new_instance.currency else existing_instance.currency
+    )
+    new_instance.cleaning_fee = (
+        new_instance.cleaning_fee
+        if new_instance.cleaning_fee
+        else existing_instance.cleaning_fee
+    )
+    new_instance.minimum_stay_nights = (
+        new_instance.minimum_stay_nights
+        if new_instance.minimum_stay_nights
+        else existing_instance.minimum_stay_nights
+    )
+    new_instance.latest_prices_array = (
+        new_instance.latest_prices_array
+        if new_instance.latest_prices_array
+        else existing_instance.latest_prices_array
+    )
+    new_instance.extra_attributes = {  # Merge dictionaries, with new_instance's values prevailing in case of conflict
+        **(existing_instance.extra_attributes or {}),
+        **(new_instance.extra_attributes or {}),
+    }
+    new_instance.price_checked_at = (
+        new_instance.price_checked_at or existing_instance.price_checked_at
+    )
+    return transition_type
+
+
+def json_content_hash(content):
+    canonical_json = json.dumps(
+        content, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(canonical_json.encode("utf-8")).hexdigest()
+
+
+TRANSITION_JSON_FIELDS = {
+    "latest_prices_array": "latest_prices_array_hash",
+    "extra_attributes": "extra_attributes_hash",
+}
+
+
+def make_transition_delta_row(transition_row):
+    """
+    compact delta of a transition row (values of the day after the transition + transition_type + changed_fields).
+    returns the delta row and the {content_hash: content} of the json blobs it references
+    """
+    delta_row = {
+        "room_id": transition_row["room_id"],
+        "calendar_day": transition_row["calendar_day"],
+        "transition_type": transition_row["transition_type"],
+        "changed_fields": transition_row["changed_fields"],
+    }
+    if transition_row.get("created_at") is not None:  # e.g. rows migrated from the legacy transitions table
+        delta_row["created_at"] = transition_row["created_at"]
+    json_blobs = {}
+    for column in CALENDAR_DAY_VALUE_COLUMNS:
+        is_changed = column in transition_row["changed_fields"]
+        value = transition_row[column] if is_changed else None
+        if column in TRANSITION_JSON_FIELDS:
+            content_hash = None
+            if is_changed and value is not None:
+                content_hash = json_content_hash(value)
+                json_blobs[content_hash] = value
+            delta_row[TRANSITION_JSON_FIELDS[column]] = content_hash
+        else:
+            delta_row[column] = value
+    return delta_row, json_blobs
+
+
+def make_calendar_day_transition(new_instance, transition_type, existing_instance=None):
+    """ORM version of make_transition_delta_row. returns the AirBnbRoomCalendarDayTransitionDelta and the AirBnbJsonBlob it references"""
+    transition_row = model_to_row(new_instance, CALENDAR_DAY_COLUMNS)
+    transition_row["transition_type"] = transition_type
+    transition_row["changed_fields"] = [
+        column
+        for column in CALENDAR_DAY_VALUE_COLUMNS
+        if existing_instance is None
+        or getattr(existing_instance, column) != transition_row[column]
+    ]
+    delta_row, json_blobs = make_transition_delta_row(transition_row)
+    return AirBnbRoomCalendarDayTransitionDelta(**delta_row), [
+        AirBnbJsonBlob(content_hash=content_hash, content=content)
+        for content_hash, content in json_blobs.items()
+    ]
+
+
+def write_transition_deltas(session, transition_rows):
+    """appends the compact deltas of transition_rows. json blobs already stored are not written again"""
+    delta_rows = []
+    json_blobs = {}
+    for transition_row in transition_rows:
+        delta_row, row_json_blobs = make_transition_delta_row(transition_row)
+        delta_rows.append(delta_row)
+        json_blobs.update(row_json_blobs)
+    if json_blobs:
+        insert_statement = get_dialect_insert(session, AirBnbJsonBlob.__table__)
+        session.execute(
+            insert_statement.on_conflict_do_nothing(index_elements=["content_hash"]),
+            [
+                {"content_hash": content_hash, "content": content}
+                for content_hash, content in json_blobs.items()
+            ],
+        )
+    if delta_rows:
+        session.execute(insert(AirBnbRoomCalendarDayTransitionDelta.__table__), delta_rows)
+
+
+def reconstruct_calendar_day_state(session, room_id, calendar_day, at=None):
+    """
+    State of a calendar day as recorded by its transitions up to `at` (default: now), folding the deltas in order.
+    returns a dict with the calendar day columns (json fields resolved), or None if the day was not recorded yet
+    """
+    table = AirBnbRoomCalendarDayTransitionDelta.__table__
+    query = (
+        select(table)
+        .where(table.c.room_id == str(room_id), table.c.calendar_day == calendar_day)
+        .order_by(table.c.created_at, table.c.id)
+    )
+    if at is not None:
+        query = query.where(table.c.created_at <= at)
+    state = None
+    for delta in session.execute(query):
+        state = state or {"room_id": delta.room_id, "calendar_day": delta.calendar_day}
+        for column in delta.changed_fields:
+            state[column] = getattr(delta, TRANSITION_JSON_FIELDS.get(column, column))
+        state["transition_type"] = delta.transition_type
+        state["transition_created_at"] = delta.created_at
+    if state is None:
+        return None
+    for column in TRANSITION_JSON_FIELDS:
+        content_hash = state.get(column)
+        if content_hash is not None:
+            state[column] = session.get(AirBnbJsonBlob, content_hash).content
+    return state
+
+
+def select_transitions(with_json=False):
+    """
+    select of the transition deltas. with_json=True resolves the json blobs
+    (latest_prices_array and extra_attributes columns, None if not changed by the transition)
+    """
+    table = AirBnbRoomCalendarDayTransitionDelta.__table__
+    if not with_json:
+        return select(table)
+    query = select(table)
+    for column, hash_column in TRANSITION_JSON_FIELDS.items():
+        json_blob = AirBnbJsonBlob.__table__.alias(column + "_blob")
+        query = query.outerjoin_from(
+            table, json_blob, json_blob.c.content_hash == table.c[hash_column]
+        ).add_columns(json_blob.c.content.label(column))
+    return query
+
+
+def fetch_room_transitions(
+    session, room_id, since=None, until=None, calendar_day=None, with_json=False
+):
+    """
+    history of one room (optionally of one of its days) ordered by time. since is exclusive, until inclusive.
+    uses the (room_id, created_at) / (room_id, calendar_day, created_at) indexes
+    """
+    table = AirBnbRoomCalendarDayTransitionDelta.__table__
+    query = select_transitions(with_json).where(table.c.room_id == str(room_id))
+    if calendar_day is not None:
+        query = query.where(table.c.calendar_day == calendar_day)
+    if since is not None:
+        query = query.where(table.c.created_at > since)
+    if until is not None:
+        query = query.where(table.c.created_at <= until)
+    return session.execute(query.order_by(table.c.created_at, table.c.id)).all()
+
+
+def fetch_transitions_since(
+    session, since, after_id=None, until=None, limit=None, with_json=False
+):
+    """
+    transitions of all rooms recorded after since (exclusive) ordered by time. uses the created_at index.
+    with limit, pages are read by passing the created_at and id of the last row as next since and after_id
+    (the rows of one batch share the same created_at)
+    """
+    table = AirBnbRoomCalendarDayTransitionDelta.__table__
+    if after_id is None:
+        query = select_transitions(with_json).where(table.c.created_at > since)
+    else:
+        query = select_transitions(with_json).where(
+            (table.c.created_at > since)
+            | ((table.c.created_at == since) & (table.c.id > after_id))
+        )
+    if until is not None:
+        query = query.where(table.c.created_at <= until)
+    query = query.order_by(table.c.created_at, table.c.id)
+    if limit is not None:
+        query = query.limit(limit)
+    return session.execute(query).all()
+
+
 def save_or_update_airbnb_room_instance(instance, session):
     existing_instance = session.query(AirBnbRoom).get(instance.id)
     if existing_instance:
         existing_instance.number_updates += 1
+        if instance.extra_attributes:  # e.g. the area_nickname of a room stored before it was recorded
+            existing_instance.extra_attributes = {
+                **(existing_instance.extra_attributes or {}),
+                **instance.extra_attributes,
+            }
         session.merge(existing_instance)  # the new details will override the old  ones
     else:
         session.add(instance)
@@ -258,66 +646,224 @@ def save_or_update_airbnb_date(
         .filter_by(room_id=new_instance.room_id, calendar_day=new_instance.calendar_day)
         .first()
     )
+    transition_type = apply_calendar_day_changes(
+        existing_instance, new_instance, price_change_tolerance_pct
+    )
+    transition_delta, json_blobs = make_calendar_day_transition(
+        new_instance, transition_type or "VALUE_ONLY_CHANGE", existing_instance
+    )
+    if transition_delta.changed_fields:  # every write of the day is recorded, see AirBnbRoomCalendarDayTransitionDelta
+        for json_blob in json_blobs:
+            session.merge(json_blob)
+        session.add(transition_delta)
     if existing_instance:
-        any_change, state_change = check_calendar_day_changes(
-            existing_instance, new_instance, price_change_tolerance_pct
-        )
-        if (
-            any_change
-        ):  # change. store changes and generate AirBnbRoomCalendarDayTransition
-            transition_type = (
-                existing_instance.state + " - " + new_instance.state
-                if state_change
-                else "ATTRIBUTES_ONLY_CHANGE"
-            )
+        session.merge(new_instance)  # the new details will override the old  ones
+    else:
+        session.add(new_instance)
 
-            # some attributes might not longer be present in new state (will be nulls) in that case, we just keep previous atributes.
-            new_instance.price = (
-                new_instance.price if new_instance.price else existing_instance.price
-            )
-            new_instance.currency = (
-                new_instance.currency
-                if new_instance.currency
-                else existing_instance.currency
-            )
-            new_instance.cleaning_fee = (
-                new_instance.cleaning_fee
-                if new_instance.cleaning_fee
-                else existing_instance.cleaning_fee
-            )
-            new_instance.minimum_stay_nights = (
-                new_instance.minimum_stay_nights
-                if new_instance.minimum_stay_nights
-                else existing_instance.minimum_stay_nights
-            )
-            new_instance.latest_prices_array = (
-                new_instance.latest_prices_array
-                if new_instance.latest_prices_array
-                else existing_instance.latest_prices_array
+
+def get_dialect_insert(session, table):
+    """returns an `INSERT` construct supporting `ON CONFLICT` for the dialect the session is bound to (sqlite or postgresql)"""
+    dialect_name = session.get_bind().dialect.name
+    if dialect_name == "sqlite":
+        return sqlite_insert(table)
+    elif dialect_name == "postgresql":
+        return postgresql_insert(table)
+    raise ValueError(f"bulk upsert is not supported for dialect '{dialect_name}'")
+
+
+def merge_json_objects(session, stored, new):
+    """expression of the json object `stored` updated with the keys of `new` (e.g. `excluded.extra_attributes` in an upsert).
+    sql null and json null are empty objects
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        stored, new = (
+            func.coalesce(
+                func.nullif(cast(i, JSONB), cast(literal("null", String), JSONB)),
+                cast(literal("{}", String), JSONB),
             )
+            for i in (stored, new)
+        )
+        return cast(stored.op("||")(new), JSON)
+    stored, new = (func.coalesce(func.nullif(cast(i, String), "null"), "{}") for i in (stored, new))
+    return func.json_patch(stored, new)
 
-        else:  # no change in considered attributes (extra attributes might have changed. we will store new version if key collision.)
-            transition_type = None
 
-        new_instance.extra_attributes = {  # Merge dictionaries, with new_instance's values prevailing in case of conflict
-            **existing_instance.extra_attributes,
-            **new_instance.extra_attributes,
-        }
-        session.merge(new_instance)  # the new details will override the old  ones
-    else:  # we do not have any record yet for this day
-        transition_type = "NEW_DATE_RECORDED"
-        session.add(new_instance)
-    if transition_type:
-        calendar_day_transition = AirBnbRoomCalendarDayTransition(
-            room_id=new_instance.room_id,
-            calendar_day=new_instance.calendar_day,
-            transition_type=transition_type,
-            state=new_instance.state,
-            price=new_instance.price,
-            latest_prices_array=new_instance.latest_prices_array,
-            minimum_stay_nights=new_instance.minimum_stay_nights,
-            cleaning_fee=new_instance.cleaning_fee,
-            currency=new_instance.currency,
-            extra_attributes=new_instance.extra_attributes,
+def upsert_rows(session, table, rows, set_columns=None, extra_set=None):
+    """multi-row `INSERT ... ON CONFLICT (primary key) DO UPDATE` of the passed rows (list of dicts).
+    set_columns are taken from the inserted (excluded) row. defaults to all the non primary key columns in rows.
+    extra_set are additional {column: expression} to set on conflict. it can also be a function receiving the `excluded` row and returning them.
+    """
+    if not rows:
+        return
+    primary_key_columns = [column.name for column in table.primary_key.columns]
+    if set_columns is None:
+        set_columns = [i for i in rows[0].keys() if i not in primary_key_columns]
+    insert_statement = get_dialect_insert(session, table)
+    if callable(extra_set):
+        extra_set = extra_set(insert_statement.excluded)
+    upsert_statement = insert_statement.on_conflict_do_update(
+        index_elements=primary_key_columns,
+        set_={
+            **{column: insert_statement.excluded[column] for column in set_columns},
+            **(extra_set or {}),
+        },
+    )
+    session.execute(upsert_statement, rows)  # executed as multi-row insert(s)
+
+
+def model_to_row(instance, columns):
+    return {column: getattr(instance, column) for column in columns}
+
+
+CALENDAR_DAY_COLUMNS = [
+    "room_id",
+    "calendar_day",
+    "state",
+    "price",
+    "latest_prices_array",
+    "minimum_stay_nights",
+    "cleaning_fee",
+    "currency",
+    "extra_attributes",
+]
+CALENDAR_DAY_VALUE_COLUMNS = CALENDAR_DAY_COLUMNS[2:]  # all but the key columns
+# written with the day but not compared: a new value alone is not a change of the day (see diff_calendar_days)
+CALENDAR_DAY_TOUCH_COLUMNS = ["price_checked_at"]
+CALENDAR_DAY_TRANSITION_COLUMNS = CALENDAR_DAY_COLUMNS + ["transition_type"]
+
+
+def bulk_save_or_update_airbnb_room_instances(instances, session):
+    """set based version of save_or_update_airbnb_room_instance for a batch of rooms.
+    one multi-row upsert: new rooms are inserted, existing ones get number_updates increased (once per time they were found)
+    and the new extra_attributes merged into theirs (e.g. the area_nickname of rooms stored before it was recorded)
+    """
+    if not instances:
+        return
+    table = AirBnbRoom.__table__
+    rows_by_id = {}
+    for instance in instances:
+        if instance.id in rows_by_id:  # same room found more than once in this batch
+            rows_by_id[instance.id]["number_updates"] += 1
+        else:
+            rows_by_id[instance.id] = {
+                "id": instance.id,
+                "room_url": instance.room_url,
+                "extra_attributes": instance.extra_attributes,
+                "number_updates": 0,
+            }
+    upsert_rows(
+        session,
+        table,
+        list(rows_by_id.values()),
+        set_columns=[],
+        extra_set=lambda excluded: {
+            "number_updates": table.c.number_updates + excluded.number_updates + 1,
+            "extra_attributes": merge_json_objects(
+                session, table.c.extra_attributes, excluded.extra_attributes
+            ),
+            "updated_at": func.now(),
+        },
+    )
+
+
+def fetch_existing_calendar_days(session, new_rows):
+    """one query returning the stored calendar days for all rooms and dates in new_rows (dicts). {(room_id, calendar_day): row}"""
+    table = AirBnbRoomCalendarDay.__table__
+    room_ids = {i["room_id"] for i in new_rows}
+    calendar_days = [i["calendar_day"] for i in new_rows]
+    existing_rows = session.execute(
+        select(table).where(
+            table.c.room_id.in_(room_ids),
+            table.c.calendar_day.between(min(calendar_days), max(calendar_days)),
+        )
+    )
+    return {(row.room_id, row.calendar_day): row for row in existing_rows}
+
+
+def fetch_room_calendar_days(session, room_id, from_day=None):
+    """stored calendar days of one room, optionally only from from_day on. {calendar_day: row}"""
+    table = AirBnbRoomCalendarDay.__table__
+    query = select(table).where(table.c.room_id == str(room_id))
+    if from_day is not None:
+        query = query.where(table.c.calendar_day >= from_day)
+    return {row.calendar_day: row for row in session.execute(query)}
+
+
+def touch_calendar_days(session, touched_rows):
+    """
+    updates the CALENDAR_DAY_TOUCH_COLUMNS of stored days whose values did not change. updated_at is left as it is.
+    one UPDATE per room and touch values: the days priced in one scrape of a calendar share their price_checked_at.
+    a day is only touched when its price was read again. with incremental probing (price_probing.get_fresh_days) that
+    happens once its price_checked_at is older than the ttl, so an unchanged calendar scraped within the ttl writes nothing
+    """
+    table = AirBnbRoomCalendarDay.__table__
+    calendar_days_by_key = defaultdict(list)
+    for row in touched_rows:
+        touch_values = tuple(row[column] for column in CALENDAR_DAY_TOUCH_COLUMNS)
+        calendar_days_by_key[(row["room_id"], touch_values)].append(row["calendar_day"])
+    for (room_id, touch_values), calendar_days in calendar_days_by_key.items():
+        session.execute(
+            update(table)
+            .where(table.c.room_id == room_id, table.c.calendar_day.in_(calendar_days))
+            .values(
+                {
+                    **dict(zip(CALENDAR_DAY_TOUCH_COLUMNS, touch_values)),
+                    "updated_at": table.c.updated_at,  # not a change of the day: no onupdate
+                }
+            )
         )
-        session.add(calendar_day_transition)
+
+
+def bulk_save_or_update_airbnb_dates(
+    new_instances,
+    session,
+    price_change_tolerance_pct: float = 0.1,
+):
+    """set based version of save_or_update_airbnb_date for a batch of calendar days (of one or many rooms).
+    1. prefetches all the existing days of the batch in one query
+    2. diffs the new days against them in one vectorized pass (calendar_diff.diff_calendar_days, same rules as apply_calendar_day_changes)
+    3. writes only the days which changed, and their transitions, with multi-row INSERT ... ON CONFLICT DO UPDATE.
+       days which only got a new price_checked_at just have it updated (touch_calendar_days)
+
+    Args:
+        new_instances (list[AirBnbRoomCalendarDay | room_calendar.CalendarDayRow]): calendar days from current job run. if a day is present more than once, the last one is kept
+        session (Any): the db session. bound to a sqlite or postgresql engine
+        price_change_tolerance_pct (float, optional): see save_or_update_airbnb_date. Defaults to 0.1 [10%].
+
+    Returns:
+        the calendar day rows written and the stored rows they replaced ({(room_id, calendar_day): row}), e.g. for market_aggregates
+    """
+    if not new_instances:
+        return [], {}
+    new_rows = [
+        model_to_row(i, CALENDAR_DAY_COLUMNS + CALENDAR_DAY_TOUCH_COLUMNS)
+        for i in new_instances
+    ]
+    for new_row in new_rows:
+        new_row["room_id"] = str(new_row["room_id"])  # stored as string. rooms ids might be passed as int
+    existing_rows_by_key = fetch_existing_calendar_days(session, new_rows)
+    calendar_day_rows, transition_rows, touched_rows = diff_calendar_days(
+        new_rows,
+        [row._mapping for row in existing_rows_by_key.values()],
+        CALENDAR_DAY_COLUMNS,
+        price_change_tolerance_pct,
+        touch_columns=CALENDAR_DAY_TOUCH_COLUMNS,
+    )
+    logger.info(
+        "%s calendar days in batch: %s changed, %s transitions, %s only price checked again",
+        len(new_rows),
+        len(calendar_day_rows),
+        len(transition_rows),
+        len(touched_rows),
+    )
+
+    upsert_rows(
+        session,
+        AirBnbRoomCalendarDay.__table__,
+        calendar_day_rows,
+        extra_set={"updated_at": func.now()},
+    )
+    touch_calendar_days(session, touched_rows)
+    write_transition_deltas(session, transition_rows)
+    return calendar_day_rows, existing_rows_by_key
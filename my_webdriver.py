@@ -1,16 +1,47 @@
 from selenium import webdriver
-from settings import driver_settings
+from settings import driver_settings, DRIVER_PROFILES
 from selenium.webdriver.chrome.options import Options
 
 
-def driver_setup(settings=driver_settings, headless=None):
-    if type(headless) == bool:
-        settings["headless"] = headless
-    if settings["headless"]:
-        options = Options()
+def get_driver_options(driver_profile, headless):
+    """chrome options of a profile of DRIVER_PROFILES"""
+    options = Options()
+    if headless:
         options.add_argument("--headless")
-    else:
-        options = None
+    options.page_load_strategy = driver_profile.get("page_load_strategy", "normal")
+    for argument in driver_profile.get("arguments", []):
+        options.add_argument(argument)
+    if driver_profile.get("js_heap_limit_mb"):
+        options.add_argument(
+            f"--js-flags=--max-old-space-size={driver_profile['js_heap_limit_mb']}"
+        )
+    if driver_profile.get("blocked_hosts"):
+        options.add_argument(
+            "--host-resolver-rules="
+            + ", ".join(f"MAP {i} ~NOTFOUND" for i in driver_profile["blocked_hosts"])
+        )
+    if driver_profile.get("prefs"):
+        options.add_experimental_option("prefs", driver_profile["prefs"])
+    return options
 
-    driver = webdriver.Chrome(options=options)
+
+def block_urls(driver, url_patterns):
+    """the requests matching url_patterns (* wildcards) are failed by the browser before being sent"""
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": url_patterns})
+
+
+def driver_setup(settings=driver_settings, headless=None, profile=None):
+    """
+    chrome driver with the options of a profile of DRIVER_PROFILES.
+
+    :param headless: overrides settings["headless"]
+    :param profile: overrides settings["profile"]
+    """
+    if type(headless) != bool:
+        headless = settings["headless"]
+    driver_profile = DRIVER_PROFILES[profile or settings.get("profile", "full")]
+    driver = webdriver.Chrome(options=get_driver_options(driver_profile, headless))
+    if driver_profile.get("blocked_url_patterns"):
+        block_urls(driver, driver_profile["blocked_url_patterns"])
     return driver
@@ -0,0 +1,342 @@
+import os
+import json
+import logging
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from models import (
+    db_url,
+    AirBnbRoom,
+    AirBnbRoomCalendarDay,
+    AirBnbRoomCalendarDayTransitionDelta,
+    select_transitions,
+)
+from db_engine import create_db_engine
+from settings import parquet_export_settings
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+EXPORT_STATE_FILE_NAME = "_export_state.json"
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ImportError("the parquet export needs pyarrow. install it with `poetry install --with parquet` (or `pip install pyarrow`)")
+
+
+def flatten_prices_array(prices_array):
+    """
+    latest_prices_array ([{"check_in", "check_out", "price"}]) -> typed columns:
+    the stays as parallel lists and their count / min / max price
+    """
+    prices_array = prices_array or []
+    stay_prices = [i.get("price") for i in prices_array]
+    known_prices = [i for i in stay_prices if i is not None]
+    return {
+        "stay_check_ins": [_to_date(i.get("check_in")) for i in prices_array],
+        "stay_check_outs": [_to_date(i.get("check_out")) for i in prices_array],
+        "stay_prices": [float(i) if i is not None else None for i in stay_prices],
+        "num_stay_prices": len(prices_array),
+        "stay_price_min": float(min(known_prices)) if known_prices else None,
+        "stay_price_max": float(max(known_prices)) if known_prices else None,
+    }
+
+
+def _to_date(value):
+    if value is None or not isinstance(value, str):
+        return value
+    return datetime.strptime(value[:10], "%Y-%m-%d").date()
+
+
+def _to_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def _to_json_string(value):
+    return None if value is None else json.dumps(value, sort_keys=True, default=str)
+
+
+def _scrape_date(row):
+    """date of the last write of the row (partition key)"""
+    return (row.updated_at or row.created_at).date().isoformat()
+
+
+def room_to_export_row(row):
+    return {
+        "id": row.id,
+        "created_at": row.created_at,
+        "updated_at": row.updated_at,
+        "number_updates": row.number_updates,
+        "room_url": row.room_url,
+        "extra_attributes": _to_json_string(row.extra_attributes),
+        "scrape_date": _scrape_date(row),
+    }
+
+
+def calendar_day_to_export_row(row):
+    return {
+        "room_id": row.room_id,
+        "calendar_day": row.calendar_day,
+        "created_at": row.created_at,
+        "updated_at": row.updated_at,
+        "state": row.state,
+        "price": row.price,
+        "minimum_stay_nights": row.minimum_stay_nights,
+        "cleaning_fee": row.cleaning_fee,
+        "currency": row.currency,
+        **flatten_prices_array(row.latest_prices_array),
+        "price_checked_at": _to_datetime(row.price_checked_at),
+        "extra_attributes": _to_json_string(row.extra_attributes),
+        "scrape_date": _scrape_date(row),
+        "calendar_month": row.calendar_day.strftime("%Y-%m"),
+    }
+
+
+def transition_to_export_row(row):
+    """transition delta with resolved json blobs. stay columns are empty if the prices array did not change"""
+    return {
+        "id": row.id,
+        "room_id": row.room_id,
+        "calendar_day": row.calendar_day,
+        "created_at": row.created_at,
+        "transition_type": row.transition_type,
+        "changed_fields": list(row.changed_fields or []),
+        "state": row.state,
+        "price": row.price,
+        "minimum_stay_nights": row.minimum_stay_nights,
+        "cleaning_fee": row.cleaning_fee,
+        "currency": row.currency,
+        **flatten_prices_array(row.latest_prices_array),
+        "extra_attributes": _to_json_string(row.extra_attributes),
+        "scrape_date": row.created_at.date().isoformat(),
+        "calendar_month": row.calendar_day.strftime("%Y-%m"),
+    }
+
+
+def _stay_fields():
+    return [
+        ("stay_check_ins", pa.list_(pa.date32())),
+        ("stay_check_outs", pa.list_(pa.date32())),
+        ("stay_prices", pa.list_(pa.float64())),
+        ("num_stay_prices", pa.int32()),
+        ("stay_price_min", pa.float64()),
+        ("stay_price_max", pa.float64()),
+    ]
+
+
+def get_export_tables():
+    """
+    {name: (select of the rows, last write time column, row conversion, arrow schema, partition columns)}.
+    scrape_date is the date of the last write of the row, calendar_month the month of the calendar day
+    """
+    _require_pyarrow()
+    rooms_table = AirBnbRoom.__table__
+    calendar_days_table = AirBnbRoomCalendarDay.__table__
+    transitions_table = AirBnbRoomCalendarDayTransitionDelta.__table__
+    calendar_day_value_fields = [
+        ("state", pa.string()),
+        ("price", pa.float64()),
+        ("minimum_stay_nights", pa.int32()),
+        ("cleaning_fee", pa.float64()),
+        ("currency", pa.string()),
+    ]
+    return {
+        rooms_table.name: (
+            select(rooms_table),
+            func.coalesce(rooms_table.c.updated_at, rooms_table.c.created_at),
+            room_to_export_row,
+            pa.schema(
+                [
+                    ("id", pa.string()),
+                    ("created_at", pa.timestamp("us")),
+                    ("updated_at", pa.timestamp("us")),
+                    ("number_updates", pa.int32()),
+                    ("room_url", pa.string()),
+                    ("extra_attributes", pa.string()),
+                    ("scrape_date", pa.string()),
+                ]
+            ),
+            ["scrape_date"],
+        ),
+        calendar_days_table.name: (
+            select(calendar_days_table),
+            func.coalesce(
+                calendar_days_table.c.updated_at, calendar_days_table.c.created_at
+            ),
+            calendar_day_to_export_row,
+            pa.schema(
+                [
+                    ("room_id", pa.string()),
+                    ("calendar_day", pa.date32()),
+                    ("created_at", pa.timestamp("us")),
+                    ("updated_at", pa.timestamp("us")),
+                    *calendar_day_value_fields,
+                    *_stay_fields(),
+                    ("price_checked_at", pa.timestamp("us")),
+                    ("extra_attributes", pa.string()),
+                    ("scrape_date", pa.string()),
+                    ("calendar_month", pa.string()),
+                ]
+            ),
+            ["scrape_date", "calendar_month"],
+        ),
+        transitions_table.name: (
+            select_transitions(with_json=True),
+            transitions_table.c.created_at,
+            transition_to_export_row,
+            pa.schema(
+                [
+                    ("id", pa.int64()),
+                    ("room_id", pa.string()),
+                    ("calendar_day", pa.date32()),
+                    ("created_at", pa.timestamp("us")),
+                    ("transition_type", pa.string()),
+                    ("changed_fields", pa.list_(pa.string())),
+                    *calendar_day_value_fields,
+                    *_stay_fields(),
+                    ("extra_attributes", pa.string()),
+                    ("scrape_date", pa.string()),
+                    ("calendar_month", pa.string()),
+                ]
+            ),
+            ["scrape_date", "calendar_month"],
+        ),
+    }
+
+
+def get_export_state_path(export_dir):
+    return os.path.join(export_dir, EXPORT_STATE_FILE_NAME)
+
+
+def load_export_state(export_dir):
+    """{table name: {"exported_until": iso datetime}} of the previous exports"""
+    export_state_path = get_export_state_path(export_dir)
+    if not os.path.exists(export_state_path):
+        return {}
+    with open(export_state_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_export_state(export_state, export_dir):
+    os.makedirs(export_dir, exist_ok=True)
+    with open(get_export_state_path(export_dir), "w", encoding="utf-8") as f:
+        json.dump(export_state, f, indent=2)
+
+
+def export_table(
+    session,
+    table_name,
+    export_dir,
+    since,
+    until,
+    chunk_size=parquet_export_settings["chunk_size"],
+):
+    """
+    Appends the rows of table_name last written in (since, until] to the parquet dataset export_dir/table_name,
+    one file per partition and chunk of chunk_size rows. since None exports everything up to until.
+
+    :return: number of rows exported
+    """
+    query, written_at_column, to_export_row, schema, partition_columns = (
+        get_export_tables()[table_name]
+    )
+    query = query.where(written_at_column <= until)
+    if since is not None:
+        query = query.where(written_at_column > since)
+    export_id = until.strftime("%Y%m%dT%H%M%S")
+    number_of_rows = 0
+    result = session.execute(query.execution_options(yield_per=chunk_size))
+    for chunk_index, rows in enumerate(result.partitions()):
+        pq.write_to_dataset(
+            pa.Table.from_pylist([to_export_row(row) for row in rows], schema=schema),
+            root_path=os.path.join(export_dir, table_name),
+            partition_cols=partition_columns,
+            basename_template=f"part-{export_id}-{chunk_index}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
+        number_of_rows += len(rows)
+    return number_of_rows
+
+
+def export_to_parquet(
+    engine,
+    export_dir=parquet_export_settings["export_dir"],
+    full=False,
+    watermark_lag_sec=parquet_export_settings["watermark_lag_sec"],
+):
+    """
+    Incremental export of rooms, calendar days and transition deltas to partitioned parquet datasets.
+    Each table is exported from where its previous export stopped (see load_export_state), so the calendar days
+    dataset keeps one snapshot of a day per export in which it changed: the latest one is the one with the max updated_at.
+
+    :param full: export everything again, ignoring the previous exports (files already written are kept)
+    :return: {table name: number of rows exported}
+    """
+    _require_pyarrow()
+    export_state = {} if full else load_export_state(export_dir)
+    exported_rows = {}
+    with Session(engine) as session:
+        # timestamps are written by the db clock, so the upper bound is taken from it
+        until = session.scalar(select(func.now())) - timedelta(seconds=watermark_lag_sec)
+        for table_name in get_export_tables():
+            since = export_state.get(table_name, {}).get("exported_until")
+            since = datetime.fromisoformat(since) if since else None
+            exported_rows[table_name] = export_table(
+                session, table_name, export_dir, since, until
+            )
+            export_state[table_name] = {"exported_until": until.isoformat()}
+            save_export_state(export_state, export_dir)
+            logger.info(
+                "exported %s rows of %s (%s - %s]",
+                exported_rows[table_name],
+                table_name,
+                since,
+                until,
+            )
+    return exported_rows
+
+
+def read_export(
+    table_name,
+    columns=None,
+    filters=None,
+    export_dir=parquet_export_settings["export_dir"],
+):
+    """
+    DataFrame of an exported table. only the passed columns are read, filters (pyarrow filters,
+    e.g. [("calendar_month", "=", "2024-08")]) on the partition columns skip the other partitions entirely
+    """
+    _require_pyarrow()
+    return pq.read_table(
+        os.path.join(export_dir, table_name), columns=columns, filters=filters
+    ).to_pandas()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the scraped tables to partitioned parquet datasets"
+    )
+    parser.add_argument("--db-url", default=db_url)
+    parser.add_argument("--export-dir", default=parquet_export_settings["export_dir"])
+    parser.add_argument(
+        "--full", action="store_true", help="export everything, not only the rows written since the last export"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    export_to_parquet(
+        create_db_engine(args.db_url),
+        export_dir=args.export_dir,
+        full=args.full,
+    )
@@ -0,0 +1,171 @@
+import queue
+import threading
+import time
+import logging
+from collections import deque
+
+from sqlalchemy.orm import Session
+
+from settings import persistence_writer_settings
+
+logger = logging.getLogger(__name__)
+
+_STOP_WRITER = object()
+
+
+class RowBoundedQueue(queue.Queue):
+    """
+    queue.Queue whose maxsize bounds the number of rows waiting (sum of `object_size_function` of the objects,
+    at least 1 each) instead of the number of objects. `put` blocks while the queue is full, an object larger than
+    maxsize is still accepted once the queue is below it. qsize() is in rows.
+    """
+
+    def __init__(self, maxsize, object_size_function):
+        self.object_size_function = object_size_function
+        super().__init__(maxsize=maxsize)
+
+    def _init(self, maxsize):
+        self.queue = deque()
+        self.num_rows = 0
+
+    def _qsize(self):
+        return self.num_rows
+
+    def _put(self, item):
+        size = max(1, self.object_size_function(item))
+        self.queue.append((item, size))
+        self.num_rows += size
+
+    def _get(self):
+        item, size = self.queue.popleft()
+        self.num_rows -= size
+        return item
+
+
+class PersistenceWriter(threading.Thread):
+    """
+    Dedicated thread persisting scraped objects while the scraping is still running.
+
+    Scraper threads put their objects in `writer.queue` (a bounded queue: when `max_queue_size` rows are waiting
+    `put` blocks, so fast producers are slowed down instead of piling objects up in memory).
+    The writer commits them in micro-batches, as soon as `batch_size` objects are available
+    or `flush_interval_sec` seconds passed since the last commit, whichever comes first.
+
+    Objects standing for several rows (e.g. a room_calendar.RoomCalendar) are counted with `object_size_function`,
+    so `max_queue_size`, `batch_size` and the counts logged stay in rows.
+
+    A failing batch is rolled back and logged, the writer keeps consuming so producers are never stuck.
+
+    :Example:
+        with PersistenceWriter(engine, write_function=write_batch) as writer:
+            scrape(result_queue=writer.queue)
+    """
+
+    def __init__(
+        self,
+        engine,
+        write_function,
+        max_queue_size=persistence_writer_settings["max_queue_size"],
+        batch_size=persistence_writer_settings["batch_size"],
+        flush_interval_sec=persistence_writer_settings["flush_interval_sec"],
+        object_size_function=None,
+        after_flush_function=None,
+    ):
+        """
+        :param engine: sqlalchemy engine used to open one session per batch
+        :param write_function: function called as `write_function(objects, session)` for each batch. commit is done by the writer
+        :param object_size_function: number of rows of an object of the queue. default: 1 per object
+        :param after_flush_function: optional function called as `after_flush_function(objects, is_committed)` once
+            each batch is committed or rolled back (e.g. job_queue.release_flushed_jobs)
+        """
+        super().__init__(name="persistence-writer", daemon=True)
+        self.engine = engine
+        self.write_function = write_function
+        self.batch_size = batch_size
+        self.flush_interval_sec = flush_interval_sec
+        self.object_size_function = object_size_function or (lambda obj: 1)
+        self.after_flush_function = after_flush_function
+        self.queue = RowBoundedQueue(max_queue_size, self.object_size_function)
+        self.num_objects_written = 0
+        self.num_objects_failed = 0
+        self.num_batches_committed = 0
+
+    def put(self, obj):
+        self.queue.put(obj)
+
+    def flush(self, batch):
+        if not batch:
+            return
+        is_committed = self.write(batch)
+        if self.after_flush_function:
+            try:
+                self.after_flush_function(batch, is_committed)
+            except Exception:
+                logger.exception("after flush function failed")
+
+    def write(self, batch):
+        """writes and commits the batch in one transaction. returns False if it was rolled back"""
+        batch_size = sum(self.object_size_function(i) for i in batch)
+        t0 = time.monotonic()
+        with Session(self.engine) as session:
+            try:
+                self.write_function(batch, session)
+                session.commit()
+            except Exception:
+                session.rollback()
+                self.num_objects_failed += batch_size
+                logger.exception("failed to write batch of %s objects", batch_size)
+                return False
+        self.num_objects_written += batch_size
+        self.num_batches_committed += 1
+        logger.info(
+            "committed batch of %s objects in %.2f sec. tot objects written: %s",
+            batch_size,
+            time.monotonic() - t0,
+            self.num_objects_written,
+        )
+        return True
+
+    def run(self):
+        batch = []
+        batch_size = 0
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0, self.flush_interval_sec - (time.monotonic() - last_flush))
+            try:
+                obj = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                obj = None
+            is_stop = obj is _STOP_WRITER
+            if obj is not None and not is_stop:
+                batch.append(obj)
+                batch_size += self.object_size_function(obj)
+            if (
+                is_stop
+                or batch_size >= self.batch_size
+                or (time.monotonic() - last_flush) >= self.flush_interval_sec
+            ):
+                self.flush(batch)
+                batch = []
+                batch_size = 0
+                last_flush = time.monotonic()
+            if is_stop:
+                return
+
+    def close(self):
+        """waits for every object already queued to be written, then stops the writer"""
+        self.queue.put(_STOP_WRITER)
+        self.join()
+        logger.info(
+            "persistence writer closed. %s objects written in %s batches, %s failed",
+            self.num_objects_written,
+            self.num_batches_committed,
+            self.num_objects_failed,
+        )
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,377 @@
+import io
+import json
+import logging
+
+from models import (
+    AirBnbRoom,
+    AirBnbRoomCalendarDay,
+    AirBnbJsonBlob,
+    AirBnbRoomCalendarDayTransitionDelta,
+    CALENDAR_DAY_COLUMNS,
+    CALENDAR_DAY_VALUE_COLUMNS,
+    CALENDAR_DAY_TOUCH_COLUMNS,
+    model_to_row,
+    make_transition_delta_row,
+)
+from settings import database_settings
+
+logger = logging.getLogger(__name__)
+
+ROOMS_TABLE = AirBnbRoom.__tablename__
+CALENDAR_DAYS_TABLE = AirBnbRoomCalendarDay.__tablename__
+JSON_BLOBS_TABLE = AirBnbJsonBlob.__tablename__
+TRANSITION_DELTAS_TABLE = AirBnbRoomCalendarDayTransitionDelta.__tablename__
+
+# staging tables live until the end of the transaction (one PersistenceWriter batch)
+STAGING_TABLES_DDL = {
+    "staging_rooms": """
+        CREATE TEMP TABLE staging_rooms (
+            seq integer, id varchar, room_url varchar, extra_attributes json
+        ) ON COMMIT DROP""",
+    "staging_calendar_days": """
+        CREATE TEMP TABLE staging_calendar_days (
+            seq integer, room_id varchar, calendar_day date, state varchar, price float8,
+            latest_prices_array json, minimum_stay_nights integer, cleaning_fee float8,
+            currency varchar, extra_attributes json, price_checked_at timestamp
+        ) ON COMMIT DROP""",
+    "staging_json_blobs": """
+        CREATE TEMP TABLE staging_json_blobs (content_hash varchar, content json) ON COMMIT DROP""",
+    "staging_transition_deltas": """
+        CREATE TEMP TABLE staging_transition_deltas (
+            room_id varchar, calendar_day date, transition_type varchar, changed_fields json,
+            state varchar, price float8, latest_prices_array_hash varchar, minimum_stay_nights integer,
+            cleaning_fee float8, currency varchar, extra_attributes_hash varchar
+        ) ON COMMIT DROP""",
+}
+
+MERGE_ROOMS_SQL = f"""
+    INSERT INTO {ROOMS_TABLE} (id, created_at, number_updates, room_url, extra_attributes)
+    SELECT DISTINCT ON (id) id, now(), count(*) OVER (PARTITION BY id) - 1, room_url, extra_attributes
+    FROM staging_rooms
+    ORDER BY id, seq
+    ON CONFLICT (id) DO UPDATE SET
+        number_updates = {ROOMS_TABLE}.number_updates + excluded.number_updates + 1,
+        extra_attributes = (
+            coalesce(nullif({ROOMS_TABLE}.extra_attributes::jsonb, 'null'), '{{}}')
+            || coalesce(nullif(excluded.extra_attributes::jsonb, 'null'), '{{}}')
+        )::json,
+        updated_at = now()
+"""
+
+# same rules as calendar_diff.diff_calendar_days / apply_calendar_day_changes:
+# missing new values (null, 0, "", empty array) are kept from the stored day, extra attributes are merged,
+# transition types come from the changes of the new values against the stored ones, every day written gets one
+# (VALUE_ONLY_CHANGE when the rules found no change) so the transitions rebuild the stored days.
+# a new price_checked_at alone is not a change: it is updated on the stored day (touched), which is not returned.
+MERGE_CALENDAR_DAYS_SQL = f"""
+    WITH new_days AS (
+        SELECT DISTINCT ON (room_id, calendar_day) *
+        FROM staging_calendar_days
+        ORDER BY room_id, calendar_day, seq DESC
+    ),
+    compared AS (
+        SELECT
+            n.room_id,
+            n.calendar_day,
+            o.room_id IS NOT NULL AS is_stored,
+            n.state,
+            CASE WHEN o.room_id IS NOT NULL AND coalesce(n.price, 0) = 0 THEN o.price ELSE n.price END AS price,
+            CASE
+                WHEN o.room_id IS NOT NULL AND coalesce(n.latest_prices_array::jsonb, 'null') IN ('null', '[]', '{{}}')
+                THEN o.latest_prices_array ELSE n.latest_prices_array
+            END AS latest_prices_array,
+            CASE
+                WHEN o.room_id IS NOT NULL AND coalesce(n.minimum_stay_nights, 0) = 0
+                THEN o.minimum_stay_nights ELSE n.minimum_stay_nights
+            END AS minimum_stay_nights,
+            CASE
+                WHEN o.room_id IS NOT NULL AND coalesce(n.cleaning_fee, 0) = 0
+                THEN o.cleaning_fee ELSE n.cleaning_fee
+            END AS cleaning_fee,
+            CASE WHEN o.room_id IS NOT NULL AND coalesce(n.currency, '') = '' THEN o.currency ELSE n.currency END AS currency,
+            CASE
+                WHEN o.room_id IS NOT NULL
+                THEN (
+                    coalesce(nullif(o.extra_attributes::jsonb, 'null'), '{{}}')
+                    || coalesce(nullif(n.extra_attributes::jsonb, 'null'), '{{}}')
+                )::json
+                ELSE n.extra_attributes
+            END AS extra_attributes,
+            coalesce(n.price_checked_at, o.price_checked_at) AS price_checked_at,
+            o.price_checked_at AS old_price_checked_at,
+            o.state AS old_state,
+            o.price AS old_price,
+            o.latest_prices_array AS old_latest_prices_array,
+            o.minimum_stay_nights AS old_minimum_stay_nights,
+            o.cleaning_fee AS old_cleaning_fee,
+            o.currency AS old_currency,
+            o.extra_attributes AS old_extra_attributes,
+            n.state IS DISTINCT FROM o.state AS state_change,
+            (
+                n.minimum_stay_nights IS DISTINCT FROM o.minimum_stay_nights
+                OR (
+                    coalesce(n.price, 0) <> 0
+                    AND (coalesce(o.price, 0) = 0 OR abs(o.price - n.price) / o.price >= %(price_change_tolerance_pct)s)
+                )
+                OR n.cleaning_fee IS DISTINCT FROM o.cleaning_fee
+                OR n.currency IS DISTINCT FROM o.currency
+            ) AS attributes_change
+        FROM new_days n
+        LEFT JOIN {CALENDAR_DAYS_TABLE} o ON o.room_id = n.room_id AND o.calendar_day = n.calendar_day
+    ),
+    merged AS (
+        SELECT
+            *,
+            array_remove(
+                ARRAY[
+                    CASE WHEN NOT is_stored OR state IS DISTINCT FROM old_state THEN 'state' END,
+                    CASE WHEN NOT is_stored OR price IS DISTINCT FROM old_price THEN 'price' END,
+                    CASE
+                        WHEN NOT is_stored
+                            OR nullif(nullif(latest_prices_array::jsonb, 'null'), '[]')
+                                IS DISTINCT FROM nullif(nullif(old_latest_prices_array::jsonb, 'null'), '[]')
+                        THEN 'latest_prices_array'
+                    END,
+                    CASE
+                        WHEN NOT is_stored OR minimum_stay_nights IS DISTINCT FROM old_minimum_stay_nights
+                        THEN 'minimum_stay_nights'
+                    END,
+                    CASE WHEN NOT is_stored OR cleaning_fee IS DISTINCT FROM old_cleaning_fee THEN 'cleaning_fee' END,
+                    CASE WHEN NOT is_stored OR currency IS DISTINCT FROM old_currency THEN 'currency' END,
+                    CASE
+                        WHEN NOT is_stored
+                            OR nullif(nullif(extra_attributes::jsonb, 'null'), '{{}}')
+                                IS DISTINCT FROM nullif(nullif(old_extra_attributes::jsonb, 'null'), '{{}}')
+                        THEN 'extra_attributes'
+                    END
+                ],
+                NULL
+            ) AS changed_fields
+        FROM compared
+    ),
+    upserted AS (
+        INSERT INTO {CALENDAR_DAYS_TABLE} (
+            room_id, calendar_day, created_at, state, price, latest_prices_array,
+            minimum_stay_nights, cleaning_fee, currency, extra_attributes, price_checked_at
+        )
+        SELECT
+            room_id, calendar_day, now(), state, price, latest_prices_array,
+            minimum_stay_nights, cleaning_fee, currency, extra_attributes, price_checked_at
+        FROM merged
+        WHERE cardinality(changed_fields) > 0
+        ON CONFLICT (room_id, calendar_day) DO UPDATE SET
+            state = excluded.state,
+            price = excluded.price,
+            latest_prices_array = excluded.latest_prices_array,
+            minimum_stay_nights = excluded.minimum_stay_nights,
+            cleaning_fee = excluded.cleaning_fee,
+            currency = excluded.currency,
+            extra_attributes = excluded.extra_attributes,
+            price_checked_at = excluded.price_checked_at,
+            updated_at = now()
+    ),
+    touched AS (
+        UPDATE {CALENDAR_DAYS_TABLE} d SET price_checked_at = m.price_checked_at
+        FROM merged m
+        WHERE d.room_id = m.room_id AND d.calendar_day = m.calendar_day
+            AND m.is_stored AND cardinality(m.changed_fields) = 0
+            AND m.price_checked_at IS DISTINCT FROM m.old_price_checked_at
+    )
+    SELECT
+        *,
+        CASE
+            WHEN NOT is_stored THEN 'NEW_DATE_RECORDED'
+            WHEN state_change THEN coalesce(old_state, 'None') || ' - ' || coalesce(state, 'None')
+            WHEN attributes_change THEN 'ATTRIBUTES_ONLY_CHANGE'
+            ELSE 'VALUE_ONLY_CHANGE'
+        END AS transition_type
+    FROM merged
+    WHERE cardinality(changed_fields) > 0
+"""
+
+MERGE_TRANSITIONS_SQL = f"""
+    INSERT INTO {JSON_BLOBS_TABLE} (content_hash, created_at, content)
+    SELECT DISTINCT ON (content_hash) content_hash, now(), content
+    FROM staging_json_blobs
+    ON CONFLICT (content_hash) DO NOTHING;
+
+    INSERT INTO {TRANSITION_DELTAS_TABLE} (
+        room_id, calendar_day, created_at, transition_type, changed_fields, state, price,
+        latest_prices_array_hash, minimum_stay_nights, cleaning_fee, currency, extra_attributes_hash
+    )
+    SELECT
+        room_id, calendar_day, now(), transition_type, changed_fields, state, price,
+        latest_prices_array_hash, minimum_stay_nights, cleaning_fee, currency, extra_attributes_hash
+    FROM staging_transition_deltas;
+"""
+
+
+_COPY_TEXT_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def to_copy_value(value):
+    """value as a field of COPY text format (null is \\N, json columns get their json text)"""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, default=str)
+    return str(value).translate(_COPY_TEXT_ESCAPES)
+
+
+def copy_rows(cursor, table_name, columns, rows):
+    """streams the rows (tuples in the order of columns) to table_name with one COPY FROM STDIN"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(to_copy_value(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    cursor.copy_expert(
+        f"COPY {table_name} ({', '.join(columns)}) FROM STDIN", buffer
+    )
+
+
+def get_dbapi_cursor(session):
+    """psycopg2 cursor of the connection (and transaction) of the session"""
+    return session.connection().connection.dbapi_connection.cursor()
+
+
+def create_staging_table(cursor, staging_table):
+    cursor.execute(f"DROP TABLE IF EXISTS {staging_table}")
+    cursor.execute(STAGING_TABLES_DDL[staging_table])
+
+
+def is_copy_backend_enabled(engine, write_backend=database_settings["write_backend"]):
+    """True if the workers should write with this module (see database_settings["write_backend"])"""
+    if write_backend == "auto":
+        return engine.dialect.name == "postgresql"
+    if write_backend == "copy" and engine.dialect.name != "postgresql":
+        raise ValueError(
+            f"the copy write backend needs postgresql, not '{engine.dialect.name}'"
+        )
+    return write_backend == "copy"
+
+
+def copy_save_or_update_airbnb_room_instances(instances, session):
+    """COPY version of models.bulk_save_or_update_airbnb_room_instances (same number_updates counting)"""
+    if not instances:
+        return
+    cursor = get_dbapi_cursor(session)
+    create_staging_table(cursor, "staging_rooms")
+    copy_rows(
+        cursor,
+        "staging_rooms",
+        ["seq", "id", "room_url", "extra_attributes"],
+        (
+            (seq, i.id, i.room_url, i.extra_attributes)
+            for seq, i in enumerate(instances)
+        ),
+    )
+    cursor.execute(MERGE_ROOMS_SQL)
+
+
+def copy_transition_deltas(cursor, transition_rows):
+    """COPY version of models.write_transition_deltas"""
+    delta_rows = []
+    json_blobs = {}
+    for transition_row in transition_rows:
+        delta_row, row_json_blobs = make_transition_delta_row(transition_row)
+        delta_rows.append(delta_row)
+        json_blobs.update(row_json_blobs)
+    if not delta_rows:
+        return
+    delta_columns = list(delta_rows[0].keys())
+    create_staging_table(cursor, "staging_json_blobs")
+    create_staging_table(cursor, "staging_transition_deltas")
+    copy_rows(
+        cursor,
+        "staging_json_blobs",
+        ["content_hash", "content"],
+        json_blobs.items(),
+    )
+    copy_rows(
+        cursor,
+        "staging_transition_deltas",
+        delta_columns,
+        ([delta_row[column] for column in delta_columns] for delta_row in delta_rows),
+    )
+    cursor.execute(MERGE_TRANSITIONS_SQL)
+
+
+def copy_save_or_update_airbnb_dates(
+    new_instances,
+    session,
+    price_change_tolerance_pct: float = 0.1,
+):
+    """
+    Postgres version of models.bulk_save_or_update_airbnb_dates for large batches:
+    1. the calendar days of the batch are streamed to a temp table with COPY FROM STDIN
+    2. one statement diffs them against the stored days, upserts the changed ones and returns them with their
+       transition type and changed fields (MERGE_CALENDAR_DAYS_SQL)
+    3. the transition deltas and their json blobs are streamed with COPY and appended set based
+
+    Args:
+        new_instances (list[AirBnbRoomCalendarDay | room_calendar.CalendarDayRow]): calendar days from current job run. if a day is present more than once, the last one is kept
+        session (Any): the db session. bound to a postgresql (psycopg2) engine
+        price_change_tolerance_pct (float, optional): see save_or_update_airbnb_date. Defaults to 0.1 [10%].
+
+    Returns:
+        the calendar day rows written and the stored rows they replaced ({(room_id, calendar_day): row}), e.g. for market_aggregates
+    """
+    if not new_instances:
+        return [], {}
+    cursor = get_dbapi_cursor(session)
+    create_staging_table(cursor, "staging_calendar_days")
+    copy_rows(
+        cursor,
+        "staging_calendar_days",
+        ["seq"] + CALENDAR_DAY_COLUMNS + CALENDAR_DAY_TOUCH_COLUMNS,
+        (
+            [seq]
+            + list(
+                model_to_row(i, CALENDAR_DAY_COLUMNS + CALENDAR_DAY_TOUCH_COLUMNS).values()
+            )
+            for seq, i in enumerate(new_instances)
+        ),
+    )
+    cursor.execute(
+        MERGE_CALENDAR_DAYS_SQL,
+        {"price_change_tolerance_pct": price_change_tolerance_pct},
+    )
+    column_names = [i.name for i in cursor.description]
+    merged_rows = [dict(zip(column_names, i)) for i in cursor.fetchall()]
+
+    calendar_day_rows = []
+    stored_rows_by_key = {}
+    transition_rows = []
+    for merged_row in merged_rows:
+        calendar_day_row = {
+            column: merged_row[column]
+            for column in CALENDAR_DAY_COLUMNS + CALENDAR_DAY_TOUCH_COLUMNS
+        }
+        calendar_day_rows.append(calendar_day_row)
+        if merged_row["is_stored"]:
+            stored_rows_by_key[(merged_row["room_id"], merged_row["calendar_day"])] = {
+                "room_id": merged_row["room_id"],
+                "calendar_day": merged_row["calendar_day"],
+                **{
+                    column: merged_row["old_" + column]
+                    for column in CALENDAR_DAY_VALUE_COLUMNS
+                },
+            }
+        transition_rows.append(
+            {
+                **calendar_day_row,
+                "transition_type": merged_row["transition_type"],
+                "changed_fields": merged_row["changed_fields"],
+            }
+        )
+    copy_transition_deltas(cursor, transition_rows)
+    logger.info(
+        "%s calendar days in batch: %s changed, %s transitions",
+        len(new_instances),
+        len(calendar_day_rows),
+        len(transition_rows),
+    )
+    return calendar_day_rows, stored_rows_by_key
@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+from typing import NamedTuple
+from enum import StrEnum
+
+from models import CalendarDayState
+from settings import price_probing_settings
+
+
+class PriceProbingStrategy(StrEnum):
+    FULL = "full"  # probe every available day
+    COVER_ONCE = "cover_once"  # minimal set of check-in days whose stays cover every available day
+    EVERY_K_DAYS = "every_k_days"  # probe an available day only if no day was probed in the previous k days
+
+
+class CalendarDayToProbe(NamedTuple):
+    calendar_day: object  # datetime.date
+    state: str
+    num_nights: int | None
+
+    @property
+    def stay_end(self):
+        """first day not covered by the shortest stay starting on this day"""
+        return self.calendar_day + timedelta(days=self.num_nights or 1)
+
+
+def get_fresh_days(
+    calendar_days,
+    stored_calendar_days,
+    price_ttl=timedelta(hours=price_probing_settings["price_ttl_hours"]),
+    now=None,
+):
+    """
+    Available days whose price does not need to be read again (incremental rescrape): the stored day has the same
+    state as the one just read, has a price and that price was read less than price_ttl ago.
+
+    :param stored_calendar_days: {calendar_day: stored row} of the room (see models.fetch_room_calendar_days)
+    :return: set of calendar days
+    """
+    now = now or datetime.now()
+    fresh_days = set()
+    for calendar_day in calendar_days:
+        stored_day = stored_calendar_days.get(calendar_day.calendar_day)
+        if (
+            calendar_day.state != CalendarDayState.AVAILABLE
+            or stored_day is None
+            or stored_day.state != calendar_day.state
+            or stored_day.price is None
+        ):
+            continue
+        price_checked_at = stored_day.price_checked_at
+        if price_checked_at and now - price_checked_at < price_ttl:
+            fresh_days.add(calendar_day.calendar_day)
+    return fresh_days
+
+
+def plan_cover_once(available_days, already_covered_days):
+    """
+    Greedy interval cover: takes the earliest available day which is not covered yet and probes, among the
+    days whose shortest stay contains it, the one whose stay ends last. This gives the minimal number of probes.
+    """
+    days_to_cover = sorted(
+        i.calendar_day
+        for i in available_days
+        if i.calendar_day not in already_covered_days
+    )
+    days_to_probe = []
+    covered_until = None
+    for day_to_cover in days_to_cover:
+        if covered_until is not None and day_to_cover < covered_until:
+            continue
+        best_day = max(
+            (
+                i
+                for i in available_days
+                if i.calendar_day <= day_to_cover < i.stay_end
+            ),
+            key=lambda i: i.stay_end,
+        )
+        days_to_probe.append(best_day.calendar_day)
+        covered_until = best_day.stay_end
+    return days_to_probe
+
+
+def plan_every_k_days(available_days, every_k_days):
+    days_to_probe = []
+    for available_day in sorted(available_days):
+        if (
+            not days_to_probe
+            or (available_day.calendar_day - days_to_probe[-1]).days >= every_k_days
+        ):
+            days_to_probe.append(available_day.calendar_day)
+    return days_to_probe
+
+
+def plan_price_probes(
+    calendar_days,
+    strategy=None,
+    already_covered_days=(),
+    fresh_days=(),
+    every_k_days=price_probing_settings["every_k_days"],
+):
+    """
+    Selects the days on which the check-in / check-out pricing clicks should be done.
+
+    :param calendar_days: CalendarDayToProbe of the days shown in the calendar table (state and min nights already read)
+    :param strategy: PriceProbingStrategy. defaults to price_probing_settings["strategy"]
+    :param already_covered_days: days which already got a price from a stay probed before (e.g. in the previous month)
+    :param fresh_days: days whose stored price is kept (see get_fresh_days). they do not need to be covered, but
+        with cover_once a stay starting on them can still be probed to cover other days
+    :return: set of the calendar days to probe
+    """
+    strategy = PriceProbingStrategy(strategy or price_probing_settings["strategy"])
+    available_days = [
+        i for i in calendar_days if i.state == CalendarDayState.AVAILABLE
+    ]
+    fresh_days = set(fresh_days)
+    stale_days = [i for i in available_days if i.calendar_day not in fresh_days]
+    if strategy == PriceProbingStrategy.FULL:
+        return {i.calendar_day for i in stale_days}
+    if strategy == PriceProbingStrategy.COVER_ONCE:
+        return set(
+            plan_cover_once(available_days, set(already_covered_days) | fresh_days)
+        )
+    return set(plan_every_k_days(stale_days, every_k_days))
@@ -0,0 +1,185 @@
+import time
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+
+from settings import rate_limiter_settings
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by all the scraper threads of the process, with an AIMD adjusted rate.
+
+    Every request to the site (page load, pagination click, pricing probe) takes a token first and reports its
+    latency and whether it failed. While the site keeps up, the rate grows additively (additive_increase_per_sec
+    every second the bucket is drained). When the moving average latency goes over target_latency_sec or the
+    error rate of the last window_size requests over max_error_rate, the rate is multiplied by decrease_factor,
+    at most once per decrease_cooldown_sec and only on requests started after the previous decrease.
+
+    The rate so settles just below the one the site starts to throttle at. Without it, all the threads would hit
+    the site at full speed and then wait for their timeouts together.
+
+    :Example:
+        with rate_limiter.request():
+            driver.get(url)
+    """
+
+    def __init__(
+        self,
+        initial_rate_per_sec=rate_limiter_settings["initial_rate_per_sec"],
+        min_rate_per_sec=rate_limiter_settings["min_rate_per_sec"],
+        max_rate_per_sec=rate_limiter_settings["max_rate_per_sec"],
+        burst=rate_limiter_settings["burst"],
+        additive_increase_per_sec=rate_limiter_settings["additive_increase_per_sec"],
+        decrease_factor=rate_limiter_settings["decrease_factor"],
+        target_latency_sec=rate_limiter_settings["target_latency_sec"],
+        max_error_rate=rate_limiter_settings["max_error_rate"],
+        window_size=rate_limiter_settings["window_size"],
+        min_window_size=rate_limiter_settings["min_window_size"],
+        latency_ewma_alpha=rate_limiter_settings["latency_ewma_alpha"],
+        decrease_cooldown_sec=rate_limiter_settings["decrease_cooldown_sec"],
+        clock=time.monotonic,
+        sleep=time.sleep,
+    ):
+        assert 0 < min_rate_per_sec <= initial_rate_per_sec <= max_rate_per_sec
+        assert 0 < decrease_factor < 1, f"decrease_factor must be in (0, 1), got {decrease_factor}"
+        self.rate = initial_rate_per_sec
+        self.min_rate_per_sec = min_rate_per_sec
+        self.max_rate_per_sec = max_rate_per_sec
+        self.burst = burst
+        self.additive_increase_per_sec = additive_increase_per_sec
+        self.decrease_factor = decrease_factor
+        self.target_latency_sec = target_latency_sec
+        self.max_error_rate = max_error_rate
+        self.min_window_size = min_window_size
+        self.latency_ewma_alpha = latency_ewma_alpha
+        self.decrease_cooldown_sec = decrease_cooldown_sec
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.tokens = burst
+        self.last_refill_at = clock()
+        self.last_decrease_at = None
+        self.window = deque(maxlen=window_size)  # is_error of the last requests
+        self.latency_ewma = None
+        self.num_requests = 0
+        self.num_errors = 0
+        self.num_decreases = 0
+        self.total_wait_sec = 0.0
+
+    @property
+    def current_rate(self):
+        """requests per second currently allowed"""
+        return self.rate
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill_at) * self.rate)
+        self.last_refill_at = now
+
+    def acquire(self):
+        """blocks until a token is available. returns the seconds waited"""
+        t0 = self.clock()
+        while True:
+            with self.lock:
+                now = self.clock()
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.total_wait_sec += now - t0
+                    return now - t0
+                wait_sec = (1 - self.tokens) / self.rate
+            self.sleep(wait_sec)  # the rate may change meanwhile, so the token is checked again
+
+    def get_error_rate(self):
+        if len(self.window) < self.min_window_size:
+            return 0.0
+        return sum(self.window) / len(self.window)
+
+    def record(self, latency_sec, is_error=False, started_at=None):
+        """
+        reports the outcome of a request and adjusts the rate. a request started (started_at, clock time) before the
+        last decrease only counts in the totals: it was sent at the old rate, whose congestion was already acted on
+        """
+        with self.lock:
+            now = self.clock()
+            self.num_requests += 1
+            self.num_errors += is_error
+            if (
+                started_at is not None
+                and self.last_decrease_at is not None
+                and started_at < self.last_decrease_at
+            ):
+                return
+            self.window.append(is_error)
+            self.latency_ewma = (
+                latency_sec
+                if self.latency_ewma is None
+                else self.latency_ewma_alpha * latency_sec
+                + (1 - self.latency_ewma_alpha) * self.latency_ewma
+            )
+            is_congested = len(self.window) >= self.min_window_size and (
+                self.latency_ewma > self.target_latency_sec
+                or self.get_error_rate() > self.max_error_rate
+            )
+            if is_congested:
+                self._decrease(now)
+            elif not is_error:
+                self._refill(now)
+                if self.tokens < 1:  # the limiter is what holds the threads back, so a higher rate can be tried
+                    # + additive_increase / rate per request: + additive_increase per second at the current rate
+                    self.rate = min(
+                        self.max_rate_per_sec,
+                        self.rate + self.additive_increase_per_sec / self.rate,
+                    )
+
+    def _decrease(self, now):
+        if (
+            self.last_decrease_at is not None
+            and now - self.last_decrease_at < self.decrease_cooldown_sec
+        ):
+            return
+        old_rate = self.rate
+        self.rate = max(self.min_rate_per_sec, self.rate * self.decrease_factor)
+        self.last_decrease_at = now
+        self.num_decreases += 1
+        logger.warning(
+            "site congested (latency %.1f sec, error rate %.0f%%). rate %.2f -> %.2f requests/sec",
+            self.latency_ewma,
+            self.get_error_rate() * 100,
+            old_rate,
+            self.rate,
+        )
+        # the next decision is taken on the requests made at the new rate
+        self.window.clear()
+        self.latency_ewma = None
+
+    @contextmanager
+    def request(self):
+        """takes a token, then records the latency of the block. any exception raised in the block is an error"""
+        self.acquire()
+        t0 = self.clock()
+        try:
+            yield
+        except Exception:
+            self.record(self.clock() - t0, is_error=True, started_at=t0)
+            raise
+        self.record(self.clock() - t0, started_at=t0)
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "rate_per_sec": round(self.rate, 3),
+                "latency_ewma_sec": self.latency_ewma and round(self.latency_ewma, 3),
+                "error_rate": round(self.get_error_rate(), 3),
+                "num_requests": self.num_requests,
+                "num_errors": self.num_errors,
+                "num_decreases": self.num_decreases,
+                "total_wait_sec": round(self.total_wait_sec, 1),
+            }
+
+
+# one limiter per process: every scraper thread goes through it
+rate_limiter = AdaptiveRateLimiter()
@@ -0,0 +1,190 @@
+from array import array
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+
+from models import CalendarDayState
+
+# code of each state in RoomCalendar.states. -1: no state
+_STATES = tuple(CalendarDayState)
+_STATE_CODES = {state: code for code, state in enumerate(_STATES)}
+_NO_STATE = -1
+_NO_NIGHTS = -1
+_NO_FEE = float("nan")
+
+
+class CalendarDayRow(NamedTuple):
+    """calendar day with the models.CALENDAR_DAY_COLUMNS and CALENDAR_DAY_TOUCH_COLUMNS, as read by bulk_save_or_update_airbnb_dates (model_to_row)"""
+
+    room_id: str
+    calendar_day: date
+    state: CalendarDayState | None
+    price: float | None
+    latest_prices_array: list
+    minimum_stay_nights: int | None
+    cleaning_fee: float | None
+    currency: str | None
+    extra_attributes: dict
+    price_checked_at: datetime | None
+
+
+class Stay(NamedTuple):
+    """shortest stay priced from a check-in day. one instance is shared by all the days it covers"""
+
+    check_in: date
+    check_out: date
+    price: float | None
+
+
+def _mean(prices):
+    valid_prices = [i for i in prices if i is not None and i == i]  # i == i: not nan
+    if not valid_prices:
+        return None
+    return sum(valid_prices) / len(valid_prices)
+
+
+class RoomCalendar:
+    """
+    Calendar of one room while it is scraped: one slot per day from first_day, with the typed fields in parallel
+    arrays (state codes, minimum nights, cleaning fees) and the sparse ones (stays, extra attributes, currencies)
+    in dicts by slot. Replaces a dict per day deep copied from a template.
+
+    It is put in the result queue as a whole: the rows to write are only built by the persistence writer
+    (to_rows, see expand_room_calendars).
+    """
+
+    __slots__ = (
+        "room_id",
+        "first_day",
+        "is_present",
+        "states",
+        "minimum_stay_nights",
+        "cleaning_fees",
+        "currencies",
+        "stays",
+        "extra_attributes",
+        "price_checked_at",
+    )
+
+    def __init__(self, room_id):
+        self.room_id = str(room_id)
+        self.first_day = None
+        self.is_present = bytearray()  # days seen on the calendar or covered by a stay
+        self.states = array("b")
+        self.minimum_stay_nights = array("i")
+        self.cleaning_fees = array("d")
+        self.currencies = {}  # {slot: currency}
+        self.stays = {}  # {slot: [Stay]}
+        self.extra_attributes = {}  # {slot: dict}
+        self.price_checked_at = None
+
+    def __len__(self):
+        return sum(self.is_present)
+
+    def _slot(self, day):
+        """slot of day, growing the arrays up to it"""
+        if self.first_day is None:
+            self.first_day = day
+        slot = (day - self.first_day).days
+        if slot < 0:
+            raise ValueError(f"{day} is before the first day of the calendar {self.first_day}")
+        missing_slots = slot + 1 - len(self.is_present)
+        if missing_slots > 0:
+            self.is_present.extend(bytes(missing_slots))
+            self.states.extend([_NO_STATE] * missing_slots)
+            self.minimum_stay_nights.extend([_NO_NIGHTS] * missing_slots)
+            self.cleaning_fees.extend([_NO_FEE] * missing_slots)
+        self.is_present[slot] = 1
+        return slot
+
+    def set_day(self, day, state, minimum_stay_nights):
+        slot = self._slot(day)
+        self.states[slot] = _NO_STATE if state is None else _STATE_CODES[state]
+        self.minimum_stay_nights[slot] = (
+            _NO_NIGHTS if minimum_stay_nights is None else minimum_stay_nights
+        )
+
+    def add_stay_pricing(self, check_in, num_nights, pricing_dict):
+        """
+        pricing of the shortest stay from check_in (see from_pricing_elements_to_pricing_dict):
+        the check-in day gets cleaning fee, currency and the other pricing items as extra attributes,
+        every day of the stay gets the stay and, if it has none yet, cleaning fee and currency
+        """
+        pricing_dict = dict(pricing_dict)
+        price = pricing_dict.pop("price", None)
+        cleaning_fee = pricing_dict.pop("cleaning_fee", None)
+        currency = pricing_dict.pop("currency", None)
+        check_in_slot = self._slot(check_in)
+        self.cleaning_fees[check_in_slot] = _NO_FEE if cleaning_fee is None else cleaning_fee
+        self.currencies[check_in_slot] = currency
+        self.extra_attributes[check_in_slot] = pricing_dict
+        stay = Stay(check_in, check_in + timedelta(days=num_nights), price)
+        for night_index in range(num_nights):
+            slot = self._slot(check_in + timedelta(days=night_index))
+            self.stays.setdefault(slot, []).append(stay)
+            # days covered by the stay but not probed themselves (see price_probing) get fee and currency of the stay
+            if self.cleaning_fees[slot] != self.cleaning_fees[slot]:  # nan: no fee yet
+                self.cleaning_fees[slot] = self.cleaning_fees[check_in_slot]
+            if self.currencies.get(slot) is None:
+                self.currencies[slot] = currency
+
+    def get_priced_days(self):
+        """days covered by at least one priced stay"""
+        return [self.first_day + timedelta(days=slot) for slot in self.stays]
+
+    def finish(self, price_checked_at=None):
+        """marks the calendar as scraped: price_checked_at (default: now) is the price_checked_at of the priced days"""
+        self.price_checked_at = price_checked_at or datetime.now().replace(
+            microsecond=0
+        )
+        return self
+
+    def to_rows(self):
+        """the present days as CalendarDayRow, in date order"""
+        rows = []
+        for slot, is_present in enumerate(self.is_present):
+            if not is_present:
+                continue
+            stays = self.stays.get(slot, [])
+            state_code = self.states[slot]
+            minimum_stay_nights = self.minimum_stay_nights[slot]
+            cleaning_fee = self.cleaning_fees[slot]
+            rows.append(
+                CalendarDayRow(
+                    room_id=self.room_id,
+                    calendar_day=self.first_day + timedelta(days=slot),
+                    state=None if state_code == _NO_STATE else _STATES[state_code],
+                    price=_mean([i.price for i in stays]),
+                    latest_prices_array=[
+                        {
+                            "check_in": i.check_in.strftime("%Y-%m-%d"),
+                            "check_out": i.check_out.strftime("%Y-%m-%d"),
+                            "price": i.price,
+                        }
+                        for i in stays
+                    ],
+                    minimum_stay_nights=(
+                        None if minimum_stay_nights == _NO_NIGHTS else minimum_stay_nights
+                    ),
+                    cleaning_fee=None if cleaning_fee != cleaning_fee else cleaning_fee,
+                    currency=self.currencies.get(slot),
+                    extra_attributes=self.extra_attributes.get(slot, {}),
+                    price_checked_at=self.price_checked_at if stays else None,
+                )
+            )
+        return rows
+
+
+def expand_room_calendars(objects):
+    """objects of a persistence writer batch with every RoomCalendar replaced by its rows"""
+    expanded_objects = []
+    for obj in objects:
+        if isinstance(obj, RoomCalendar):
+            expanded_objects.extend(obj.to_rows())
+        else:
+            expanded_objects.append(obj)
+    return expanded_objects
+
+
+def get_number_of_rows(obj):
+    """size of an object of the persistence writer queue (see PersistenceWriter object_size_function)"""
+    return len(obj) if isinstance(obj, RoomCalendar) else 1
@@ -0,0 +1,173 @@
+import time
+import logging
+import argparse
+from datetime import datetime, timedelta
+from typing import Any, NamedTuple
+
+from sqlalchemy import select, func, Integer
+from sqlalchemy.orm import Session
+
+from models import AirBnbScraperCampaign, AirBnbScraperRun
+
+logger = logging.getLogger(__name__)
+
+RUNS_TABLE = AirBnbScraperRun.__table__
+CAMPAIGNS_TABLE = AirBnbScraperCampaign.__table__
+
+
+def parse_campaign_args(description):
+    """--resume / --campaign-id options of the workers"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the campaign (default: the latest one of the scraper) skipping the items which already succeeded in it",
+    )
+    parser.add_argument(
+        "--campaign-id", default=None, help="campaign to start or resume"
+    )
+    return parser.parse_args()
+
+
+def new_campaign_id():
+    return datetime.now().strftime("%Y%m%dT%H%M%S")
+
+
+def fetch_campaign(session, scraper_name, campaign_id=None):
+    """saved campaign (row of airbnb_scraper_campaigns) of the scraper, by default the latest one it started. None if missing"""
+    query = select(CAMPAIGNS_TABLE).where(CAMPAIGNS_TABLE.c.scraper_name == scraper_name)
+    if campaign_id:
+        query = query.where(CAMPAIGNS_TABLE.c.campaign_id == campaign_id)
+    return session.execute(
+        query.order_by(CAMPAIGNS_TABLE.c.created_at.desc()).limit(1)
+    ).first()
+
+
+def start_campaign(engine, scraper_name, plan_items, resume=False, campaign_id=None):
+    """
+    New campaign (campaign_id if passed) of the items returned by plan_items(), saved before any of them is scraped.
+    With resume, the campaign_id or the latest campaign the scraper started is continued instead: its saved items
+    which did not succeed yet are scraped, and plan_items is not called. the resumed items are so the campaign's,
+    even if planning them again would give other ones (e.g. price bands counted again)
+
+    :return: campaign id, items to scrape
+    """
+    if resume:
+        with Session(engine) as session:
+            campaign = fetch_campaign(session, scraper_name, campaign_id)
+        if campaign is not None:
+            return campaign.campaign_id, get_items_to_resume(
+                engine, scraper_name, campaign.campaign_id, campaign.items
+            )
+        logger.warning("no saved campaign of %s to resume. starting a new one", scraper_name)
+    campaign_id = campaign_id or new_campaign_id()
+    items = list(plan_items())
+    with Session(engine) as session, session.begin():
+        session.merge(
+            AirBnbScraperCampaign(scraper_name=scraper_name, campaign_id=campaign_id, items=items)
+        )
+    return campaign_id, items
+
+
+def fetch_succeeded_items(session, scraper_name, campaign_id):
+    """keys (room ids or links, as strings) of the items which succeeded at least once in the campaign"""
+    return set(
+        session.scalars(
+            select(RUNS_TABLE.c.room_id)
+            .where(
+                RUNS_TABLE.c.scraper_name == scraper_name,
+                RUNS_TABLE.c.campaign_id == campaign_id,
+                RUNS_TABLE.c.is_success.is_(True),
+            )
+            .distinct()
+        )
+    )
+
+
+def get_items_to_resume(engine, scraper_name, campaign_id, items):
+    """items which did not succeed yet in the campaign (failed or never scraped), in their order"""
+    items = list(items)
+    with Session(engine) as session:
+        succeeded_items = fetch_succeeded_items(session, scraper_name, campaign_id)
+    items_to_resume = [i for i in items if str(i) not in succeeded_items]
+    logger.info(
+        "resuming campaign %s of %s: %s items already succeeded, %s to scrape",
+        campaign_id,
+        scraper_name,
+        len(items) - len(items_to_resume),
+        len(items_to_resume),
+    )
+    return items_to_resume
+
+
+def get_campaign_counts(session, scraper_name, campaign_id):
+    """{"succeeded": n, "failed": n} items of the campaign. an item failed if none of its runs succeeded"""
+    is_success_per_item = (
+        select(func.max(RUNS_TABLE.c.is_success.cast(Integer)).label("is_success"))
+        .where(
+            RUNS_TABLE.c.scraper_name == scraper_name,
+            RUNS_TABLE.c.campaign_id == campaign_id,
+        )
+        .group_by(RUNS_TABLE.c.room_id)
+        .subquery()
+    )
+    rows = session.execute(
+        select(is_success_per_item.c.is_success, func.count()).group_by(
+            is_success_per_item.c.is_success
+        )
+    ).all()
+    counts = {"succeeded": 0, "failed": 0}
+    for is_success, number_of_items in rows:
+        counts["succeeded" if is_success else "failed"] += number_of_items
+    return counts
+
+
+class ScraperRunEnd(NamedTuple):
+    """
+    a TaskOutcome to record in airbnb_scrapers_runs. it is put in the persistence writer queue after the objects of
+    the item, so it is committed in the same batch as them or after: a success is not recorded before the objects are written
+    """
+
+    scraper_name: str
+    campaign_id: str
+    outcome: Any  # task_scheduler.TaskOutcome
+    ended_at: float  # time.monotonic() when the task ended
+
+
+def make_scraper_run(scraper_name, campaign_id, outcome):
+    return ScraperRunEnd(scraper_name, campaign_id, outcome, time.monotonic())
+
+
+def split_scraper_runs(objects):
+    """(scraper run ends, other objects) of a persistence writer batch"""
+    scraper_runs = [i for i in objects if isinstance(i, ScraperRunEnd)]
+    other_objects = [i for i in objects if not isinstance(i, ScraperRunEnd)]
+    return scraper_runs, other_objects
+
+
+def save_scraper_runs(scraper_runs, session):
+    """
+    writes the AirBnbScraperRun of the ScraperRunEnd. their start and end times are on the database clock, like the
+    func.now() timestamps of the other tables: the database time now, less how long ago the task started and ended
+    """
+    if not scraper_runs:
+        return
+    database_now = session.scalar(select(func.now())).replace(tzinfo=None)
+    monotonic_now = time.monotonic()
+    for scraper_run in scraper_runs:
+        outcome = scraper_run.outcome
+        ended_at = database_now - timedelta(seconds=monotonic_now - scraper_run.ended_at)
+        session.add(
+            AirBnbScraperRun(
+                scraper_name=scraper_run.scraper_name,
+                room_id=str(outcome.item),
+                campaign_id=scraper_run.campaign_id,
+                created_at=ended_at - timedelta(seconds=outcome.duration_sec),
+                updated_at=ended_at,
+                is_success=outcome.is_success,
+                comment=outcome.error
+                if not outcome.is_success
+                else f"done in {outcome.duration_sec:.1f} sec",
+            )
+        )
+    session.flush()
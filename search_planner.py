@@ -0,0 +1,344 @@
+import os
+import json
+import logging
+from datetime import datetime
+from typing import NamedTuple
+
+from settings import price_band_planner_settings, search_tiling_settings
+from task_scheduler import run_bounded
+from selenium_airbnb_active_venice_links_scraper import (
+    MAX_PAGES,
+    MAX_HOMES_PER_PAGE,
+    PRICE_MIN,
+    PRICE_MAX,
+    AREA_NICKNAME,
+    NE_LAT,
+    NE_LNG,
+    SW_LAT,
+    SW_LNG,
+    ZOOM,
+    generate_search_link,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_ROOMS_PER_SEARCH = MAX_PAGES * MAX_HOMES_PER_PAGE
+
+
+class PriceBand(NamedTuple):
+    """one search price interval. number_of_rooms is None until it has been counted (or if counting failed)"""
+
+    price_min: int
+    price_max: int
+    number_of_rooms: int | None = None
+
+    @property
+    def width(self):
+        return self.price_max - self.price_min
+
+
+class BoundingBox(NamedTuple):
+    ne_lat: float
+    ne_lng: float
+    sw_lat: float
+    sw_lng: float
+
+    def quadrants(self):
+        """the four quarters of the box: north-east, north-west, south-east, south-west"""
+        mid_lat = (self.ne_lat + self.sw_lat) / 2
+        mid_lng = (self.ne_lng + self.sw_lng) / 2
+        return [
+            BoundingBox(self.ne_lat, self.ne_lng, mid_lat, mid_lng),
+            BoundingBox(self.ne_lat, mid_lng, mid_lat, self.sw_lng),
+            BoundingBox(mid_lat, self.ne_lng, self.sw_lat, mid_lng),
+            BoundingBox(mid_lat, mid_lng, self.sw_lat, self.sw_lng),
+        ]
+
+
+AREA_BOUNDING_BOX = BoundingBox(
+    float(NE_LAT), float(NE_LNG), float(SW_LAT), float(SW_LNG)
+)
+
+
+class SearchTile(NamedTuple):
+    """one geographic search box. zoom grows by one at every split (each quadrant is half as wide and high)"""
+
+    bounding_box: BoundingBox
+    zoom: int
+    depth: int = 0
+    number_of_rooms: int | None = None
+
+
+def make_uniform_price_bands(price_min, price_max, band_width):
+    return [
+        PriceBand(band_min, min(band_min + band_width, price_max))
+        for band_min in range(price_min, price_max, band_width)
+    ]
+
+
+def split_price_band(price_band):
+    middle = price_band.price_min + price_band.width // 2
+    return [
+        PriceBand(price_band.price_min, middle),
+        PriceBand(middle, price_band.price_max),
+    ]
+
+
+def merge_sparse_price_bands(price_bands, max_rooms_per_band):
+    """
+    Greedily merges neighbouring bands as long as their total number of rooms stays under max_rooms_per_band.
+    Bands which could not be counted are never merged.
+    """
+    merged_bands = []
+    for price_band in sorted(price_bands):
+        previous_band = merged_bands[-1] if merged_bands else None
+        if (
+            previous_band
+            and previous_band.number_of_rooms is not None
+            and price_band.number_of_rooms is not None
+            and previous_band.price_max == price_band.price_min
+            and previous_band.number_of_rooms + price_band.number_of_rooms
+            <= max_rooms_per_band
+        ):
+            merged_bands[-1] = PriceBand(
+                previous_band.price_min,
+                price_band.price_max,
+                previous_band.number_of_rooms + price_band.number_of_rooms,
+            )
+        else:
+            merged_bands.append(price_band)
+    return merged_bands
+
+
+def plan_price_bands(
+    count_rooms_at_link,
+    initial_price_bands=None,
+    max_workers=1,
+    initial_band_width=price_band_planner_settings["initial_band_width"],
+    min_band_width=price_band_planner_settings["min_band_width"],
+    merge_fill_ratio=price_band_planner_settings["merge_fill_ratio"],
+    max_rooms_per_band=MAX_ROOMS_PER_SEARCH,
+    bounding_box=None,
+    zoom=ZOOM,
+):
+    """
+    Adaptive replacement of the fixed PRICE_MIN..PRICE_MAX grid: every band of the frontier is counted
+    (in parallel, with run_bounded), bands over the max_rooms_per_band cap are bisected and counted again,
+    until every band fits or reached min_band_width. Neighbouring sparse bands are then merged, so that
+    each search fills at most merge_fill_ratio of the cap (leaving headroom for new listings).
+
+    :param count_rooms_at_link: function returning the number of rooms of a search link (e.g. get_number_of_rooms_at_link)
+    :param initial_price_bands: bands to start from, e.g. the plan saved by a previous run. defaults to wide uniform bands
+    :param bounding_box: search box of the bands (see plan_search_links). defaults to the area box
+    :return: list of counted PriceBand covering the price range, sorted by price
+    """
+    frontier = [
+        PriceBand(i.price_min, i.price_max)
+        for i in (
+            initial_price_bands
+            or make_uniform_price_bands(PRICE_MIN, PRICE_MAX, initial_band_width)
+        )
+    ]
+    planned_bands = []
+    number_of_searches = 0
+    while frontier:
+        outcomes = run_bounded(
+            frontier,
+            task_function=lambda price_band: count_rooms_at_link(
+                generate_search_link(
+                    price_band.price_min,
+                    price_band.price_max,
+                    bounding_box=bounding_box,
+                    zoom=zoom,
+                )
+            ),
+            max_workers=max_workers,
+        )
+        number_of_searches += len(outcomes)
+        frontier = []
+        for outcome in outcomes:
+            price_band = outcome.item._replace(
+                number_of_rooms=outcome.result if outcome.is_success else None
+            )
+            if (
+                price_band.number_of_rooms is not None
+                and price_band.number_of_rooms > max_rooms_per_band
+                and price_band.width >= 2 * min_band_width
+            ):
+                logger.info(
+                    "[%s - %s] %s rooms over the cap of %s. splitting band",
+                    price_band.price_min,
+                    price_band.price_max,
+                    price_band.number_of_rooms,
+                    max_rooms_per_band,
+                )
+                frontier += split_price_band(price_band)
+            else:
+                if (
+                    price_band.number_of_rooms is not None
+                    and price_band.number_of_rooms > max_rooms_per_band
+                ):
+                    logger.warning(
+                        "[%s - %s] %s rooms over the cap of %s but band can not be split further. you might be losing some information.",
+                        price_band.price_min,
+                        price_band.price_max,
+                        price_band.number_of_rooms,
+                        max_rooms_per_band,
+                    )
+                planned_bands.append(price_band)
+
+    planned_bands = merge_sparse_price_bands(
+        planned_bands, int(max_rooms_per_band * merge_fill_ratio)
+    )
+    logger.info(
+        "price band plan done with %s counting searches: %s bands, %s rooms",
+        number_of_searches,
+        len(planned_bands),
+        sum(i.number_of_rooms or 0 for i in planned_bands),
+    )
+    return planned_bands
+
+
+def get_price_band_plan_path(area_nickname=AREA_NICKNAME):
+    return price_band_planner_settings["plan_path_template"].format(
+        area=area_nickname.lower().replace(" ", "_")
+    )
+
+
+def save_price_band_plan(price_bands, area_nickname=AREA_NICKNAME):
+    plan_path = get_price_band_plan_path(area_nickname)
+    os.makedirs(os.path.dirname(plan_path), exist_ok=True)
+    with open(plan_path, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "area_nickname": area_nickname,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+                "price_bands": [i._asdict() for i in price_bands],
+            },
+            f,
+            indent=2,
+        )
+    logger.info("saved price band plan with %s bands to %s", len(price_bands), plan_path)
+
+
+def load_price_band_plan(area_nickname=AREA_NICKNAME):
+    """bands saved by the previous run, or None if there is no saved plan"""
+    plan_path = get_price_band_plan_path(area_nickname)
+    if not os.path.exists(plan_path):
+        return None
+    with open(plan_path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    return [PriceBand(**i) for i in plan["price_bands"]]
+
+
+def plan_search_tiles(
+    count_rooms_at_link,
+    bounding_box=AREA_BOUNDING_BOX,
+    zoom=int(ZOOM),
+    max_workers=1,
+    max_depth=search_tiling_settings["max_depth"],
+    max_rooms_per_tile=MAX_ROOMS_PER_SEARCH,
+):
+    """
+    Quadtree tiling of the search box: every tile of the frontier is counted over the whole PRICE_MIN..PRICE_MAX range,
+    tiles over the max_rooms_per_tile cap are split in four quadrants and counted again, down to max_depth.
+
+    :return: list of counted leaf SearchTile. tiles which are still over the cap at max_depth are returned as they are
+    """
+    frontier = [SearchTile(bounding_box, zoom)]
+    planned_tiles = []
+    number_of_searches = 0
+    while frontier:
+        outcomes = run_bounded(
+            frontier,
+            task_function=lambda search_tile: count_rooms_at_link(
+                generate_search_link(
+                    PRICE_MIN,
+                    PRICE_MAX,
+                    bounding_box=search_tile.bounding_box,
+                    zoom=search_tile.zoom,
+                )
+            ),
+            max_workers=max_workers,
+        )
+        number_of_searches += len(outcomes)
+        frontier = []
+        for outcome in outcomes:
+            search_tile = outcome.item._replace(
+                number_of_rooms=outcome.result if outcome.is_success else None
+            )
+            if (
+                search_tile.number_of_rooms is not None
+                and search_tile.number_of_rooms > max_rooms_per_tile
+                and search_tile.depth < max_depth
+            ):
+                logger.info(
+                    "[%s] %s rooms over the cap of %s. splitting tile in quadrants",
+                    search_tile.bounding_box,
+                    search_tile.number_of_rooms,
+                    max_rooms_per_tile,
+                )
+                frontier += [
+                    SearchTile(quadrant, search_tile.zoom + 1, search_tile.depth + 1)
+                    for quadrant in search_tile.bounding_box.quadrants()
+                ]
+            else:
+                planned_tiles.append(search_tile)
+    logger.info(
+        "search tiling done with %s counting searches: %s tiles, %s rooms",
+        number_of_searches,
+        len(planned_tiles),
+        sum(i.number_of_rooms or 0 for i in planned_tiles),
+    )
+    return planned_tiles
+
+
+def plan_search_links(
+    count_rooms_at_link,
+    bounding_box=AREA_BOUNDING_BOX,
+    zoom=int(ZOOM),
+    max_workers=1,
+    max_rooms_per_search=MAX_ROOMS_PER_SEARCH,
+):
+    """
+    Combines geographic tiling and price bands: the box is tiled with plan_search_tiles, tiles under the cap
+    become one search over the whole price range, tiles still over the cap at max depth are split by price
+    with plan_price_bands. Empty tiles and bands are dropped.
+
+    :return: deduplicated list of search links
+    """
+    search_links = {}
+    for search_tile in plan_search_tiles(
+        count_rooms_at_link,
+        bounding_box=bounding_box,
+        zoom=zoom,
+        max_workers=max_workers,
+        max_rooms_per_tile=max_rooms_per_search,
+    ):
+        if search_tile.number_of_rooms == 0:
+            continue
+        if (
+            search_tile.number_of_rooms is None
+            or search_tile.number_of_rooms <= max_rooms_per_search
+        ):
+            price_bands = [PriceBand(PRICE_MIN, PRICE_MAX)]
+        else:
+            price_bands = plan_price_bands(
+                count_rooms_at_link,
+                max_workers=max_workers,
+                max_rooms_per_band=max_rooms_per_search,
+                bounding_box=search_tile.bounding_box,
+                zoom=search_tile.zoom,
+            )
+        for price_band in price_bands:
+            if price_band.number_of_rooms == 0:
+                continue
+            search_link = generate_search_link(
+                price_band.price_min,
+                price_band.price_max,
+                bounding_box=search_tile.bounding_box,
+                zoom=search_tile.zoom,
+            )
+            search_links[search_link] = None
+    logger.info("planned %s search links", len(search_links))
+    return list(search_links)
@@ -13,19 +13,20 @@ import time
 # import traceback
 # import uuid
 # from datetime import datetime
-from bs4 import BeautifulSoup
 
 # from urllib import parse
 
 
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
 from selenium.common.exceptions import TimeoutException
 
 import settings
 import logging
 from my_webdriver import driver_setup
+from html_parsing import extract_room_links
+from rate_limiter import rate_limiter
+from dom_waits import wait_stats, wait_until
 
 
 from models import AirBnbRoom
@@ -33,19 +34,25 @@ from models import AirBnbRoom
 MAX_PAGES = 15
 MAX_HOMES_PER_PAGE = 18
 
-PRICE_MIN = 80
-PRICE_MAX = 800  # 800
-INCREMENT = 10  # calibrated to make sure we can scrape all the links.
+AREA_SETTINGS = settings.AREAS_SETTINGS["venice_center"]
+PRICE_MIN = AREA_SETTINGS["price_min_check"]
+PRICE_MAX = AREA_SETTINGS["price_max_check"]
+INCREMENT = AREA_SETTINGS["iteration_increment_price"]
 
 NUMBER_SEARCHES = math.ceil((PRICE_MAX - PRICE_MIN) / INCREMENT)
-NE_LAT = "45.459424294233266"
-NE_LNG = "12.388967004558651"
-SW_LAT = "45.40491437897474"
-SW_LNG = "12.300303903362362"
-ZOOM = "14"
-NUM_ADULTS = 2
-AREA_NICKNAME = "Venice Center"
+NE_LAT = AREA_SETTINGS["ne_lat"]
+NE_LNG = AREA_SETTINGS["ne_lng"]
+SW_LAT = AREA_SETTINGS["sw_lat"]
+SW_LNG = AREA_SETTINGS["sw_lng"]
+ZOOM = AREA_SETTINGS["zoom"]
+NUM_ADULTS = AREA_SETTINGS["num_adults_check"]
+AREA_NICKNAME = AREA_SETTINGS["area_nickname"]
 DEFAULT_LOAD_TIME_WAIT = 25
+NUMBER_OF_ROOMS_XPATH = """//*[@id="site-content"]/div/div[1]/div/div/div/section/h1/span"""
+# any element with a text node containing it, like the former check of the page source
+NO_EXACT_MATCHES_XPATH = """//*[text()[contains(., "No exact matches")]]"""
+NO_EXACT_MATCHES = "no_exact_matches"
+ROOMS_FOUND = "rooms_found"
 
 
 logging.basicConfig(level=logging.INFO)
@@ -59,29 +66,32 @@ def get_price_min_and_max_from_url(url):
     return price_min, price_max
 
 
+def get_search_results_state(driver):
+    """NO_EXACT_MATCHES or ROOMS_FOUND once the search page shows either, False before (a wait_until condition)"""
+    if driver.find_elements(By.XPATH, NO_EXACT_MATCHES_XPATH):
+        return NO_EXACT_MATCHES
+    if EC.text_to_be_present_in_element((By.XPATH, NUMBER_OF_ROOMS_XPATH), "homes")(driver):
+        return ROOMS_FOUND
+    return False
+
+
 def get_number_of_rooms_in_page(driver):
     price_min, price_max = get_price_min_and_max_from_url(driver.current_url)
-    if "No exact matches" in driver.page_source:
+    # with the "eager" page load strategy the results are not rendered yet when driver.get returns:
+    # a single wait for whichever shows up first, so an empty search does not wait for the timeout
+    search_results_state = wait_until(
+        driver,
+        get_search_results_state,
+        "search_number_of_rooms",
+        timeout_sec=DEFAULT_LOAD_TIME_WAIT,
+    )
+    if search_results_state == NO_EXACT_MATCHES:
         logger.warning(f"no houses at price level selected.")
         return None
-    num_rooms_text_exists = WebDriverWait(driver, DEFAULT_LOAD_TIME_WAIT).until(
-        EC.text_to_be_present_in_element(
-            (
-                By.XPATH,
-                """//*[@id="site-content"]/div/div[1]/div/div/div/section/h1/span""",
-            ),
-            "homes",
-        )
-    )
     num_rooms_text = (
-        driver.find_element(
-            By.XPATH,
-            """//*[@id="site-content"]/div/div[1]/div/div/div/section/h1/span""",
-        )
+        driver.find_element(By.XPATH, NUMBER_OF_ROOMS_XPATH)
         .text.replace(",", "")
         .replace(".", "")
-        if num_rooms_text_exists
-        else None
     )
     num_rooms_text_re = re.search("[0-9]+", num_rooms_text)
     if not num_rooms_text_re:
@@ -129,19 +139,53 @@ def get_lat_long_from_page(page_text):
     return lat, lng
 
 
-def generate_links_to_scrape():
-    iteractions_data_links = [
-        f"https://www.airbnb.com/s/Venice--Metropolitan-City-of-Venice--Italy/homes?adults={NUM_ADULTS}&min_bedrooms=1&min_beds=1&price_min={PRICE_MIN + iteration_seach * INCREMENT}&price_max={PRICE_MIN + iteration_seach * INCREMENT + INCREMENT}&room_types%5B%5D=Entire%20home%2Fapt&ne_lat={NE_LAT}&ne_lng={NE_LNG}&sw_lat={SW_LAT}&sw_lng={SW_LNG}&zoom={ZOOM}&search_by_map=true&search_type=user_map_move"
-        for iteration_seach in range(NUMBER_SEARCHES)
-    ]
-    return iteractions_data_links
+def generate_search_link(price_min, price_max, bounding_box=None, zoom=ZOOM):
+    """search link for a price interval. bounding_box (any object with ne_lat, ne_lng, sw_lat and sw_lng) defaults to the area box"""
+    if bounding_box is None:
+        ne_lat, ne_lng, sw_lat, sw_lng = NE_LAT, NE_LNG, SW_LAT, SW_LNG
+    else:
+        ne_lat, ne_lng = bounding_box.ne_lat, bounding_box.ne_lng
+        sw_lat, sw_lng = bounding_box.sw_lat, bounding_box.sw_lng
+    return f"https://www.airbnb.com/s/Venice--Metropolitan-City-of-Venice--Italy/homes?adults={NUM_ADULTS}&min_bedrooms=1&min_beds=1&price_min={price_min}&price_max={price_max}&room_types%5B%5D=Entire%20home%2Fapt&ne_lat={ne_lat}&ne_lng={ne_lng}&sw_lat={sw_lat}&sw_lng={sw_lng}&zoom={zoom}&search_by_map=true&search_type=user_map_move"
+
+
+def generate_links_to_scrape(price_bands=None):
+    """one search link per price band. defaults to the fixed grid from PRICE_MIN to PRICE_MAX in steps of INCREMENT.
+    price_bands can be e.g. the bands of an adaptive plan (search_planner.plan_price_bands), any objects with price_min and price_max.
+    """
+    if price_bands is None:
+        iteractions_data_links = [
+            generate_search_link(
+                PRICE_MIN + iteration_seach * INCREMENT,
+                PRICE_MIN + iteration_seach * INCREMENT + INCREMENT,
+            )
+            for iteration_seach in range(NUMBER_SEARCHES)
+        ]
+        return iteractions_data_links
+    return [generate_search_link(i.price_min, i.price_max) for i in price_bands]
+
+
+def get_number_of_rooms_at_link(link_to_get, driver=None):
+    """only loads the first page of a search and returns its number of rooms (None if it could not be read)"""
+    if driver is None:
+        driver = driver_setup()
+        try:
+            return get_number_of_rooms_at_link(link_to_get, driver=driver)
+        finally:
+            driver.quit()
+    with rate_limiter.request(), wait_stats.timed("search_page_load"):
+        driver.get(link_to_get)
+    return get_number_of_rooms_in_page_with_retry(driver, link_to_get)
 
 
 def get_number_of_room_pages(driver):
-    all_buttons = WebDriverWait(driver, DEFAULT_LOAD_TIME_WAIT).until(
+    all_buttons = wait_until(
+        driver,
         EC.visibility_of_all_elements_located(
             (By.XPATH, """//*[@id="site-content"]/div/div[3]/div/div/div/nav/div/a""")
-        )
+        ),
+        "search_page_buttons",
+        timeout_sec=DEFAULT_LOAD_TIME_WAIT,
     )
     page_num = [int(i.text) for i in all_buttons if i.text]
     return max(page_num)
@@ -150,9 +194,7 @@ def get_number_of_room_pages(driver):
 def get_all_room_links_from_page(driver):
     price_min, price_max = get_price_min_and_max_from_url(driver.current_url)
     page_source = driver.page_source
-    page_source_soup = BeautifulSoup(page_source, "html.parser")
-    meta_tags_temp = page_source_soup.find_all("meta", itemprop="url")
-    urls_temp = [i["content"] for i in meta_tags_temp]
+    urls_temp = extract_room_links(page_source)
     if len(urls_temp) == 0:
         current_url = driver.current_url
         logger.warning(
@@ -162,22 +204,56 @@ def get_all_room_links_from_page(driver):
     return urls_temp
 
 
+def get_number_of_pages_to_scrape(number_of_rooms_in_page):
+    """number of result pages airbnb will serve for a search with this many rooms"""
+    return min(MAX_PAGES, math.ceil(number_of_rooms_in_page / MAX_HOMES_PER_PAGE))
+
+
+def put_rooms_from_links(room_links, result_queue):
+    """puts one AirBnbRoom per room link in the result_queue"""
+    for room_url in room_links:
+        room_ids = re.findall(r"\/rooms\/(\w+)\?", room_url)
+        room_id = room_ids[0] if room_ids else None
+        if room_id:
+            current_room = AirBnbRoom(
+                id=room_id,
+                room_url=room_url,
+                extra_attributes={"area_nickname": AREA_NICKNAME},
+            )
+            result_queue.put(current_room)
+        else:
+            logger.warning(
+                f"No room_id found in url: {room_url}"
+            )  # known reason for this now is "Luxe" apartments which have different links. For now we ignore those.
+
+
 def get_next_button(driver):
-    next_button = WebDriverWait(driver, DEFAULT_LOAD_TIME_WAIT).until(
+    next_button = wait_until(
+        driver,
         EC.visibility_of_element_located(
             (
                 By.XPATH,
                 """//*[@id="site-content"]/div/div[3]/div/div/div/nav/div/a[2]""",
             )
-        )
+        ),
+        "search_next_button",
+        timeout_sec=DEFAULT_LOAD_TIME_WAIT,
     )
     return next_button
 
 
-def get_available_rooms_at_link(link_to_get, result_queue):
+def get_available_rooms_at_link(link_to_get, result_queue, driver=None):
+    """if no driver is passed (e.g. one checked out from a DriverPool), a new one is started and quit at the end"""
+    if driver is None:
+        driver = driver_setup()  # settings={'headless':False}
+        try:
+            return get_available_rooms_at_link(link_to_get, result_queue, driver=driver)
+        finally:
+            driver.quit()
+
     price_min, price_max = get_price_min_and_max_from_url(link_to_get)
-    driver = driver_setup()  # settings={'headless':False}
-    driver.get(link_to_get)
+    with rate_limiter.request(), wait_stats.timed("search_page_load"):
+        driver.get(link_to_get)
 
     number_of_rooms_in_page = get_number_of_rooms_in_page_with_retry(
         driver, link_to_get
@@ -210,34 +286,29 @@ def get_available_rooms_at_link(link_to_get, result_queue):
                 f"[{price_min} - {price_max}] Pushing Next button for the {i+1} time."
             )
             next_button = get_next_button(driver)
-            next_button.click()
-
-            # Wait appropriate time so that page is loaded
-            try:
-                _ = WebDriverWait(driver, DEFAULT_LOAD_TIME_WAIT).until(
-                    EC.visibility_of_element_located(
-                        (
-                            By.XPATH,
-                            """//*[@id="site-content"]/div/div[2]/div[1]/div/div/div/div[1]/div[1]/div/div[2]/div/div/div/div/a""",
-                        )
+            # the click loads the next page: it is throttled and its latency measured up to the page being loaded
+            with rate_limiter.request():
+                next_button.click()
+
+                # Wait appropriate time so that page is loaded
+                try:
+                    _ = wait_until(
+                        driver,
+                        EC.visibility_of_element_located(
+                            (
+                                By.XPATH,
+                                """//*[@id="site-content"]/div/div[2]/div[1]/div/div/div/div[1]/div[1]/div/div[2]/div/div/div/div/a""",
+                            )
+                        ),
+                        "search_next_page_loaded",
+                        timeout_sec=DEFAULT_LOAD_TIME_WAIT,
                     )
-                )
-            except:
-                logger.error(
-                    "failed to load page after hitting next page button. %s",
-                    driver.current_url,
-                )
-                raise ValueError("temp")
-
-    for room_url in full_list_of_room_links:
-        room_ids = re.findall(r"\/rooms\/(\w+)\?", room_url)
-        room_id = room_ids[0] if room_ids else None
-        if room_id:
-            current_room = AirBnbRoom(id=room_id, room_url=room_url)
-            result_queue.put(current_room)
-        else:
-            logger.warning(
-                f"No room_id found in url: {room_url}"
-            )  # known reason for this now is "Luxe" apartments which have different links. For now we ignore those.
+                except:
+                    logger.error(
+                        "failed to load page after hitting next page button. %s",
+                        driver.current_url,
+                    )
+                    raise ValueError("temp")
 
+    put_rooms_from_links(full_list_of_room_links, result_queue)
     return "ok"
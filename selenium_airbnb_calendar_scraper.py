@@ -1,38 +1,47 @@
-import time
-import numpy as np
 import math
-import re
-import copy
 import pandas as pd
 from datetime import datetime, timedelta
-from models import CalendarDayState, AirBnbRoomCalendarDay
+from models import CalendarDayState
 import logging
 
 from my_webdriver import driver_setup
+from rate_limiter import rate_limiter
+from dom_waits import wait_stats, wait_until, wait_for_popups, wait_for_calendar_months
+from calendar_parsing import (
+    parse_day_state,
+    parse_day_date,
+    parse_pricing_line,
+    get_calendar_day,
+)
+from room_calendar import RoomCalendar
+from price_probing import (
+    CalendarDayToProbe,
+    get_fresh_days,
+    plan_price_probes,
+)
+from dom_extraction import (
+    PRICING_FORM_SELECTOR,
+    CALENDAR_TABLE_DIV_SELECTOR,
+    extract_calendar_tables,
+    extract_table_cells,
+    extract_pricing_lines,
+)
 from selenium.webdriver.common.keys import Keys
 
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
 
 
-MAX_WAIT_FOR_TRANSLATION_ON_POPUP_SEC = 5
-MAX_WAIT_FOR_COOKIES_POPUP_SEC = 5
+POPUP_SELECTORS = {
+    "translation": ".p1psejvv.atm_9s_1bgihbq.dir.dir-ltr",
+    "cookies_banner": '[data-testid="main-cookies-banner-container"]',
+}
 NUMBER_ON_MONTHS_IN_FUTURE_TO_CHECK = 6
 MONTHS_PRESENT_IN_ONE_ELEMENT = 4
-TIME_SLEEP_AFTER_CAL_NEXT_CLICK_SEC = 0.2
 NUMBER_CAL_FETCHES_NEEDED = math.ceil(
     NUMBER_ON_MONTHS_IN_FUTURE_TO_CHECK / MONTHS_PRESENT_IN_ONE_ELEMENT
 )
-CALENDAR_DAYS_DETAILS_EMPTY_TEMPLATE = {
-    "current_date_state": None,
-    "minimum_stay_nights": None,
-    "latest_prices_array": [],
-    "cleaning_fee": None,
-    "currency": None,
-    "extra_attributes": {},
-    "price": None,
-}
 
 logging.basicConfig(
     level=logging.INFO,
@@ -43,71 +52,62 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def close_translation_popup_if_exists(driver, room_id):
-    try:
-        # Wait for the element to be present
-        element = WebDriverWait(driver, MAX_WAIT_FOR_TRANSLATION_ON_POPUP_SEC).until(
-            EC.presence_of_element_located(
-                (By.CSS_SELECTOR, ".p1psejvv.atm_9s_1bgihbq.dir.dir-ltr")
-            )
-        )
-        active_element = driver.switch_to.active_element
-        active_element.send_keys(Keys.ESCAPE)
-    except:
-        logger.info("[%s] No 'Transaction on' form was found", room_id)
+def close_translation_popup(driver):
+    active_element = driver.switch_to.active_element
+    active_element.send_keys(Keys.ESCAPE)
 
 
-def close_cookie_banner_if_exists(driver, room_id):
-    try:
-        # Wait for the element to be present
-        element = WebDriverWait(driver, MAX_WAIT_FOR_TRANSLATION_ON_POPUP_SEC).until(
-            EC.presence_of_element_located(
-                (By.CSS_SELECTOR, '[data-testid="main-cookies-banner-container"]')
-            )
-        )
-        element.find_element(By.CSS_SELECTOR, '[type="button"]').click()
-    except:
-        logger.info("[%s] No 'cookies banner' form was found", room_id)
+def close_cookie_banner(driver):
+    element = driver.find_element(By.CSS_SELECTOR, POPUP_SELECTORS["cookies_banner"])
+    element.find_element(By.CSS_SELECTOR, '[type="button"]').click()
 
 
-def parse_date(date_string):
-    # Define the format of the input string
-    # %d: Day of the month as a zero-padded decimal number.
-    # %A: Full weekday name.
-    # %B: Full month name.
-    # %Y: Year with century as a decimal number.
-    date_format = "%d, %A, %B %Y"
-    if "Today" in date_string:
-        date_string = date_string.rsplit(",", 1)[0]
-    # Parse the date string into a datetime object
-    parsed_date = datetime.strptime(date_string, date_format).date()
+def close_popups_if_exist(driver, room_id):
+    """
+    the popups are looked for together and only until shortly after the calendar is there,
+    instead of waiting for each of them up to its timeout when it does not show up
+    """
+    popups_found = wait_for_popups(
+        driver, POPUP_SELECTORS, page_ready_selector=CALENDAR_TABLE_DIV_SELECTOR
+    )
+    logger.info("[%s] popups found: %s", room_id, sorted(popups_found) or None)
+    for popup_name, close_popup in (
+        ("translation", close_translation_popup),
+        ("cookies_banner", close_cookie_banner),
+    ):
+        if popup_name in popups_found:
+            try:
+                close_popup(driver)
+            except Exception as ex:
+                logger.warning(
+                    "[%s] failed to close the %s popup: %s",
+                    room_id,
+                    popup_name,
+                    type(ex).__name__,
+                )
 
-    return parsed_date
+
+def parse_date(date_string):
+    """'1, Thursday, August 2024' -> date. see calendar_parsing.get_calendar_day to avoid parsing every label"""
+    return parse_day_date(date_string)
 
 
 def get_calendar_table_from_driver(driver):
-    tables = WebDriverWait(driver, 10).until(
-        EC.presence_of_all_elements_located((By.CSS_SELECTOR, "._cvkwaj"))
+    tables = wait_until(
+        driver,
+        EC.presence_of_all_elements_located((By.CSS_SELECTOR, "._cvkwaj")),
+        "calendar_tables",
     )
     all_tables_data = []  # Initialize list to store all data
 
-    # Iterate through each table
+    # one execute_script per table instead of one find_elements per row and one get_attribute per cell
     for table in tables:
-        # Extract rows from the current table
-        rows = table.find_elements(By.TAG_NAME, "tr")
-
-        # Initialize list to store data for the current table
-
-        # Iterate through rows and extract cell data
-        for row in rows:
-            cells = row.find_elements(By.TAG_NAME, "td")
-            for cell in cells:
-                # Extract desired attributes
-                cell_data = {
-                    "aria-disabled": cell.get_attribute("aria-disabled"),
-                    "aria-label": cell.get_attribute("aria-label"),
-                }
-                all_tables_data.append(cell_data)
+        for cell in extract_table_cells(driver, table):
+            cell_data = {
+                "aria-disabled": cell.aria_disabled,
+                "aria-label": cell.aria_label,
+            }
+            all_tables_data.append(cell_data)
     return all_tables_data
 
 
@@ -127,20 +127,22 @@ def clear_dates(driver):
 
 
 def get_two_visible_tables(driver, old_visible_table_one_string, room_id):
+    """returns the month string of the first visible table and the two visible CalendarTable (with their cells)"""
     visible_table_names = []
     visible_table_index = 0
-    tables_divs = WebDriverWait(driver, 10).until(
-        EC.presence_of_all_elements_located((By.CSS_SELECTOR, "._ytfarf"))
+    wait_until(
+        driver,
+        EC.presence_of_all_elements_located(
+            (By.CSS_SELECTOR, CALENDAR_TABLE_DIV_SELECTOR)
+        ),
+        "calendar_tables",
     )
     first_visible_table = None
     second_visible_table = None
     visible_table_one_string = None
-    for table_div in tables_divs:
-        month_string = (
-            table_div.find_element(By.CLASS_NAME, "_1qlawxx")
-            .find_element(By.TAG_NAME, "h3")
-            .text
-        )
+    # month headers, visibility and the cells of the visible months are read with a single execute_script
+    for calendar_table in extract_calendar_tables(driver):
+        month_string = calendar_table.month_header
         if month_string == old_visible_table_one_string:
             logger.info(
                 "[%s] found again as same table one the old table one. likely did not sleep enough before NEXT table button was pressed and this tables check was made",
@@ -158,12 +160,11 @@ def get_two_visible_tables(driver, old_visible_table_one_string, room_id):
                 visible_table_index,
                 month_string,
             )
-            table = table_div.find_element(By.TAG_NAME, "table")
             if visible_table_index == 1:
-                first_visible_table = table
+                first_visible_table = calendar_table
                 visible_table_one_string = month_string
             elif visible_table_index == 2:
-                second_visible_table = table
+                second_visible_table = calendar_table
             else:
                 raise ValueError(
                     "[%s] There are more than 2 visible tables: %s",
@@ -174,48 +175,7 @@ def get_two_visible_tables(driver, old_visible_table_one_string, room_id):
 
 
 def parse_from_day_button_aria_label_to_state(date_button_aria_label):
-    patterns = {
-        CalendarDayState.UNAVAILABLE: [re.compile(r"\bunavailable\b", re.IGNORECASE)],
-        CalendarDayState.AVAILABLE: [
-            re.compile(
-                r"\bavailable\b.*?(\d+)\s*-?\s*night.*?\bminimum\b", re.IGNORECASE
-            ),
-            re.compile(r"\bavailable\b.*?\bselect\b.*?\bdate\b", re.IGNORECASE),
-        ],
-        CalendarDayState.AVAILABLE_NO_CHECKOUT_DATE: [
-            re.compile(
-                r"\bavailable\b.*?\bno\b.*?\beligible\b.*?\bcheckout\b.*?(\d+)\s*-?\s*night\b",
-                re.IGNORECASE,
-            )
-        ],
-        CalendarDayState.CHECKOUT_ONLY: [
-            re.compile(
-                r"\bthis\s+day\s+is\s+only\s+available\s+for\s+checkout\b",
-                re.IGNORECASE,
-            )
-        ],
-        CalendarDayState.UNAVAILABLE_DUE_TO_PAST_DATE: [
-            re.compile(r"\bpast\s+dates?\s+can’t\s+be\s+selected\b", re.IGNORECASE)
-        ],
-    }
-
-    for current_date_state, patterns in patterns.items():
-        for pattern in patterns:
-            match = pattern.search(date_button_aria_label)
-            if match:
-                num_nights = (
-                    int(match.group(1))
-                    if match.lastindex
-                    else (1 if CalendarDayState.AVAILABLE else None)
-                )
-                return current_date_state, num_nights
-
-    logger.error(
-        f"Input string does not match any known patterns: {date_button_aria_label}"
-    )
-    raise ValueError(
-        f"Input string does not match any known patterns: {date_button_aria_label}"
-    )
+    return parse_day_state(date_button_aria_label)
 
 
 def first_day_of_month(date):
@@ -224,233 +184,12 @@ def first_day_of_month(date):
 
 
 def get_all_cells_from_table(table):
-    all_cells = []
-    for row in table.find_elements(By.TAG_NAME, "tr"):
-        cells = row.find_elements(By.TAG_NAME, "td")
-        all_cells += [cell for cell in cells if cell.get_attribute("aria-label")]
-    return all_cells
-
-
-import re
+    """CalendarCell of every day (cells with an aria-label) of a table WebElement. one execute_script"""
+    return extract_table_cells(table.parent, table)
 
 
 def parse_pricing_from_pricing_form(input_string, num_nights):
-    # Define extended currency symbols
-    currency_symbols = r"[\€\$\£\¥\₹\₩\₽\₺\₴\฿\₵\₦\₫\₪\₱\₲\₡\₣\₭\₮]"
-
-    # Initialize default return values
-    result = {
-        "description": "other",
-        "amount": None,
-        "currency": None,
-        "extra": input_string.strip(),
-    }
-
-    # Convert to lowercase for case-insensitive matching
-    lower_input = input_string.lower()
-
-    # Check for early_bird_discount pattern
-    if (
-        ("early" in lower_input)
-        and ("bird" in lower_input)
-        and ("discount" in lower_input)
-    ):
-        # Extract currency symbol if present
-        currency_match = re.search(currency_symbols, input_string)
-        currency = currency_match.group(0) if currency_match else None
-
-        # Extract amount
-        amount_match = re.search(r"(\d+[\d,]*)", input_string)
-        amount = int(amount_match.group(1).replace(",", "")) if amount_match else None
-
-        if amount is not None:
-            result.update(
-                {
-                    "description": "early_bird_discount",
-                    "amount": amount,
-                    "currency": currency,
-                    "extra": "",
-                }
-            )
-            return result
-
-    # Check for last_minute_discount pattern
-    if (
-        ("last" in lower_input)
-        and ("minute" in lower_input)
-        and ("discount" in lower_input)
-    ):
-        # Extract currency symbol if present
-        currency_match = re.search(currency_symbols, input_string)
-        currency = currency_match.group(0) if currency_match else None
-
-        # Extract amount
-        amount_match = re.search(r"(\d+[\d,]*)", input_string)
-        amount = int(amount_match.group(1).replace(",", "")) if amount_match else None
-
-        if amount is not None:
-            result.update(
-                {
-                    "description": "last_minute_discount",
-                    "amount": amount,
-                    "currency": currency,
-                    "extra": "",
-                }
-            )
-            return result
-
-    # Check for accommodation_nightly pattern
-    if "accommodation" in lower_input:
-        # Extract currency symbol if present
-        currency_match = re.search(currency_symbols, input_string)
-        currency = currency_match.group(0) if currency_match else None
-
-        # Extract amount
-        amount_match = re.search(r"(\d+[\d,]*)", input_string)
-        amount = int(amount_match.group(1).replace(",", "")) if amount_match else None
-
-        if amount is not None:
-            result.update(
-                {
-                    "description": "accommodation_nightly",
-                    "amount": amount / num_nights,
-                    "currency": currency,
-                    "extra": "",
-                }
-            )
-            return result
-
-    # Check for airbnb_service_fee pattern
-    if (("airbnb" in lower_input) and ("service" in lower_input) and ("fee" in lower_input)):
-        # Extract currency symbol if present
-        currency_match = re.search(currency_symbols, input_string)
-        currency = currency_match.group(0) if currency_match else None
-
-        # Extract amount
-        amount_match = re.search(r"(\d+[\d,]*)", input_string)
-        amount = int(amount_match.group(1).replace(",", "")) if amount_match else None
-
-        if amount is not None:
-            result.update(
-                {
-                    "description": "airbnb_service_fee",
-                    "amount": amount,
-                    "currency": currency,
-                    "extra": "",
-                }
-            )
-            return result
-
-    # Check for night_price pattern
-    if "night" in lower_input:
-        # Extract currency symbol if present
-        currency_match = re.search(currency_symbols, input_string)
-        currency = currency_match.group(0) if currency_match else None
-
-        # Extract amount
-        amount_match = re.search(r"(\d+[\d,]*)", input_string)
-        amount = int(amount_match.group(1).replace(",", "")) if amount_match else None
-
-        if amount is not None:
-            result.update(
-                {
-                    "description": "night_price",
-                    "amount": amount,
-                    "currency": currency,
-                    "extra": "",
-                }
-            )
-            return result
-
-    # Check for weekly_discount pattern
-    if ("weekly" in lower_input) and ("discount" in lower_input):
-        # Extract currency symbol if present
-        currency_match = re.search(currency_symbols, input_string)
-        currency = currency_match.group(0) if currency_match else None
-
-        # Extract amount
-        amount_match = re.search(r"(\d+[\d,]*)", input_string)
-        amount = int(amount_match.group(1).replace(",", "")) if amount_match else None
-
-        if amount is not None:
-            result.update(
-                {
-                    "description": "weekly_discount",
-                    "amount": amount,
-                    "currency": currency,
-                    "extra": "",
-                }
-            )
-            return result
-
-    # Check for monthly_discount pattern
-    if ("monthly" in lower_input) and ("discount" in lower_input):
-        # Extract currency symbol if present
-        currency_match = re.search(currency_symbols, input_string)
-        currency = currency_match.group(0) if currency_match else None
-
-        # Extract amount
-        amount_match = re.search(r"(\d+[\d,]*)", input_string)
-        amount = int(amount_match.group(1).replace(",", "")) if amount_match else None
-
-        if amount is not None:
-            result.update(
-                {
-                    "description": "monthly_discount",
-                    "amount": amount,
-                    "currency": currency,
-                    "extra": "",
-                }
-            )
-            return result
-
-    # Check for cleaning_fee pattern
-    if "cleaning" in lower_input:
-        # Extract currency symbol if present
-        currency_match = re.search(currency_symbols, input_string)
-        currency = currency_match.group(0) if currency_match else None
-
-        # Extract amount
-        amount_match = re.search(r"(\d+[\d,]*)", input_string)
-        amount = int(amount_match.group(1).replace(",", "")) if amount_match else None
-
-        if amount is not None:
-            result.update(
-                {
-                    "description": "cleaning_fee",
-                    "amount": amount,
-                    "currency": currency,
-                    "extra": "",
-                }
-            )
-            return result
-
-    # Check for taxes pattern
-    if "taxes" in lower_input:
-        # Extract currency symbol if present
-        currency_match = re.search(currency_symbols, input_string)
-        currency = currency_match.group(0) if currency_match else None
-
-        # Extract amount
-        amount_match = re.search(r"(\d+[\d,]*)", input_string)
-        amount = int(amount_match.group(1).replace(",", "")) if amount_match else None
-
-        if amount is not None:
-            result.update(
-                {
-                    "description": "taxes",
-                    "amount": amount,
-                    "currency": currency,
-                    "extra": "",
-                }
-            )
-            return result
-
-    # If no match, return 'other'
-    logger.warning(
-        "We did not find any matching pattern in the input string: %s", input_string
-    )
-    return result
+    return parse_pricing_line(input_string, num_nights)
 
 
 def from_pricing_elements_to_pricing_dict(pricing_parsed_elements):
@@ -494,21 +233,6 @@ def from_pricing_elements_to_pricing_dict(pricing_parsed_elements):
     return pricing_dictionary_clean
 
 
-def calculate_mean(prices):
-    # Convert list to numpy array for handling nan values
-    prices_array = np.array(prices, dtype=float)
-
-    # Filter out None and nan values
-    valid_prices = prices_array[~np.isnan(prices_array)]
-
-    # Check if there are valid prices
-    if len(valid_prices) == 0:
-        return None
-
-    # Return the mean of valid prices
-    return np.mean(valid_prices)
-
-
 def get_two_visible_tables_with_retry(
     driver,
     old_visible_table_one_string,
@@ -517,7 +241,8 @@ def get_two_visible_tables_with_retry(
     max_retries=3,
 ):
     """
-    Retries to get two visible tables with sleep in between.
+    Retries to get two visible tables, waiting in between (up to sleep_after_retry_sec) for two months
+    other than old_visible_table_one_string to be visible.
     """
     retries = 0
     while retries < max_retries:
@@ -531,7 +256,15 @@ def get_two_visible_tables_with_retry(
         logger.info(
             "[%s] Not found visible tables on iteration %d", room_id, retries + 1
         )
-        time.sleep(sleep_after_retry_sec)
+        try:
+            wait_for_calendar_months(
+                driver,
+                old_visible_table_one_string,
+                name="calendar_months_retry",
+                timeout_sec=sleep_after_retry_sec,
+            )
+        except TimeoutException:
+            pass
         retries += 1
 
     # Final attempt
@@ -541,11 +274,19 @@ def get_two_visible_tables_with_retry(
     return visible_table_one_string, first_visible_table, second_visible_table
 
 
-def next_month(driver):
+def next_month(driver, old_visible_table_one_string=None):
+    """clicks the next month button and waits for the calendar to show the next months"""
     next_month_button = driver.find_element(
         By.XPATH, '//button[contains(@aria-label, "forward to")]'
     )
-    next_month_button.click()
+    try:
+        with rate_limiter.request():
+            next_month_button.click()
+            wait_for_calendar_months(
+                driver, old_visible_table_one_string, name="calendar_next_month"
+            )
+    except TimeoutException:
+        logger.warning("calendar still on %s after the next month click", old_visible_table_one_string)
 
 
 def get_state_and_num_min_nights_of_given_date(
@@ -558,16 +299,18 @@ def get_state_and_num_min_nights_of_given_date(
 ):
     is_check_in_date = "Select as check-in date" in date_button_aria_label
     if is_check_in_date:
-        first_table_cell.click()
+        first_table_cell.element.click()
         try:
-            current_date_button = first_visible_table.find_element(
+            current_date_button = first_visible_table.element.find_element(
                 By.XPATH, ".//td[contains(@aria-label, 'Selected check-in date')]"
             )
         except:
-            current_date_button = WebDriverWait(driver, 10).until(
+            current_date_button = wait_until(
+                driver,
                 EC.presence_of_element_located(
                     (By.XPATH, ".//td[contains(@aria-label, 'Selected check-in date')]")
-                )
+                ),
+                "check_in_selected",
             )
         clear_dates(driver)
         current_date_button_aria_label = current_date_button.get_attribute("aria-label")
@@ -616,7 +359,7 @@ def get_smallest_stay_interval_and_pricing_dict(
                 )
             if not second_visible_table_cells:
                 second_visible_table_cells = get_all_cells_from_table(
-                    second_visible_table
+                    second_visible_table.element
                 )
                 if verbose:
                     logger.info(
@@ -629,9 +372,9 @@ def get_smallest_stay_interval_and_pricing_dict(
                 new_month_checkout_date_index
             ]
             logger.info(
-                '[%s] checkout_date_button_to_click.get_attribute("aria-label"): %s',
+                "[%s] checkout_date_button_to_click.aria_label: %s",
                 room_id,
-                checkout_date_button_to_click.get_attribute("aria-label"),
+                checkout_date_button_to_click.aria_label,
             )
 
         else:
@@ -640,18 +383,19 @@ def get_smallest_stay_interval_and_pricing_dict(
             ]
 
         ### click on the check-in and check-out dates. Then get pricing info
-        first_table_cell.click()
-        checkout_date_button_to_click.click()
-        pricing_form_divs = WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, "._1n7cvm7"))
-        )
-        pricing_elements = pricing_form_divs.find_elements(By.CLASS_NAME, "_14omvfj")
+        # the pricing of the stay is requested to the site: throttled, latency measured up to the form being shown
+        with rate_limiter.request():
+            first_table_cell.element.click()
+            checkout_date_button_to_click.element.click()
+            wait_until(
+                driver,
+                EC.presence_of_element_located((By.CSS_SELECTOR, PRICING_FORM_SELECTOR)),
+                "pricing_form",
+            )
         pricing_parsed_elements = []
-        for pricing_element in pricing_elements:
+        for pricing_line in extract_pricing_lines(driver) or []:
             pricing_parsed_elements.append(
-                parse_pricing_from_pricing_form(
-                    pricing_element.text, num_nights=num_nights
-                )
+                parse_pricing_from_pricing_form(pricing_line, num_nights=num_nights)
             )
         if verbose:
             logger.info(
@@ -676,86 +420,41 @@ def get_smallest_stay_interval_and_pricing_dict(
     return pricing_dict, second_visible_table_cells
 
 
-def enrich_calendar_days_details_if_data_is_available(
-    calendar_days_details_empty_template,
-    current_date_state,
-    pricing_dict,
-    calendar_days_details,
-    date_button_date,
-    num_nights,
+def get_calendar_days_for_provided_room(
+    room_id,
+    result_queue,
+    headless=True,
+    driver=None,
+    price_probing_strategy=None,
+    stored_calendar_days=None,
 ):
-    if current_date_state == CalendarDayState.AVAILABLE:
-        current_price = pricing_dict.get("price")
-        pricing_dict.pop("price", None)
-        calendar_days_details[date_button_date]["cleaning_fee"] = pricing_dict.get(
-            "cleaning_fee"
-        )
-        pricing_dict.pop("cleaning_fee", None)
-        calendar_days_details[date_button_date]["currency"] = pricing_dict.get(
-            "currency"
-        )
-        pricing_dict.pop("currency", None)
-        calendar_days_details[date_button_date]["extra_attributes"] = pricing_dict
-        for next_day_index in range(0, num_nights):
-            list_to_append = [
-                {
-                    "check_in": date_button_date,
-                    "check_out": (date_button_date + timedelta(days=num_nights)),
-                    "price": current_price,
-                }
-            ]
-            future_day_date = date_button_date + timedelta(days=next_day_index)
-            if future_day_date not in calendar_days_details:
-                calendar_days_details[future_day_date] = copy.deepcopy(
-                    calendar_days_details_empty_template
-                )
-            calendar_days_details[future_day_date][
-                "latest_prices_array"
-            ] += list_to_append
-    return calendar_days_details, pricing_dict
-
-
-def generate_airbnb_calendar_day_list(calendar_days_details, ROOM_ID):
-    def make_json_serializable_prices_array(prices_array):
-        serializable = []
-        for price_details in prices_array:
-            price_details["check_in"] = price_details["check_in"].strftime("%Y-%m-%d")
-            price_details["check_out"] = price_details["check_out"].strftime("%Y-%m-%d")
-            serializable.append(price_details)
-        return serializable
-
-    calendar_days_details_models = []
-    for date, date_details in calendar_days_details.items():
-        airbnb_calendar_day = AirBnbRoomCalendarDay(
-            room_id=ROOM_ID,
-            calendar_day=date,
-            state=date_details["current_date_state"],
-            minimum_stay_nights=date_details["minimum_stay_nights"],
-            price=calculate_mean(
-                [i["price"] for i in date_details["latest_prices_array"]]
-            ),
-            latest_prices_array=make_json_serializable_prices_array(
-                date_details["latest_prices_array"]
-            ),
-            cleaning_fee=date_details["cleaning_fee"],
-            currency=date_details["currency"],
-            extra_attributes=date_details["extra_attributes"],
-        )
-        calendar_days_details_models.append(airbnb_calendar_day)
-    return calendar_days_details_models
-
+    """if no driver is passed (e.g. one checked out from a DriverPool), a new one is started and quit at the end.
+    price_probing_strategy selects the available days on which pricing is read (see price_probing.PriceProbingStrategy)
+    stored_calendar_days ({calendar_day: stored row}, see models.fetch_room_calendar_days) enables the incremental mode:
+    days whose state did not change and whose stored price is recent enough are not priced again
+    the calendar is put in result_queue as one RoomCalendar, its rows are built when it is written (see room_calendar)
+    """
+    if driver is None:
+        driver = driver_setup(headless=headless)
+        try:
+            return get_calendar_days_for_provided_room(
+                room_id,
+                result_queue,
+                headless=headless,
+                driver=driver,
+                price_probing_strategy=price_probing_strategy,
+                stored_calendar_days=stored_calendar_days,
+            )
+        finally:
+            driver.quit()
 
-def get_calendar_days_for_provided_room(room_id, result_queue, headless=True):
-    driver = driver_setup(headless=headless)
     logger.info("[%s] getting room", room_id)
-    driver.get(f"https://www.airbnb.com/rooms/{room_id}?adults=2")
+    with rate_limiter.request(), wait_stats.timed("room_page_load"):
+        driver.get(f"https://www.airbnb.com/rooms/{room_id}?adults=2")
     logger.info("[%s] room gotten", room_id)
-    close_translation_popup_if_exists(driver, room_id)
-    logger.info("[%s] close_translation_popup_if_exists over", room_id)
-    close_cookie_banner_if_exists(driver, room_id)
-    logger.info("[%s] close_cookie_banner_if_exists over", room_id)
+    close_popups_if_exist(driver, room_id)
 
-    calendar_days_details = {}
+    room_calendar = RoomCalendar(room_id)
     old_visible_table_one_string = None
     for num_nexts_to_click in range(NUMBER_ON_MONTHS_IN_FUTURE_TO_CHECK):
         old_visible_table_one_string, first_visible_table, second_visible_table = (
@@ -771,16 +470,23 @@ def get_calendar_days_for_provided_room(room_id, result_queue, headless=True):
             "[%s] old_visible_table_one_string: %s, first_visible_table: %s, second_visible_table: %s",
             room_id,
             old_visible_table_one_string,
-            first_visible_table,
-            second_visible_table,
+            first_visible_table and first_visible_table.month_header,
+            second_visible_table and second_visible_table.month_header,
         )
-        second_visible_table_cells = None
-        first_visible_table_cells = get_all_cells_from_table(first_visible_table)
+        # cells (with their aria-labels) were already read together with the month headers
+        second_visible_table_cells = second_visible_table and second_visible_table.cells
+        first_visible_table_cells = first_visible_table.cells
+        # 1. state and minimum nights of every day of the month
+        month_calendar_days = []
         for first_table_cell_index, first_table_cell in enumerate(
             first_visible_table_cells
         ):
-            date_button_aria_label = first_table_cell.get_attribute("aria-label")
-            date_button_date = parse_date(date_button_aria_label.split(".", 1)[0])
+            date_button_aria_label = first_table_cell.aria_label
+            date_button_date = get_calendar_day(
+                first_visible_table.month_header,
+                first_table_cell_index,
+                date_button_aria_label,
+            )
             current_date_state, num_nights = get_state_and_num_min_nights_of_given_date(
                 date_button_aria_label,
                 first_table_cell,
@@ -795,46 +501,56 @@ def get_calendar_days_for_provided_room(room_id, result_queue, headless=True):
                 current_date_state,
                 num_nights,
             )
-            pricing_dict, second_visible_table_cells = (
-                get_smallest_stay_interval_and_pricing_dict(
-                    current_date_state,
-                    num_nights,
-                    date_button_date,
-                    second_visible_table,
-                    second_visible_table_cells,
-                    first_visible_table_cells,
-                    first_table_cell,
-                    first_table_cell_index,
-                    driver,
-                    room_id,
-                )
-            )
-            calendar_days_details.setdefault(
-                date_button_date, copy.deepcopy(CALENDAR_DAYS_DETAILS_EMPTY_TEMPLATE)
+            month_calendar_days.append(
+                CalendarDayToProbe(date_button_date, current_date_state, num_nights)
             )
-            calendar_days_details[date_button_date][
-                "current_date_state"
-            ] = current_date_state
-            calendar_days_details[date_button_date]["minimum_stay_nights"] = num_nights
-            calendar_days_details, pricing_dict = (
-                enrich_calendar_days_details_if_data_is_available(
-                    CALENDAR_DAYS_DETAILS_EMPTY_TEMPLATE,
-                    current_date_state,
-                    pricing_dict,
-                    calendar_days_details,
-                    date_button_date,
-                    num_nights,
+        # 2. pricing clicks only for the days selected by the probing strategy
+        fresh_days = (
+            get_fresh_days(month_calendar_days, stored_calendar_days)
+            if stored_calendar_days
+            else set()
+        )
+        days_to_probe = plan_price_probes(
+            month_calendar_days,
+            strategy=price_probing_strategy,
+            already_covered_days=room_calendar.get_priced_days(),
+            fresh_days=fresh_days,
+        )
+        logger.info(
+            "[%s] probing pricing on %s days out of %s. %s days have a fresh stored price",
+            room_id,
+            len(days_to_probe),
+            len(month_calendar_days),
+            len(fresh_days),
+        )
+        for first_table_cell_index, (
+            first_table_cell,
+            (date_button_date, current_date_state, num_nights),
+        ) in enumerate(zip(first_visible_table_cells, month_calendar_days)):
+            if date_button_date in days_to_probe:
+                pricing_dict, second_visible_table_cells = (
+                    get_smallest_stay_interval_and_pricing_dict(
+                        current_date_state,
+                        num_nights,
+                        date_button_date,
+                        second_visible_table,
+                        second_visible_table_cells,
+                        first_visible_table_cells,
+                        first_table_cell,
+                        first_table_cell_index,
+                        driver,
+                        room_id,
+                    )
                 )
-            )
+            else:
+                pricing_dict = None
+            room_calendar.set_day(date_button_date, current_date_state, num_nights)
+            if pricing_dict is not None and current_date_state == CalendarDayState.AVAILABLE:
+                room_calendar.add_stay_pricing(date_button_date, num_nights, pricing_dict)
         if (num_nexts_to_click + 1) < NUMBER_ON_MONTHS_IN_FUTURE_TO_CHECK:
-            next_month(driver)
-        time.sleep(1)
+            next_month(driver, old_visible_table_one_string)
 
-    calendar_days_details_models = generate_airbnb_calendar_day_list(
-        calendar_days_details, room_id
-    )
-    for calendar_day in calendar_days_details_models:
-        result_queue.put(calendar_day)
+    result_queue.put(room_calendar.finish())
 
 
 # if __name__ == 'main':
@@ -1,4 +1,59 @@
-driver_settings = {"headless": True}
+import os
+
+driver_settings = {
+    "headless": True,
+    "profile": "light",  # key of DRIVER_PROFILES
+}
+
+# options of the chrome instances. "full" loads pages as a desktop browser, "light" only what the scrapers read
+DRIVER_PROFILES = {
+    "full": {},
+    "light": {
+        # driver.get returns at DOMContentLoaded: the scrapers wait for the elements they need (see dom_waits)
+        "page_load_strategy": "eager",
+        # requests blocked by the browser (CDP Network.setBlockedURLs, * wildcards): images, fonts, videos, map tiles, trackers
+        "blocked_url_patterns": [
+            "*.jpg*",
+            "*.jpeg*",
+            "*.png*",
+            "*.gif*",
+            "*.webp*",
+            "*.avif*",
+            "*.svg*",
+            "*.ico*",
+            "*.woff*",
+            "*.ttf*",
+            "*.otf*",
+            "*.mp4*",
+            "*.webm*",
+            "*.m3u8*",
+            "*maps.googleapis.com*",
+            "*maps.gstatic.com*",
+            "*googletagmanager.com*",
+            "*google-analytics.com*",
+            "*doubleclick.net*",
+            "*facebook.net*",
+            "*facebook.com/tr*",
+        ],
+        # hosts not even resolved (--host-resolver-rules): no connection is opened to them
+        "blocked_hosts": [
+            "www.googletagmanager.com",
+            "www.google-analytics.com",
+            "connect.facebook.net",
+            "stats.g.doubleclick.net",
+        ],
+        "arguments": [
+            "--disable-gpu",
+            "--disable-extensions",
+            "--disable-dev-shm-usage",  # /dev/shm is small in containers
+            "--disable-background-networking",
+            "--mute-audio",
+            "--blink-settings=imagesEnabled=false",
+        ],
+        "js_heap_limit_mb": 512,  # --max-old-space-size of the renderers
+        "prefs": {"profile.managed_default_content_settings.images": 2},
+    },
+}
 
 
 AREAS_SETTINGS = {
@@ -15,3 +70,105 @@ AREAS_SETTINGS = {
         "zoom": "14",
     }
 }
+
+driver_pool_settings = {
+    "size": 5,  # number of chrome instances kept alive and shared by the scraper threads
+    "checkout_timeout_sec": 600,
+    "reset_cookies": True,  # delete cookies when a driver is given back to the pool
+}
+
+persistence_writer_settings = {
+    "max_queue_size": 5000,  # scraper threads block when this many rows are waiting to be written (a calendar is one row per day)
+    "batch_size": 500,  # commit as soon as this many objects are available
+    "flush_interval_sec": 5,  # or when this much time passed since the last commit
+}
+
+html_parsing_settings = {
+    "backend": "auto",  # "auto" (stream), "stream" or "html.parser" (slow, pure python)
+}
+
+http_search_settings = {
+    "base_url": "https://www.airbnb.com",  # scheme and host the search links are sent to (e.g. a local stand-in server)
+    "pool_maxsize": 10,  # keep-alive connections per session
+    "timeout_sec": 25,
+    "max_retries": 2,
+    "headers": {
+        "User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+        "Accept": "text/html,application/xhtml+xml",
+        "Accept-Encoding": "gzip, deflate",
+        "Accept-Language": "en-US,en;q=0.9",
+    },
+}
+
+price_band_planner_settings = {
+    "initial_band_width": 80,  # width of the bands counted first when there is no saved plan
+    "min_band_width": 2,  # bands are not split below this width even if they are over the results cap
+    "merge_fill_ratio": 0.8,  # neighbouring bands are merged up to this fraction of the results cap
+    "plan_path_template": "data/price_band_plan_{area}.json",
+}
+
+search_tiling_settings = {
+    "max_depth": 4,  # a tile is split in quadrants at most this many times (zoom + 4, tiles 1/16 as wide as the area)
+}
+
+price_probing_settings = {
+    "strategy": "cover_once",  # "full", "cover_once" or "every_k_days". see price_probing.PriceProbingStrategy
+    "every_k_days": 3,
+    "price_ttl_hours": 72,  # incremental rescrape: a day with unchanged state is priced again only if its price is older than this
+}
+
+parquet_export_settings = {
+    "export_dir": "data/parquet",  # one sub directory (parquet dataset) per exported table
+    "chunk_size": 50000,  # rows read from the db and written per parquet file
+    "watermark_lag_sec": 60,  # rows written in the last seconds are left to the next export (transactions still open)
+}
+
+market_aggregates_settings = {
+    "default_area": "venice_center",  # key of AREAS_SETTINGS of the rooms stored without area_nickname
+    "price_histogram_decimals": 0,  # prices are rounded to this many decimals in the median histograms
+}
+
+database_settings = {
+    # e.g. AIRBNB_DB_URL=postgresql+psycopg2://user@localhost:5432/airbnb to run the workers against a local postgres
+    "db_url": os.environ.get("AIRBNB_DB_URL", "sqlite:///data/airbnb.db"),
+    "write_backend": "auto",  # "upsert" (multi-row INSERT ... ON CONFLICT), "copy" (postgres COPY, see postgres_bulk_load) or "auto" (copy on postgres)
+}
+
+sqlite_settings = {
+    "journal_mode": "WAL",  # readers do not block the writer and the writer does not block readers
+    "synchronous": "NORMAL",  # with WAL: fsync at checkpoints only, a commit is not lost on process crash (only on power loss)
+    "cache_size_kib": 65536,  # page cache per connection
+    "busy_timeout_ms": 30000,  # wait this long for the write lock of another process instead of failing with "database is locked"
+    "wal_autocheckpoint_pages": 1000,
+}
+
+job_queue_settings = {
+    "lease_sec": 600,  # a claimed job can be claimed by another worker if its lease is not extended for this long
+    "heartbeat_interval_sec": 60,  # leases of the jobs in progress are extended this often
+    "max_attempts": 3,  # a job failing this many times is marked FAILED
+    "claim_batch_size": 1,  # jobs claimed per transaction
+    "poll_interval_sec": 30,  # when no job is claimable but others are leased, wait this long before claiming again
+}
+
+rate_limiter_settings = {
+    # process wide token bucket gating the page loads, pagination clicks and pricing probes of all the scraper threads
+    "initial_rate_per_sec": 2.0,
+    "min_rate_per_sec": 0.1,
+    "max_rate_per_sec": 20.0,
+    "burst": 3,  # tokens the bucket holds: requests which can start at once after an idle period
+    "additive_increase_per_sec": 0.05,  # rate increase per second of requests without congestion (AIMD increase)
+    "decrease_factor": 0.5,  # rate multiplier on congestion (AIMD decrease)
+    "target_latency_sec": 8,  # congestion: moving average latency above this
+    "max_error_rate": 0.2,  # or more than this fraction of errors in the window of the last requests
+    "window_size": 20,
+    "min_window_size": 5,  # requests needed in the window (since the last decrease) before congestion is considered
+    "latency_ewma_alpha": 0.2,
+    "decrease_cooldown_sec": 10,  # at most one decrease per this many seconds: requests already in flight saw the old rate
+}
+
+dom_waits_settings = {
+    "poll_interval_sec": 0.05,  # condition waits check the page this often (selenium default: 0.5 sec)
+    "timeout_sec": 10,  # default timeout of the condition waits
+    "popup_timeout_sec": 10,  # popups are looked for at most this long if the page never gets ready
+    "popup_grace_sec": 0.5,  # once the page is ready, popups which did not show up yet are waited for this long
+}
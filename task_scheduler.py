@@ -0,0 +1,94 @@
+import queue
+import threading
+import time
+import logging
+from typing import Any, NamedTuple
+
+logger = logging.getLogger(__name__)
+
+_NO_MORE_TASKS = object()
+
+
+class TaskOutcome(NamedTuple):
+    """result of running one task (e.g. one room or one link) through the scheduler"""
+
+    item: Any
+    is_success: bool
+    result: Any = None
+    error: str | None = None
+    duration_sec: float = 0.0
+
+
+def run_task(task_function, item):
+    t0 = time.monotonic()
+    try:
+        result = task_function(item)
+        return TaskOutcome(
+            item=item,
+            is_success=True,
+            result=result,
+            duration_sec=time.monotonic() - t0,
+        )
+    except Exception as ex:
+        logger.exception("[%s] task failed", item)
+        return TaskOutcome(
+            item=item,
+            is_success=False,
+            error=f"{type(ex).__name__}: {ex}",
+            duration_sec=time.monotonic() - t0,
+        )
+
+
+def run_bounded(items, task_function, max_workers, on_outcome=None):
+    """
+    Runs `task_function(item)` for every item keeping at most `max_workers` tasks in flight.
+
+    Each worker thread pulls the next item as soon as its current task is over, so one slow
+    item never keeps the other workers idle (unlike starting the items in waves and joining them).
+
+    :param items: iterable with the items to process (e.g. room ids or links). consumed lazily
+    :param task_function: function called with one item. exceptions are caught and reported in the outcome
+    :param max_workers: maximum number of tasks running at the same time
+    :param on_outcome: optional callback called (from the worker thread) with each TaskOutcome as soon as it is available
+
+    :return: list of TaskOutcome, in order of completion
+    """
+    assert max_workers > 0, f"max_workers must be positive, got {max_workers}"
+    tasks_queue = queue.Queue(maxsize=max_workers)
+    outcomes = []
+    outcomes_lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = tasks_queue.get()
+            if item is _NO_MORE_TASKS:
+                return
+            outcome = run_task(task_function, item)
+            with outcomes_lock:
+                outcomes.append(outcome)
+            if on_outcome:
+                try:
+                    on_outcome(outcome)
+                except Exception:
+                    logger.exception("[%s] on_outcome callback failed", item)
+
+    workers = [
+        threading.Thread(target=worker, name=f"scheduler-worker-{i}")
+        for i in range(max_workers)
+    ]
+    for t in workers:
+        t.start()
+    try:
+        for item in items:
+            tasks_queue.put(item)  # blocks while all the workers are busy
+    finally:
+        for _ in workers:
+            tasks_queue.put(_NO_MORE_TASKS)
+        for t in workers:
+            t.join()
+
+    num_failed = len([i for i in outcomes if not i.is_success])
+    logger.info(
+        "scheduler finished. %s tasks run, %s failed", len(outcomes), num_failed
+    )
+    return outcomes
@@ -0,0 +1,94 @@
+"""
+Previous implementation of the calendar parsing (per call patterns, one keyword branch after the other), the
+reference calendar_parsing is checked against (tests/test_calendar_parsing.py) and timed against
+(benchmarks/bench_calendar_parsing.py).
+"""
+
+import re
+import logging
+from datetime import datetime
+
+from models import CalendarDayState
+
+logger = logging.getLogger(__name__)
+
+
+def reference_parse_state(date_button_aria_label):
+    """previous implementation: pattern dict rebuilt and compiled on every call"""
+    patterns = {
+        CalendarDayState.UNAVAILABLE: [re.compile(r"\bunavailable\b", re.IGNORECASE)],
+        CalendarDayState.AVAILABLE: [
+            re.compile(
+                r"\bavailable\b.*?(\d+)\s*-?\s*night.*?\bminimum\b", re.IGNORECASE
+            ),
+            re.compile(r"\bavailable\b.*?\bselect\b.*?\bdate\b", re.IGNORECASE),
+        ],
+        CalendarDayState.AVAILABLE_NO_CHECKOUT_DATE: [
+            re.compile(
+                r"\bavailable\b.*?\bno\b.*?\beligible\b.*?\bcheckout\b.*?(\d+)\s*-?\s*night\b",
+                re.IGNORECASE,
+            )
+        ],
+        CalendarDayState.CHECKOUT_ONLY: [
+            re.compile(
+                r"\bthis\s+day\s+is\s+only\s+available\s+for\s+checkout\b",
+                re.IGNORECASE,
+            )
+        ],
+        CalendarDayState.UNAVAILABLE_DUE_TO_PAST_DATE: [
+            re.compile(r"\bpast\s+dates?\s+can’t\s+be\s+selected\b", re.IGNORECASE)
+        ],
+    }
+    for current_date_state, patterns in patterns.items():
+        for pattern in patterns:
+            match = pattern.search(date_button_aria_label)
+            if match:
+                return current_date_state, (int(match.group(1)) if match.lastindex else 1)
+    raise ValueError(date_button_aria_label)
+
+
+def reference_parse_date(date_button_aria_label):
+    date_string = date_button_aria_label.split(".", 1)[0]
+    if "Today" in date_string:
+        date_string = date_string.rsplit(",", 1)[0]
+    return datetime.strptime(date_string, "%d, %A, %B %Y").date()
+
+
+def reference_parse_pricing_line(input_string, num_nights):
+    """previous implementation, condensed: one keyword branch after the other, each with its own re.search calls.
+    it logged a warning for the lines matching nothing, as the engine does"""
+    currency_symbols = r"[\€\$\£\¥\₹\₩\₽\₺\₴\฿\₵\₦\₫\₪\₱\₲\₡\₣\₭\₮]"
+    lower_input = input_string.lower()
+    for description, keywords in (
+        ("early_bird_discount", ("early", "bird", "discount")),
+        ("last_minute_discount", ("last", "minute", "discount")),
+        ("accommodation_nightly", ("accommodation",)),
+        ("airbnb_service_fee", ("airbnb", "service", "fee")),
+        ("night_price", ("night",)),
+        ("weekly_discount", ("weekly", "discount")),
+        ("monthly_discount", ("monthly", "discount")),
+        ("cleaning_fee", ("cleaning",)),
+        ("taxes", ("taxes",)),
+    ):
+        if all(keyword in lower_input for keyword in keywords):
+            currency_match = re.search(currency_symbols, input_string)
+            amount_match = re.search(r"(\d+[\d,]*)", input_string)
+            if amount_match:
+                amount = int(amount_match.group(1).replace(",", ""))
+                return {
+                    "description": description,
+                    "amount": amount / num_nights
+                    if description == "accommodation_nightly"
+                    else amount,
+                    "currency": currency_match.group(0) if currency_match else None,
+                    "extra": "",
+                }
+    logger.warning(
+        "We did not find any matching pattern in the input string: %s", input_string
+    )
+    return {
+        "description": "other",
+        "amount": None,
+        "currency": None,
+        "extra": input_string.strip(),
+    }
@@ -0,0 +1,129 @@
+import random
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from calendar_diff import diff_calendar_days
+from models import (
+    CALENDAR_DAY_COLUMNS,
+    CALENDAR_DAY_TOUCH_COLUMNS,
+    CALENDAR_DAY_VALUE_COLUMNS,
+    CalendarDayState,
+    apply_calendar_day_changes,
+)
+
+STATES = [CalendarDayState.AVAILABLE, CalendarDayState.UNAVAILABLE, CalendarDayState.CHECKOUT_ONLY]
+
+
+def make_random_day(rng, room_id, calendar_day):
+    price = rng.choice([None, 0, 100.0, 105.0, 130.0])
+    return {
+        "room_id": room_id,
+        "calendar_day": calendar_day,
+        "state": rng.choice(STATES),
+        "price": price,
+        "latest_prices_array": (
+            [{"check_in": str(calendar_day), "check_out": str(calendar_day), "price": price}]
+            if price and rng.random() < 0.7
+            else rng.choice([None, []])
+        ),
+        "minimum_stay_nights": rng.choice([None, 0, 1, 2]),
+        "cleaning_fee": rng.choice([None, 0, 10.0, 20.0]),
+        "currency": rng.choice([None, "", "EUR", "$"]),
+        "extra_attributes": rng.choice([None, {}, {"weekly_discount": 5}, {"airbnb_service_fee": 3}]),
+        "price_checked_at": rng.choice([None, datetime(2030, 1, 1), datetime(2030, 1, 2)]),
+    }
+
+
+def make_random_calendars(seed, number_of_rooms=3, number_of_days=40):
+    """(new rows, stored rows): about a third of the new days are not stored, the others are stored with random values or unchanged"""
+    rng = random.Random(seed)
+    new_rows, stored_rows = [], []
+    for room_index in range(number_of_rooms):
+        for day_index in range(number_of_days):
+            calendar_day = date(2030, 8, 1) + timedelta(days=day_index)
+            new_row = make_random_day(rng, str(room_index), calendar_day)
+            new_rows.append(new_row)
+            draw = rng.random()
+            if draw < 0.3:
+                continue
+            stored_rows.append(
+                dict(new_row)
+                if draw < 0.5
+                else make_random_day(rng, str(room_index), calendar_day)
+            )
+    return new_rows, stored_rows
+
+
+def apply_day_by_day(new_rows, stored_rows):
+    """{key: (transition type, values to store)} of apply_calendar_day_changes, the per day rules diff_calendar_days vectorizes"""
+    stored_by_key = {(i["room_id"], i["calendar_day"]): i for i in stored_rows}
+    results = {}
+    for new_row in new_rows:
+        key = (new_row["room_id"], new_row["calendar_day"])
+        new_instance = SimpleNamespace(**new_row)
+        stored_row = stored_by_key.get(key)
+        transition_type = apply_calendar_day_changes(
+            stored_row and SimpleNamespace(**stored_row), new_instance, 0.1
+        )
+        results[key] = (transition_type, vars(new_instance))
+    return results
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_diff_calendar_days_matches_apply_calendar_day_changes(seed):
+    new_rows, stored_rows = make_random_calendars(seed)
+    stored_by_key = {(i["room_id"], i["calendar_day"]): i for i in stored_rows}
+    calendar_day_rows, transition_rows, touched_rows = diff_calendar_days(
+        new_rows, stored_rows, CALENDAR_DAY_COLUMNS, 0.1, CALENDAR_DAY_TOUCH_COLUMNS
+    )
+    written_by_key = {(i["room_id"], i["calendar_day"]): i for i in calendar_day_rows}
+    transitions_by_key = {(i["room_id"], i["calendar_day"]): i for i in transition_rows}
+    touched_keys = {(i["room_id"], i["calendar_day"]) for i in touched_rows}
+
+    for key, (transition_type, values) in apply_day_by_day(new_rows, stored_rows).items():
+        expected_values = {
+            column: values[column] or None if column in ("latest_prices_array", "extra_attributes") else values[column]
+            for column in CALENDAR_DAY_VALUE_COLUMNS
+        }
+        if key in written_by_key:
+            written_values = {
+                column: written_by_key[key][column] or None
+                if column in ("latest_prices_array", "extra_attributes")
+                else written_by_key[key][column]
+                for column in CALENDAR_DAY_VALUE_COLUMNS
+            }
+            assert written_values == expected_values, key
+            assert written_by_key[key]["price_checked_at"] == values["price_checked_at"], key
+        else:
+            # not written: storing the day again would not change it
+            stored_values = {
+                column: stored_by_key[key][column] or None
+                if column in ("latest_prices_array", "extra_attributes")
+                else stored_by_key[key][column]
+                for column in CALENDAR_DAY_VALUE_COLUMNS
+            }
+            assert stored_values == expected_values, key
+            is_price_checked_again = values["price_checked_at"] != stored_by_key[key]["price_checked_at"]
+            assert (key in touched_keys) == is_price_checked_again, key
+        # every day written gets a transition, VALUE_ONLY_CHANGE when the rules found no change
+        expected_transition_type = (transition_type or "VALUE_ONLY_CHANGE") if key in written_by_key else None
+        assert (transitions_by_key[key]["transition_type"] if key in transitions_by_key else None) == expected_transition_type, key
+
+
+def test_unchanged_calendar_is_not_written_again():
+    new_rows, _ = make_random_calendars(seed=0)
+    stored_rows = diff_calendar_days(
+        new_rows, [], CALENDAR_DAY_COLUMNS, 0.1, CALENDAR_DAY_TOUCH_COLUMNS
+    )[0]
+    new_rows = [dict(i) for i in new_rows]
+    for new_row in new_rows:  # scraped again the next day: only the time the prices were read changes
+        new_row["price_checked_at"] = datetime(2030, 1, 3)
+    calendar_day_rows, transition_rows, touched_rows = diff_calendar_days(
+        new_rows, stored_rows, CALENDAR_DAY_COLUMNS, 0.1, CALENDAR_DAY_TOUCH_COLUMNS
+    )
+    assert calendar_day_rows == []
+    assert transition_rows == []
+    assert len(touched_rows) == len(new_rows)
+    assert {i["price_checked_at"] for i in touched_rows} == {datetime(2030, 1, 3)}
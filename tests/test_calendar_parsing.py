@@ -0,0 +1,73 @@
+import csv
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from calendar_parsing import get_calendar_day, parse_day_state, parse_pricing_line
+from models import CalendarDayState
+from tests.calendar_parsing_reference import (
+    reference_parse_date,
+    reference_parse_pricing_line,
+    reference_parse_state,
+)
+
+FIXTURES_PATH = Path(__file__).parent / "fixtures"
+
+
+def load_day_labels():
+    """(date, day aria-label) of the days of a scraped calendar (calendar_day_labels.csv)"""
+    with open(FIXTURES_PATH / "calendar_day_labels.csv", encoding="utf-8") as f:
+        return [(date.fromisoformat(i["date"]), i["day_label"]) for i in csv.DictReader(f)]
+
+
+DAY_LABELS = load_day_labels()
+PRICING_LINES = (FIXTURES_PATH / "pricing_form_lines.txt").read_text(encoding="utf-8").splitlines()
+
+
+def test_day_states_match_the_reference():
+    for _, day_label in DAY_LABELS:
+        assert parse_day_state(day_label) == reference_parse_state(day_label), day_label
+
+
+def test_day_dates_match_the_reference():
+    for calendar_day, day_label in DAY_LABELS:
+        month_header = calendar_day.strftime("%B %Y")
+        assert get_calendar_day(month_header, calendar_day.day - 1, day_label) == calendar_day, day_label
+        assert reference_parse_date(day_label) == calendar_day, day_label
+
+
+@pytest.mark.parametrize("num_nights", [1, 5])
+def test_pricing_lines_match_the_reference(num_nights):
+    for pricing_line in PRICING_LINES:
+        assert parse_pricing_line(pricing_line, num_nights) == reference_parse_pricing_line(
+            pricing_line, num_nights
+        ), pricing_line
+
+
+@pytest.mark.parametrize(
+    "pricing_line, description, amount, currency",
+    [
+        ("Accommodation €480", "accommodation_nightly", 96.0, "€"),
+        ("$1,050 x 7 nights", "night_price", 1050, "$"),
+        ("Monthly stay discount -€1,200", "monthly_discount", 1200, "€"),
+        ("Show price breakdown", "other", None, None),
+    ],
+)
+def test_pricing_line_values(pricing_line, description, amount, currency):
+    parsed = parse_pricing_line(pricing_line, 5)
+    assert (parsed["description"], parsed["amount"], parsed["currency"]) == (description, amount, currency)
+
+
+def test_unknown_day_label_raises():
+    day_label = "9, Sunday, March 2025. Something new. "
+    with pytest.raises(ValueError):
+        reference_parse_state(day_label)
+    with pytest.raises(ValueError):
+        parse_day_state(day_label)
+
+
+def test_past_date_with_ascii_apostrophe():
+    """the only deliberate difference with the reference, which only knew the typographic apostrophe"""
+    day_label = "8, Saturday, March 2025. Past dates can't be selected. "
+    assert parse_day_state(day_label) == (CalendarDayState.UNAVAILABLE_DUE_TO_PAST_DATE, 1)
@@ -0,0 +1,66 @@
+import sqlite3
+
+import pytest
+from sqlalchemy import event, text
+
+from db_engine import create_db_engine
+from settings import sqlite_settings
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = tmp_path / "airbnb.db"
+    with sqlite3.connect(db_path) as connection:
+        connection.execute("CREATE TABLE rooms (id TEXT PRIMARY KEY)")
+    return db_path
+
+
+def is_write_locked(db_path):
+    """True if another process can not write the db right now"""
+    connection = sqlite3.connect(db_path, timeout=0)
+    try:
+        connection.execute("INSERT INTO rooms VALUES ('other')")
+        connection.rollback()
+        return False
+    except sqlite3.OperationalError as ex:
+        assert "locked" in str(ex)
+        return True
+    finally:
+        connection.close()
+
+
+@pytest.mark.parametrize("writer", [False, True])
+def test_connections_get_the_pragmas(db_path, writer):
+    engine = create_db_engine(f"sqlite:///{db_path}", writer=writer)
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert connection.exec_driver_sql("PRAGMA busy_timeout").scalar() == sqlite_settings["busy_timeout_ms"]
+    engine.dispose()
+
+
+def test_writer_transactions_begin_immediate(db_path):
+    engine = create_db_engine(f"sqlite:///{db_path}", writer=True)
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    with engine.begin() as connection:
+        assert statements[0] == "BEGIN IMMEDIATE"
+        connection.execute(text("SELECT count(*) FROM rooms"))
+        # the write lock is held from the start of the transaction, before it writes anything
+        assert is_write_locked(db_path)
+        connection.execute(text("INSERT INTO rooms VALUES ('1')"))
+    assert not is_write_locked(db_path)
+    engine.dispose()
+
+
+def test_reader_transactions_do_not_take_the_write_lock(db_path):
+    engine = create_db_engine(f"sqlite:///{db_path}")
+    with engine.begin() as connection:
+        connection.execute(text("SELECT count(*) FROM rooms"))
+        assert not is_write_locked(db_path)
+    engine.dispose()
+
+
+def test_writer_engine_has_a_single_connection(db_path):
+    engine = create_db_engine(f"sqlite:///{db_path}", writer=True)
+    assert engine.pool.size() == 1
+    engine.dispose()
@@ -0,0 +1,112 @@
+import pytest
+from selenium.common.exceptions import TimeoutException
+
+from dom_extraction import CALENDAR_TABLES_JS, PRESENT_SELECTORS_JS
+from dom_waits import wait_for_calendar_months, wait_for_popups, wait_stats, wait_until
+
+POPUP_SELECTORS = {"translation": "div.translation", "cookies": "div.cookies"}
+PAGE_READY_SELECTOR = "div.page-ready"
+
+
+class FakePage:
+    """
+    driver of a page whose elements are rendered after some polls (execute_script calls).
+
+    :param appear_after_polls: {css selector: number of polls before it is in the page}
+    :param month_headers: [(month header, number of polls before it is visible)], in calendar order
+    """
+
+    def __init__(self, appear_after_polls=None, month_headers=()):
+        self.appear_after_polls = appear_after_polls or {}
+        self.month_headers = month_headers
+        self.num_polls = 0
+
+    def is_rendered(self, after_polls):
+        return after_polls is not None and self.num_polls > after_polls
+
+    def execute_script(self, script, *args):
+        self.num_polls += 1
+        if script == PRESENT_SELECTORS_JS:
+            selectors = args[0]
+            return [
+                name
+                for name, selector in selectors.items()
+                if self.is_rendered(self.appear_after_polls.get(selector))
+            ]
+        if script == CALENDAR_TABLES_JS:
+            return [
+                (month_header if self.is_rendered(after_polls) else "", None, [])
+                for month_header, after_polls in self.month_headers
+            ]
+        raise AssertionError(f"unexpected script {script[:40]}")
+
+
+def get_timeouts(name):
+    return wait_stats.get_summary().get(name, {}).get("timeouts", 0)
+
+
+def test_wait_until_immediate_success():
+    driver = FakePage()
+    assert wait_until(driver, lambda driver: "ready", "test_immediate") == "ready"
+    assert wait_stats.get_summary()["test_immediate"]["calls"] == 1
+
+
+def test_wait_until_succeeds_after_a_few_polls():
+    num_calls = 0
+
+    def condition(driver):
+        nonlocal num_calls
+        num_calls += 1
+        return num_calls == 4 and "ready"
+
+    assert wait_until(FakePage(), condition, "test_after_polls", poll_sec=0.01) == "ready"
+    assert num_calls == 4
+    assert get_timeouts("test_after_polls") == 0
+
+
+def test_wait_until_timeout_is_counted():
+    with pytest.raises(TimeoutException):
+        wait_until(FakePage(), lambda driver: False, "test_timeout", timeout_sec=0.1, poll_sec=0.01)
+    assert get_timeouts("test_timeout") == 1
+
+
+def test_popups_all_present_end_the_wait_at_once():
+    driver = FakePage({"div.translation": 0, "div.cookies": 0})
+    assert wait_for_popups(driver, POPUP_SELECTORS, PAGE_READY_SELECTOR, name="test_popups") == set(POPUP_SELECTORS)
+    assert driver.num_polls == 1
+
+
+def test_popups_rendered_after_a_few_polls():
+    driver = FakePage({"div.translation": 2, "div.cookies": 3, PAGE_READY_SELECTOR: 0})
+    popups = wait_for_popups(driver, POPUP_SELECTORS, PAGE_READY_SELECTOR, name="test_popups", grace_sec=1)
+    assert popups == set(POPUP_SELECTORS)
+    assert driver.num_polls == 4
+
+
+def test_missing_popup_costs_the_grace_time_after_the_page_is_ready():
+    driver = FakePage({"div.cookies": 0, PAGE_READY_SELECTOR: 2})
+    popups = wait_for_popups(
+        driver, POPUP_SELECTORS, PAGE_READY_SELECTOR, name="test_missing_popup", timeout_sec=10, grace_sec=0.1
+    )
+    assert popups == {"cookies"}
+    assert wait_stats.get_summary()["test_missing_popup"]["max_sec"] < 1
+
+
+def test_page_never_ready_stops_at_the_timeout():
+    driver = FakePage({"div.cookies": 0})
+    popups = wait_for_popups(driver, POPUP_SELECTORS, PAGE_READY_SELECTOR, name="test_popups", timeout_sec=0.2)
+    assert popups == {"cookies"}
+    assert driver.num_polls > 1
+
+
+def test_calendar_months_wait_for_the_next_month():
+    driver = FakePage(month_headers=[("May 2026", 0), ("June 2026", 3), ("July 2026", 3)])
+    assert wait_for_calendar_months(driver, old_first_month="April 2026") == ["May 2026", "June 2026", "July 2026"]
+    assert driver.num_polls == 4
+
+
+def test_calendar_months_time_out_while_the_old_month_is_first():
+    driver = FakePage(month_headers=[("April 2026", 0), ("May 2026", 0)])
+    with pytest.raises(TimeoutException):
+        wait_for_calendar_months(driver, old_first_month="April 2026", name="test_old_month", timeout_sec=0.1)
+    assert get_timeouts("test_old_month") == 1
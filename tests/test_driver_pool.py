@@ -0,0 +1,80 @@
+import pytest
+
+from driver_pool import DriverPool, run_with_pooled_driver
+
+
+class FakeDriver:
+    def __init__(self, name):
+        self.name = name
+        self.is_broken = False
+        self.is_quit = False
+
+    def delete_all_cookies(self):
+        pass
+
+    def get(self, url):
+        if self.is_broken:
+            raise ConnectionError("chrome crashed")
+
+    def quit(self):
+        self.is_quit = True
+
+
+class FakeDriverFactory:
+    """driver_factory whose next num_failures calls raise"""
+
+    def __init__(self):
+        self.num_created = 0
+        self.num_failures = 0
+
+    def __call__(self, headless=None):
+        if self.num_failures:
+            self.num_failures -= 1
+            raise RuntimeError("chromedriver did not start")
+        self.num_created += 1
+        return FakeDriver(self.num_created)
+
+
+@pytest.fixture
+def driver_factory():
+    return FakeDriverFactory()
+
+
+def break_driver_and_fail_its_replacement(driver, driver_factory, num_failures=1):
+    driver.is_broken = True
+    driver_factory.num_failures = num_failures
+    return "task result"
+
+
+def test_failed_replacement_keeps_the_task_result(driver_factory):
+    with DriverPool(size=1, driver_factory=driver_factory) as driver_pool:
+        result = run_with_pooled_driver(
+            driver_pool, break_driver_and_fail_its_replacement, driver_factory=driver_factory
+        )
+        assert result == "task result"
+
+
+def test_failed_replacement_is_created_by_the_next_checkout(driver_factory):
+    with DriverPool(size=1, driver_factory=driver_factory, checkout_timeout_sec=0.1) as driver_pool:
+        with driver_pool.driver() as driver:
+            broken_driver = driver
+            break_driver_and_fail_its_replacement(driver, driver_factory)
+        assert broken_driver.is_quit
+        with driver_pool.driver() as driver:
+            assert driver.name == 2
+        # the pool is back to its size: the driver is given back and checked out again
+        with driver_pool.driver() as driver:
+            assert driver.name == 2
+
+
+def test_checkout_waits_for_a_driver_when_the_replacement_fails_again(driver_factory):
+    with DriverPool(size=2, driver_factory=driver_factory, checkout_timeout_sec=0.1) as driver_pool:
+        with driver_pool.driver() as driver:
+            break_driver_and_fail_its_replacement(driver, driver_factory, num_failures=2)
+        # the replacement fails again at this checkout: the idle driver is used and the next checkout retries
+        with driver_pool.driver() as driver:
+            assert driver.name == 2
+        with driver_pool.driver() as driver:
+            assert driver.name == 3
+            with driver_pool.driver() as other_driver:
+                assert other_driver.name == 2
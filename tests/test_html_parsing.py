@@ -0,0 +1,23 @@
+from pathlib import Path
+
+import pytest
+
+from html_parsing import ROOM_LINKS_BACKENDS, extract_room_links, resolve_backend
+
+FIXTURE_PAGE = (Path(__file__).parent / "fixtures" / "search_results_page.html").read_text()
+
+EXPECTED_ROOM_LINKS = [
+    "www.airbnb.com/rooms/14132224?adults=1&check_in=2024-08-01&check_out=2024-08-03",
+    "www.airbnb.com/rooms/34281543?adults=1&previous_page_section_name=1000",
+    "www.airbnb.com/rooms/818914306204706609?adults=1",
+    "www.airbnb.com/rooms/plus/52876233?adults=1&search_mode=regular_search",
+]
+
+
+@pytest.mark.parametrize("backend", list(ROOM_LINKS_BACKENDS))
+def test_backends_return_the_same_links(backend):
+    assert extract_room_links(FIXTURE_PAGE, backend=backend) == EXPECTED_ROOM_LINKS
+
+
+def test_auto_is_the_stream_extractor():
+    assert resolve_backend("auto") == "stream"
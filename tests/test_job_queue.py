@@ -0,0 +1,124 @@
+import time
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import Session
+
+from job_queue import (
+    JOBS_TABLE,
+    JobQueueConsumer,
+    claim_jobs,
+    count_leased_by_others,
+    enqueue_jobs,
+    get_queue_counts,
+    release_flushed_jobs,
+    save_job_finishes,
+    split_job_finishes,
+    utc_now,
+)
+from models import Base, ScrapeJobState
+from persistence_writer import PersistenceWriter
+from task_scheduler import TaskOutcome, run_bounded
+
+SCRAPER_NAME = "calendar"
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'airbnb.db'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def enqueue(engine, job_keys):
+    with Session(engine) as session:
+        enqueue_jobs(session, SCRAPER_NAME, job_keys)
+        session.commit()
+
+
+def expire_leases(engine):
+    with engine.begin() as connection:
+        connection.execute(update(JOBS_TABLE).values(lease_expires_at=utc_now() - timedelta(seconds=1)))
+
+
+def get_counts(engine):
+    with Session(engine) as session:
+        return get_queue_counts(session, SCRAPER_NAME)
+
+
+def test_expired_lease_on_last_attempt_fails_the_job(engine):
+    enqueue(engine, ["1"])
+    assert claim_jobs(engine, SCRAPER_NAME, "crashed-worker", max_attempts=1) == [(1, "1")]
+    assert count_leased_by_others(engine, SCRAPER_NAME, "other-worker") == 1
+    expire_leases(engine)
+    assert count_leased_by_others(engine, SCRAPER_NAME, "other-worker") == 0
+    assert claim_jobs(engine, SCRAPER_NAME, "other-worker", max_attempts=1) == []
+    assert get_counts(engine) == {ScrapeJobState.FAILED: 1}
+
+
+def test_expired_lease_is_claimed_again_before_the_last_attempt(engine):
+    enqueue(engine, ["1"])
+    claim_jobs(engine, SCRAPER_NAME, "crashed-worker", max_attempts=2)
+    expire_leases(engine)
+    assert claim_jobs(engine, SCRAPER_NAME, "other-worker", max_attempts=2) == [(1, "1")]
+    assert get_counts(engine) == {ScrapeJobState.LEASED: 1}
+
+
+def test_consumer_retries_its_own_failed_jobs(engine):
+    enqueue(engine, ["1", "2"])
+    attempts = []
+
+    def scrape_one(job_key):
+        attempts.append(job_key)
+        if attempts.count(job_key) == 1 and job_key == "2":
+            time.sleep(0.2)  # still in progress when no other job is left to claim
+            raise RuntimeError("first attempt fails")
+
+    with JobQueueConsumer(
+        engine, SCRAPER_NAME, max_attempts=2, poll_interval_sec=5, wait_for_leased=False
+    ) as job_queue_consumer:
+        run_bounded(
+            job_queue_consumer, task_function=scrape_one, max_workers=2, on_outcome=job_queue_consumer.on_outcome
+        )
+    assert sorted(attempts) == ["1", "2", "2"]
+    assert get_counts(engine) == {ScrapeJobState.DONE: 2}
+
+
+def run_one_job_through_writer(engine, write_function):
+    """claims the only job, succeeds it and lets a persistence writer write its (empty) objects with write_function"""
+    writer = PersistenceWriter(
+        engine, write_function=write_function, flush_interval_sec=0.1, after_flush_function=release_flushed_jobs
+    )
+    with writer, JobQueueConsumer(
+        engine, SCRAPER_NAME, result_queue=writer.queue, wait_for_leased=False
+    ) as job_queue_consumer:
+        job_key = next(iter(job_queue_consumer))
+        job_queue_consumer.on_outcome(TaskOutcome(job_key, is_success=True))
+        assert get_counts(engine) == {ScrapeJobState.LEASED: 1}  # not done before its objects are written
+    assert job_queue_consumer.jobs_in_progress == {}
+
+
+def test_job_is_done_with_the_batch_of_its_objects(engine):
+    enqueue(engine, ["1"])
+
+    def write_batch(objects, session):
+        job_finishes, _ = split_job_finishes(objects)
+        save_job_finishes(job_finishes, session)
+
+    run_one_job_through_writer(engine, write_batch)
+    assert get_counts(engine) == {ScrapeJobState.DONE: 1}
+
+
+def test_job_of_a_rolled_back_batch_is_claimable_again(engine):
+    enqueue(engine, ["1"])
+
+    def write_batch(objects, session):
+        job_finishes, _ = split_job_finishes(objects)
+        save_job_finishes(job_finishes, session)
+        raise RuntimeError("objects not written")
+
+    run_one_job_through_writer(engine, write_batch)
+    assert get_counts(engine) == {ScrapeJobState.PENDING: 1}
+    assert claim_jobs(engine, SCRAPER_NAME, "other-worker") == [(1, "1")]
@@ -0,0 +1,118 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from market_aggregates import (
+    DEFAULT_AREA_NICKNAME,
+    move_room_areas,
+    rebuild_market_aggregates,
+    update_market_aggregates,
+)
+from models import (
+    AirBnbAreaDayStats,
+    AirBnbRoom,
+    Base,
+    CalendarDayState,
+    bulk_save_or_update_airbnb_dates,
+    bulk_save_or_update_airbnb_room_instances,
+)
+from room_calendar import CalendarDayRow
+
+CALENDAR_DAYS = [date(2030, 9, 1), date(2030, 9, 2)]
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'airbnb.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+def write_rooms(session, room_areas):
+    rooms = [
+        AirBnbRoom(id=room_id, room_url="url", extra_attributes={"area_nickname": area_nickname})
+        for room_id, area_nickname in room_areas.items()
+    ]
+    move_room_areas(session, rooms)
+    bulk_save_or_update_airbnb_room_instances(rooms, session)
+    session.commit()
+
+
+def write_calendar_days(session, room_id, state, price):
+    rows = [
+        CalendarDayRow(
+            room_id=room_id,
+            calendar_day=calendar_day,
+            state=state,
+            price=price,
+            latest_prices_array=[],
+            minimum_stay_nights=1,
+            cleaning_fee=None,
+            currency="EUR",
+            extra_attributes={},
+            price_checked_at=None,
+        )
+        for calendar_day in CALENDAR_DAYS
+    ]
+    written_rows, stored_rows_by_key = bulk_save_or_update_airbnb_dates(rows, session)
+    update_market_aggregates(session, written_rows, stored_rows_by_key)
+    session.commit()
+
+
+def get_area_day_stats(session):
+    """{(area_nickname, calendar_day): counters} of the area days with any count"""
+    table = AirBnbAreaDayStats.__table__
+    return {
+        (row.area_nickname, row.calendar_day): (
+            row.available_count,
+            row.unavailable_count,
+            row.price_count,
+            row.price_sum,
+            row.price_histogram,
+        )
+        for row in session.execute(select(table))
+        if row.available_count or row.unavailable_count
+    }
+
+
+def assert_incremental_stats_as_rebuilt(session):
+    area_day_stats = get_area_day_stats(session)
+    assert all(i >= 0 for counters in area_day_stats.values() for i in counters[:4])
+    rebuild_market_aggregates(session)
+    session.commit()
+    assert area_day_stats == get_area_day_stats(session)
+    return area_day_stats
+
+
+def test_days_follow_their_room_to_a_new_area(session):
+    write_rooms(session, {"1": "Venice Center", "2": "Venice Center"})
+    write_calendar_days(session, "1", CalendarDayState.AVAILABLE, 100.0)
+    write_calendar_days(session, "2", CalendarDayState.UNAVAILABLE, None)
+    write_rooms(session, {"1": "Lido"})
+    area_day_stats = assert_incremental_stats_as_rebuilt(session)
+    assert area_day_stats[("Lido", CALENDAR_DAYS[0])] == (1, 0, 1, 100.0, {"100.0": 1})
+    assert area_day_stats[("Venice Center", CALENDAR_DAYS[0])] == (0, 1, 0, 0.0, {})
+    # the days written afterwards replace their contribution to the new area
+    write_calendar_days(session, "1", CalendarDayState.UNAVAILABLE, None)
+    area_day_stats = assert_incremental_stats_as_rebuilt(session)
+    assert area_day_stats[("Lido", CALENDAR_DAYS[0])] == (0, 1, 0, 0.0, {})
+
+
+def test_days_of_rooms_stored_later_leave_the_default_area(session):
+    write_calendar_days(session, "1", CalendarDayState.AVAILABLE, 100.0)
+    assert (DEFAULT_AREA_NICKNAME, CALENDAR_DAYS[0]) in get_area_day_stats(session)
+    write_rooms(session, {"1": "Lido"})
+    write_calendar_days(session, "1", CalendarDayState.AVAILABLE, 120.0)
+    area_day_stats = assert_incremental_stats_as_rebuilt(session)
+    assert set(area_day_stats) == {("Lido", i) for i in CALENDAR_DAYS}
+
+
+def test_rooms_found_in_the_same_area_are_not_moved(session):
+    write_rooms(session, {"1": "Lido"})
+    write_calendar_days(session, "1", CalendarDayState.AVAILABLE, 100.0)
+    write_rooms(session, {"1": "Lido"})
+    assert set(assert_incremental_stats_as_rebuilt(session)) == {("Lido", i) for i in CALENDAR_DAYS}
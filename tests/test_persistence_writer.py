@@ -0,0 +1,123 @@
+import queue
+import time
+
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from models import AirBnbRoom, Base
+from persistence_writer import PersistenceWriter, RowBoundedQueue
+
+
+def test_queue_is_bounded_in_rows():
+    rows_queue = RowBoundedQueue(10, object_size_function=len)
+    rows_queue.put([0] * 6)
+    rows_queue.put([0] * 6)  # accepted: the queue was below its bound
+    assert rows_queue.qsize() == 12
+    with pytest.raises(queue.Full):
+        rows_queue.put([0], block=False)
+    assert rows_queue.get() == [0] * 6
+    rows_queue.put([])  # counted as one row
+    assert rows_queue.qsize() == 7
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'airbnb.db'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+class BatchRecorder:
+    """write_function and after_flush_function keeping the batches they were called with"""
+
+    def __init__(self, failing_object=None):
+        self.failing_object = failing_object
+        self.written_batches = []
+        self.flushed_batches = []
+
+    def write(self, objects, session):
+        self.written_batches.append(list(objects))
+        for room_id in objects:
+            session.add(AirBnbRoom(id=str(room_id)))
+        session.flush()
+        if self.failing_object in objects:
+            raise ValueError("batch can not be written")
+
+    def after_flush(self, objects, is_committed):
+        self.flushed_batches.append((list(objects), is_committed))
+
+
+def get_stored_room_ids(engine):
+    with Session(engine) as session:
+        return set(session.scalars(select(AirBnbRoom.id)))
+
+
+def test_batches_are_flushed_by_row_count(engine):
+    batch_recorder = BatchRecorder()
+    room_sizes = {12: 2, 23: 3, 31: 1, 44: 4, 51: 1}  # {room id: number of rows}
+    writer = PersistenceWriter(
+        engine,
+        write_function=batch_recorder.write,
+        batch_size=5,
+        flush_interval_sec=60,
+        object_size_function=lambda obj: room_sizes.get(obj, 1),
+    )
+    for room_id in room_sizes:  # queued before the writer starts: the batches do not depend on timing
+        writer.put(room_id)
+    with writer:
+        pass
+    assert batch_recorder.written_batches == [[12, 23], [31, 44], [51]]
+    assert writer.num_objects_written == 11
+    assert writer.num_batches_committed == 3
+
+
+def test_queued_objects_are_written_when_the_writer_closes(engine):
+    batch_recorder = BatchRecorder()
+    with PersistenceWriter(
+        engine, write_function=batch_recorder.write, batch_size=100, flush_interval_sec=60
+    ) as writer:
+        for room_id in [1, 2, 3]:
+            writer.put(room_id)
+        time.sleep(0.1)
+        assert batch_recorder.written_batches == []  # neither batch_size nor flush_interval_sec reached
+    assert batch_recorder.written_batches == [[1, 2, 3]]
+    assert get_stored_room_ids(engine) == {"1", "2", "3"}
+
+
+def test_failed_batch_is_rolled_back_and_the_next_one_written(engine):
+    batch_recorder = BatchRecorder(failing_object=3)
+    writer = PersistenceWriter(
+        engine,
+        write_function=batch_recorder.write,
+        batch_size=2,
+        flush_interval_sec=60,
+        after_flush_function=batch_recorder.after_flush,
+    )
+    for room_id in [1, 2, 3, 4, 5]:
+        writer.put(room_id)
+    with writer:
+        pass
+    assert batch_recorder.flushed_batches == [([1, 2], True), ([3, 4], False), ([5], True)]
+    # the rooms added before the failure are not committed with the rolled back batch
+    assert get_stored_room_ids(engine) == {"1", "2", "5"}
+    assert (writer.num_objects_written, writer.num_objects_failed) == (3, 2)
+
+
+def test_failing_after_flush_function_does_not_stop_the_writer(engine):
+    def after_flush(objects, is_committed):
+        raise RuntimeError("jobs not released")
+
+    writer = PersistenceWriter(
+        engine,
+        write_function=BatchRecorder().write,
+        batch_size=1,
+        flush_interval_sec=60,
+        after_flush_function=after_flush,
+    )
+    for room_id in [1, 2]:
+        writer.put(room_id)
+    with writer:
+        pass
+    assert get_stored_room_ids(engine) == {"1", "2"}
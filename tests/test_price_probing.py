@@ -0,0 +1,133 @@
+import random
+from datetime import date, datetime, timedelta
+from itertools import combinations
+from types import SimpleNamespace
+
+import pytest
+
+from models import CalendarDayState
+from price_probing import (
+    CalendarDayToProbe,
+    PriceProbingStrategy,
+    get_fresh_days,
+    plan_cover_once,
+    plan_every_k_days,
+    plan_price_probes,
+)
+
+FIRST_DAY = date(2030, 9, 1)
+NOW = datetime(2030, 8, 20, 12, 0)
+PRICE_TTL = timedelta(hours=24)
+
+
+def make_days(num_nights_per_day):
+    """CalendarDayToProbe of consecutive days from FIRST_DAY. None in num_nights_per_day is an unavailable day"""
+    return [
+        CalendarDayToProbe(
+            FIRST_DAY + timedelta(days=day_index),
+            CalendarDayState.AVAILABLE if num_nights is not None else CalendarDayState.UNAVAILABLE,
+            num_nights,
+        )
+        for day_index, num_nights in enumerate(num_nights_per_day)
+    ]
+
+
+def get_covered_days(available_days, days_to_probe):
+    return {
+        i.calendar_day
+        for probed_day in available_days
+        if probed_day.calendar_day in days_to_probe
+        for i in available_days
+        if probed_day.calendar_day <= i.calendar_day < probed_day.stay_end
+    }
+
+
+def get_min_number_of_probes(available_days):
+    all_days = {i.calendar_day for i in available_days}
+    for num_probes in range(1, len(available_days) + 1):
+        for days_to_probe in combinations(all_days, num_probes):
+            if get_covered_days(available_days, set(days_to_probe)) == all_days:
+                return num_probes
+
+
+def test_cover_once_probes_the_stays_ending_last():
+    available_days = make_days([3, 1, 4, 1, 1, 1, 2])
+    # day 0 covers days 0-2. of the days containing day 3, day 2 covers until day 5. then day 6 itself
+    assert plan_cover_once(available_days, set()) == [
+        FIRST_DAY,
+        FIRST_DAY + timedelta(days=2),
+        FIRST_DAY + timedelta(days=6),
+    ]
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_cover_once_is_a_minimal_cover(seed):
+    rng = random.Random(seed)
+    available_days = make_days([rng.choice([1, 2, 3, 5]) for _ in range(rng.randint(1, 9))])
+    days_to_probe = plan_cover_once(available_days, set())
+    assert get_covered_days(available_days, set(days_to_probe)) == {i.calendar_day for i in available_days}
+    assert len(days_to_probe) == get_min_number_of_probes(available_days)
+
+
+def test_cover_once_skips_the_covered_days():
+    available_days = make_days([1, 1, 1, 1])
+    already_covered_days = {FIRST_DAY, FIRST_DAY + timedelta(days=2)}
+    assert plan_cover_once(available_days, already_covered_days) == [
+        FIRST_DAY + timedelta(days=1),
+        FIRST_DAY + timedelta(days=3),
+    ]
+    assert plan_cover_once(available_days, {i.calendar_day for i in available_days}) == []
+
+
+def test_cover_once_can_probe_a_fresh_day_to_cover_a_stale_one():
+    calendar_days = make_days([3, 1, 1])
+    fresh_days = {FIRST_DAY, FIRST_DAY + timedelta(days=1)}
+    assert plan_price_probes(calendar_days, PriceProbingStrategy.COVER_ONCE, fresh_days=fresh_days) == {FIRST_DAY}
+
+
+def test_every_k_days_keeps_k_days_between_probes():
+    available_days = make_days([1, 1, None, 1, 1, 1, 1])
+    available_days = [i for i in available_days if i.state == CalendarDayState.AVAILABLE]
+    assert plan_every_k_days(available_days, 3) == [
+        FIRST_DAY,
+        FIRST_DAY + timedelta(days=3),
+        FIRST_DAY + timedelta(days=6),
+    ]
+    assert plan_every_k_days(available_days, 1) == [i.calendar_day for i in available_days]
+
+
+@pytest.mark.parametrize("strategy", list(PriceProbingStrategy))
+def test_unavailable_and_fresh_days_are_not_probed(strategy):
+    calendar_days = make_days([1, None, 1, 1, 1])
+    fresh_days = {FIRST_DAY + timedelta(days=3)}
+    days_to_probe = plan_price_probes(calendar_days, strategy, fresh_days=fresh_days, every_k_days=1)
+    assert days_to_probe == {FIRST_DAY, FIRST_DAY + timedelta(days=2), FIRST_DAY + timedelta(days=4)}
+
+
+def make_stored_day(price_checked_at, state=CalendarDayState.AVAILABLE, price=100.0):
+    return SimpleNamespace(state=state, price=price, price_checked_at=price_checked_at)
+
+
+@pytest.mark.parametrize(
+    "stored_day, is_fresh",
+    [
+        (make_stored_day(NOW - timedelta(hours=23)), True),
+        (make_stored_day(NOW - PRICE_TTL), False),  # expired
+        (make_stored_day(NOW - timedelta(days=3)), False),
+        (make_stored_day(None), False),
+        (make_stored_day(NOW, price=None), False),
+        (make_stored_day(NOW, state=CalendarDayState.UNAVAILABLE), False),
+        (None, False),
+    ],
+)
+def test_fresh_days_are_priced_within_the_ttl(stored_day, is_fresh):
+    calendar_days = make_days([2])
+    stored_calendar_days = {FIRST_DAY: stored_day} if stored_day else {}
+    fresh_days = get_fresh_days(calendar_days, stored_calendar_days, price_ttl=PRICE_TTL, now=NOW)
+    assert fresh_days == ({FIRST_DAY} if is_fresh else set())
+
+
+def test_days_not_available_now_are_never_fresh():
+    calendar_days = make_days([None])
+    stored_calendar_days = {FIRST_DAY: make_stored_day(NOW, state=CalendarDayState.UNAVAILABLE)}
+    assert get_fresh_days(calendar_days, stored_calendar_days, price_ttl=PRICE_TTL, now=NOW) == set()
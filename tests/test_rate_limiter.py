@@ -0,0 +1,133 @@
+import pytest
+
+from rate_limiter import AdaptiveRateLimiter
+
+
+class FakeClock:
+    """clock whose sleep only moves the time forward"""
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def make_rate_limiter(clock, **kwargs):
+    settings = {
+        "initial_rate_per_sec": 2.0,
+        "min_rate_per_sec": 0.1,
+        "max_rate_per_sec": 20.0,
+        "burst": 1,
+        "additive_increase_per_sec": 0.5,
+        "decrease_factor": 0.5,
+        "target_latency_sec": 8,
+        "max_error_rate": 0.2,
+        "window_size": 10,
+        "min_window_size": 1,
+        "latency_ewma_alpha": 0.2,
+        "decrease_cooldown_sec": 10,
+        **kwargs,
+    }
+    return AdaptiveRateLimiter(**settings, clock=clock, sleep=clock.sleep)
+
+
+def test_acquire_waits_for_the_next_token(clock):
+    rate_limiter = make_rate_limiter(clock, burst=2)
+    assert rate_limiter.acquire() == 0
+    assert rate_limiter.acquire() == 0
+    assert rate_limiter.acquire() == pytest.approx(1 / 2.0)
+    assert rate_limiter.get_stats()["total_wait_sec"] == pytest.approx(0.5)
+
+
+def test_success_with_a_drained_bucket_increases_the_rate_additively(clock):
+    rate_limiter = make_rate_limiter(clock)
+    rate_limiter.acquire()
+    rate_limiter.record(1.0)
+    assert rate_limiter.current_rate == pytest.approx(2.0 + 0.5 / 2.0)
+
+
+def test_success_with_tokens_left_keeps_the_rate(clock):
+    rate_limiter = make_rate_limiter(clock)
+    clock.sleep(5)  # idle: the bucket is full, the limiter is not what holds the threads back
+    rate_limiter.record(1.0)
+    assert rate_limiter.current_rate == 2.0
+
+
+def test_rate_increase_stops_at_the_max_rate(clock):
+    rate_limiter = make_rate_limiter(clock, max_rate_per_sec=2.1)
+    for _ in range(10):
+        rate_limiter.acquire()
+        rate_limiter.record(1.0)
+    assert rate_limiter.current_rate == 2.1
+
+
+def test_high_latency_decreases_the_rate_multiplicatively(clock):
+    rate_limiter = make_rate_limiter(clock)
+    rate_limiter.record(9.0)
+    assert rate_limiter.current_rate == 1.0
+    assert rate_limiter.get_stats()["num_decreases"] == 1
+    # the next decision is taken on the requests made at the new rate
+    assert rate_limiter.latency_ewma is None and len(rate_limiter.window) == 0
+
+
+def test_errors_over_the_max_error_rate_decrease_the_rate(clock):
+    rate_limiter = make_rate_limiter(clock, min_window_size=5)
+    for _ in range(4):
+        rate_limiter.record(1.0, is_error=True)
+    assert rate_limiter.current_rate == 2.0  # fewer requests than min_window_size
+    rate_limiter.record(1.0, is_error=True)
+    assert rate_limiter.current_rate == 1.0
+
+
+def test_rate_decrease_stops_at_the_min_rate(clock):
+    rate_limiter = make_rate_limiter(clock, min_rate_per_sec=0.8, decrease_cooldown_sec=0)
+    for _ in range(3):
+        rate_limiter.record(9.0)
+    assert rate_limiter.current_rate == 0.8
+
+
+def test_one_decrease_per_cooldown(clock):
+    rate_limiter = make_rate_limiter(clock)
+    rate_limiter.record(9.0)
+    clock.sleep(9)
+    rate_limiter.record(9.0, started_at=clock())
+    assert rate_limiter.current_rate == 1.0
+    clock.sleep(1)
+    rate_limiter.record(9.0, started_at=clock())
+    assert rate_limiter.current_rate == 0.5
+    assert rate_limiter.get_stats()["num_decreases"] == 2
+
+
+def test_responses_started_before_the_last_decrease_are_skipped(clock):
+    rate_limiter = make_rate_limiter(clock)
+    started_at = clock()
+    clock.sleep(1)
+    rate_limiter.record(9.0)
+    clock.sleep(20)  # past the cooldown: only the start time of the request keeps it out
+    rate_limiter.record(30.0, is_error=True, started_at=started_at)
+    assert rate_limiter.current_rate == 1.0
+    assert len(rate_limiter.window) == 0
+    assert rate_limiter.get_stats()["num_requests"] == 2
+    assert rate_limiter.get_stats()["num_errors"] == 1
+
+
+def test_request_records_the_latency_and_the_exceptions(clock):
+    rate_limiter = make_rate_limiter(clock, min_window_size=3)
+    with rate_limiter.request():
+        clock.sleep(3)
+    with pytest.raises(RuntimeError):
+        with rate_limiter.request():
+            clock.sleep(1)
+            raise RuntimeError("page load failed")
+    assert list(rate_limiter.window) == [False, True]
+    assert rate_limiter.latency_ewma == pytest.approx(0.2 * 1 + 0.8 * 3)
+    assert rate_limiter.get_stats()["num_errors"] == 1
@@ -0,0 +1,41 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models import AirBnbRoom, Base, bulk_save_or_update_airbnb_room_instances
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'airbnb.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
+    engine.dispose()
+
+
+@pytest.mark.parametrize("stored_extra_attributes", [None, {}, {"host": "a"}])
+def test_area_nickname_reaches_stored_rooms(session, stored_extra_attributes):
+    bulk_save_or_update_airbnb_room_instances(
+        [AirBnbRoom(id="1", room_url="url", extra_attributes=stored_extra_attributes)], session
+    )
+    session.commit()
+    bulk_save_or_update_airbnb_room_instances(
+        [AirBnbRoom(id="1", room_url="url", extra_attributes={"area_nickname": "Venice Center"})], session
+    )
+    session.commit()
+    session.expire_all()
+    room = session.get(AirBnbRoom, "1")
+    assert room.extra_attributes == {**(stored_extra_attributes or {}), "area_nickname": "Venice Center"}
+    assert room.number_updates == 1
+
+
+def test_rooms_found_without_extra_attributes_keep_theirs(session):
+    bulk_save_or_update_airbnb_room_instances(
+        [AirBnbRoom(id="1", room_url="url", extra_attributes={"area_nickname": "Venice Center"})], session
+    )
+    session.commit()
+    bulk_save_or_update_airbnb_room_instances([AirBnbRoom(id="1", room_url="url")], session)
+    session.commit()
+    session.expire_all()
+    assert session.get(AirBnbRoom, "1").extra_attributes == {"area_nickname": "Venice Center"}
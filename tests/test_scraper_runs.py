@@ -0,0 +1,76 @@
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, func, select, update
+from sqlalchemy.orm import Session
+
+from models import AirBnbScraperCampaign, AirBnbScraperRun, Base
+from scraper_runs import make_scraper_run, save_scraper_runs, split_scraper_runs, start_campaign
+from task_scheduler import TaskOutcome
+
+SCRAPER_NAME = "active_links"
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'airbnb.db'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+
+def record_outcomes(engine, campaign_id, outcomes):
+    with Session(engine) as session, session.begin():
+        scraper_runs, _ = split_scraper_runs([make_scraper_run(SCRAPER_NAME, campaign_id, i) for i in outcomes])
+        save_scraper_runs(scraper_runs, session)
+
+
+def fail_to_plan():
+    raise AssertionError("a resumed campaign must not plan its items again")
+
+
+def test_resumed_campaign_scrapes_its_saved_items_which_did_not_succeed(engine):
+    campaign_id, items = start_campaign(engine, SCRAPER_NAME, lambda: ["a", "b", "c"])
+    assert items == ["a", "b", "c"]
+    record_outcomes(engine, campaign_id, [TaskOutcome("a", True), TaskOutcome("b", False)])
+    assert start_campaign(engine, SCRAPER_NAME, fail_to_plan, resume=True) == (campaign_id, ["b", "c"])
+    assert start_campaign(engine, SCRAPER_NAME, fail_to_plan, resume=True, campaign_id=campaign_id) == (
+        campaign_id,
+        ["b", "c"],
+    )
+
+
+def test_campaign_which_crashed_before_any_run_is_the_one_resumed(engine):
+    start_campaign(engine, SCRAPER_NAME, lambda: [1, 2], campaign_id="previous")
+    record_outcomes(engine, "previous", [TaskOutcome(1, True)])
+    with engine.begin() as connection:  # started earlier than the second resolution of sqlite CURRENT_TIMESTAMP
+        connection.execute(
+            update(AirBnbScraperCampaign.__table__).values(created_at=datetime(2020, 1, 1))
+        )
+    start_campaign(engine, SCRAPER_NAME, lambda: [3, 4], campaign_id="crashed")
+    assert start_campaign(engine, SCRAPER_NAME, fail_to_plan, resume=True) == ("crashed", [3, 4])
+
+
+def test_resume_without_saved_campaign_starts_a_new_one(engine):
+    campaign_id, items = start_campaign(engine, SCRAPER_NAME, lambda: ["a"], resume=True)
+    assert items == ["a"]
+    assert start_campaign(engine, SCRAPER_NAME, fail_to_plan, resume=True) == (campaign_id, ["a"])
+
+
+def test_run_times_are_on_the_database_clock(engine):
+    scraper_runs = [
+        make_scraper_run(SCRAPER_NAME, "campaign", TaskOutcome("a", False, error="timeout", duration_sec=60)),
+        make_scraper_run(SCRAPER_NAME, "campaign", TaskOutcome("a", True, duration_sec=30)),
+    ]
+    time.sleep(0.1)
+    with Session(engine) as session, session.begin():
+        database_now = session.scalar(select(func.now())).replace(tzinfo=None)
+        save_scraper_runs(scraper_runs, session)
+    with Session(engine) as session:
+        stored_runs = session.scalars(select(AirBnbScraperRun).order_by(AirBnbScraperRun.created_at)).all()
+    assert [i.is_success for i in stored_runs] == [False, True]
+    for stored_run, duration_sec in zip(stored_runs, [60, 30]):
+        assert stored_run.updated_at - stored_run.created_at == timedelta(seconds=duration_sec)
+        # sqlite CURRENT_TIMESTAMP has a resolution of a second
+        assert abs(database_now - stored_run.updated_at) < timedelta(seconds=1.1)
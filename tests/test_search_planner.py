@@ -0,0 +1,203 @@
+import random
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from search_planner import (
+    BoundingBox,
+    PriceBand,
+    SearchTile,
+    merge_sparse_price_bands,
+    plan_price_bands,
+    plan_search_tiles,
+)
+
+MAX_ROOMS_PER_BAND = 10
+MAX_ROOMS_PER_TILE = 10
+SEARCH_BOX = BoundingBox(ne_lat=45.5, ne_lng=12.4, sw_lat=45.4, sw_lng=12.3)
+
+
+def get_search_parameters(search_link):
+    return {key: values[0] for key, values in parse_qs(urlparse(search_link).query).items()}
+
+
+class FakeRoomCounter:
+    """count_rooms_at_link over fixed room prices. the searches it answered are kept in searched_links"""
+
+    def __init__(self, room_prices, failing_price_mins=()):
+        self.room_prices = room_prices
+        self.failing_price_mins = set(failing_price_mins)
+        self.searched_links = []
+
+    def __call__(self, search_link):
+        self.searched_links.append(search_link)
+        search_parameters = get_search_parameters(search_link)
+        price_min, price_max = int(search_parameters["price_min"]), int(search_parameters["price_max"])
+        if price_min in self.failing_price_mins:
+            raise TimeoutError("number of rooms not shown")
+        return sum(price_min <= i < price_max for i in self.room_prices)
+
+
+def assert_bands_cover(price_bands, price_min, price_max):
+    assert price_bands[0].price_min == price_min
+    assert price_bands[-1].price_max == price_max
+    for previous_band, price_band in zip(price_bands, price_bands[1:]):
+        assert previous_band.price_max == price_band.price_min
+
+
+def test_bands_over_the_cap_are_split_until_they_fit():
+    rng = random.Random(1)
+    room_prices = [rng.randint(50, 99) for _ in range(40)] + [rng.randint(100, 399) for _ in range(5)]
+    count_rooms_at_link = FakeRoomCounter(room_prices)
+    price_bands = plan_price_bands(
+        count_rooms_at_link,
+        initial_price_bands=[PriceBand(0, 200), PriceBand(200, 400)],
+        min_band_width=1,
+        merge_fill_ratio=1.0,
+        max_rooms_per_band=MAX_ROOMS_PER_BAND,
+    )
+    assert_bands_cover(price_bands, 0, 400)
+    assert all(i.number_of_rooms <= MAX_ROOMS_PER_BAND for i in price_bands)
+    assert sum(i.number_of_rooms for i in price_bands) == len(room_prices)
+    assert len(price_bands) >= len(room_prices) / MAX_ROOMS_PER_BAND
+    # the sparse expensive range is under the cap: it is counted once and never split
+    assert sum("price_min=200&" in i for i in count_rooms_at_link.searched_links) == 1
+
+
+def test_band_at_the_min_width_is_kept_over_the_cap():
+    count_rooms_at_link = FakeRoomCounter([100] * (MAX_ROOMS_PER_BAND + 5))
+    price_bands = plan_price_bands(
+        count_rooms_at_link,
+        initial_price_bands=[PriceBand(96, 104)],
+        min_band_width=2,
+        merge_fill_ratio=1.0,
+        max_rooms_per_band=MAX_ROOMS_PER_BAND,
+    )
+    assert PriceBand(100, 102, MAX_ROOMS_PER_BAND + 5) in price_bands
+    assert all(i.width >= 2 for i in price_bands)
+
+
+def test_band_which_could_not_be_counted_is_kept_uncounted():
+    count_rooms_at_link = FakeRoomCounter([10, 150], failing_price_mins=[100])
+    price_bands = plan_price_bands(
+        count_rooms_at_link,
+        initial_price_bands=[PriceBand(0, 100), PriceBand(100, 200), PriceBand(200, 300)],
+        merge_fill_ratio=1.0,
+        max_rooms_per_band=MAX_ROOMS_PER_BAND,
+    )
+    assert price_bands == [PriceBand(0, 100, 1), PriceBand(100, 200, None), PriceBand(200, 300, 0)]
+
+
+def test_sparse_neighbouring_bands_are_merged_under_the_fill_ratio():
+    count_rooms_at_link = FakeRoomCounter([10, 20, 110, 120, 130, 210, 220, 230, 240, 250, 260])
+    price_bands = plan_price_bands(
+        count_rooms_at_link,
+        initial_price_bands=[PriceBand(0, 100), PriceBand(100, 200), PriceBand(200, 300), PriceBand(300, 400)],
+        merge_fill_ratio=0.5,
+        max_rooms_per_band=MAX_ROOMS_PER_BAND,
+    )
+    # 2 + 3 rooms fit in half the cap, 6 + 0 rooms do not go over the cap but over the fill ratio
+    assert price_bands == [PriceBand(0, 200, 5), PriceBand(200, 300, 6), PriceBand(300, 400, 0)]
+
+
+@pytest.mark.parametrize(
+    "price_bands, merged_bands",
+    [
+        (
+            [PriceBand(0, 10, 2), PriceBand(10, 20, 3), PriceBand(20, 30, 4), PriceBand(30, 40, 1)],
+            [PriceBand(0, 20, 5), PriceBand(20, 40, 5)],
+        ),
+        # bands which were not counted, or are not neighbours, are not merged
+        (
+            [PriceBand(0, 10, 1), PriceBand(10, 20, None), PriceBand(20, 30, 1), PriceBand(40, 50, 1)],
+            [PriceBand(0, 10, 1), PriceBand(10, 20, None), PriceBand(20, 30, 1), PriceBand(40, 50, 1)],
+        ),
+        # merged in price order, whatever the order they come in
+        (
+            [PriceBand(10, 20, 1), PriceBand(0, 10, 1)],
+            [PriceBand(0, 20, 2)],
+        ),
+    ],
+)
+def test_merge_sparse_price_bands(price_bands, merged_bands):
+    assert merge_sparse_price_bands(price_bands, max_rooms_per_band=5) == merged_bands
+
+
+class FakeTileRoomCounter:
+    """count_rooms_at_link over fixed room locations (lat, lng)"""
+
+    def __init__(self, room_locations):
+        self.room_locations = room_locations
+        self.num_searches = 0
+
+    def __call__(self, search_link):
+        self.num_searches += 1
+        return sum(is_in_box(i, get_link_bounding_box(search_link)) for i in self.room_locations)
+
+
+def get_link_bounding_box(search_link):
+    search_parameters = get_search_parameters(search_link)
+    return BoundingBox(*(float(search_parameters[i]) for i in BoundingBox._fields))
+
+
+def is_in_box(room_location, bounding_box):
+    lat, lng = room_location
+    return bounding_box.sw_lat <= lat < bounding_box.ne_lat and bounding_box.sw_lng <= lng < bounding_box.ne_lng
+
+
+def get_box_area(bounding_box):
+    return (bounding_box.ne_lat - bounding_box.sw_lat) * (bounding_box.ne_lng - bounding_box.sw_lng)
+
+
+def make_room_locations(rng, num_rooms, bounding_box):
+    return [
+        (rng.uniform(bounding_box.sw_lat, bounding_box.ne_lat), rng.uniform(bounding_box.sw_lng, bounding_box.ne_lng))
+        for _ in range(num_rooms)
+    ]
+
+
+def test_tiles_cover_the_search_box_once():
+    rng = random.Random(1)
+    # a dense cluster in the south-west corner and a few rooms elsewhere
+    dense_box = BoundingBox(45.41, 12.31, 45.4, 12.3)
+    room_locations = make_room_locations(rng, 40, dense_box) + make_room_locations(rng, 8, SEARCH_BOX)
+    search_tiles = plan_search_tiles(
+        FakeTileRoomCounter(room_locations),
+        bounding_box=SEARCH_BOX,
+        zoom=12,
+        max_depth=6,
+        max_rooms_per_tile=MAX_ROOMS_PER_TILE,
+    )
+    assert sum(get_box_area(i.bounding_box) for i in search_tiles) == pytest.approx(get_box_area(SEARCH_BOX))
+    for room_location in room_locations:
+        assert sum(is_in_box(room_location, i.bounding_box) for i in search_tiles) == 1
+    assert sum(i.number_of_rooms for i in search_tiles) == len(room_locations)
+    assert all(i.number_of_rooms <= MAX_ROOMS_PER_TILE for i in search_tiles)
+    assert all(i.zoom == 12 + i.depth for i in search_tiles)
+    # only the cluster needs deep tiles: the rest of the box stays in big ones
+    assert max(i.depth for i in search_tiles) >= 3
+    assert min(i.depth for i in search_tiles) == 1
+
+
+def test_tile_under_the_cap_is_not_split():
+    count_rooms_at_link = FakeTileRoomCounter(make_room_locations(random.Random(1), MAX_ROOMS_PER_TILE, SEARCH_BOX))
+    search_tiles = plan_search_tiles(
+        count_rooms_at_link, bounding_box=SEARCH_BOX, zoom=12, max_rooms_per_tile=MAX_ROOMS_PER_TILE
+    )
+    assert search_tiles == [SearchTile(SEARCH_BOX, 12, 0, MAX_ROOMS_PER_TILE)]
+    assert count_rooms_at_link.num_searches == 1
+
+
+def test_recursion_stops_at_the_max_depth():
+    # rooms all at the same place: no split ever gets them under the cap
+    room_locations = [(45.45, 12.35)] * (MAX_ROOMS_PER_TILE + 1)
+    count_rooms_at_link = FakeTileRoomCounter(room_locations)
+    search_tiles = plan_search_tiles(
+        count_rooms_at_link, bounding_box=SEARCH_BOX, zoom=12, max_depth=3, max_rooms_per_tile=MAX_ROOMS_PER_TILE
+    )
+    assert max(i.depth for i in search_tiles) == 3
+    assert [i.number_of_rooms for i in search_tiles if i.number_of_rooms] == [MAX_ROOMS_PER_TILE + 1]
+    # one tile split at every level: 1 + 4 * max_depth counting searches
+    assert count_rooms_at_link.num_searches == 1 + 4 * 3
+    assert len(search_tiles) == 3 * 3 + 1
+    assert sum(get_box_area(i.bounding_box) for i in search_tiles) == pytest.approx(get_box_area(SEARCH_BOX))
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+import pytest
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+
+import selenium_airbnb_active_venice_links_scraper as links_scraper
+
+
+class FakeSearchPage:
+    """driver of a search page rendered after render_after_polls polls (with the eager strategy, after driver.get)"""
+
+    def __init__(self, render_after_polls, number_of_rooms_text=None):
+        self.current_url = links_scraper.generate_search_link(100, 200)
+        self.render_after_polls = render_after_polls
+        self.number_of_rooms_text = number_of_rooms_text  # None: no exact matches
+        self.num_polls = 0
+
+    @property
+    def is_rendered(self):
+        return self.num_polls > self.render_after_polls
+
+    def find_elements(self, by, value):
+        self.num_polls += 1  # the no exact matches banner is looked for first at every poll
+        if value == links_scraper.NO_EXACT_MATCHES_XPATH and self.is_rendered and self.number_of_rooms_text is None:
+            return [SimpleNamespace(text="No exact matches")]
+        return []
+
+    def find_element(self, by, value):
+        if value == links_scraper.NUMBER_OF_ROOMS_XPATH and self.is_rendered and self.number_of_rooms_text:
+            return SimpleNamespace(text=self.number_of_rooms_text)
+        raise NoSuchElementException(value)
+
+
+@pytest.fixture(autouse=True)
+def short_timeout(monkeypatch):
+    monkeypatch.setattr(links_scraper, "DEFAULT_LOAD_TIME_WAIT", 1)
+
+
+def test_no_exact_matches_rendered_after_the_page_load_ends_the_wait():
+    driver = FakeSearchPage(render_after_polls=3)
+    assert links_scraper.get_number_of_rooms_in_page(driver) is None
+    assert driver.num_polls == 4
+
+
+def test_number_of_rooms_rendered_after_the_page_load():
+    driver = FakeSearchPage(render_after_polls=3, number_of_rooms_text="1,234 homes")
+    assert links_scraper.get_number_of_rooms_in_page(driver) == 1234
+    assert driver.num_polls == 4
+
+
+def test_page_never_rendered_times_out():
+    with pytest.raises(TimeoutException):
+        links_scraper.get_number_of_rooms_in_page(FakeSearchPage(render_after_polls=10**6))
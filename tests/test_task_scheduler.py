@@ -0,0 +1,87 @@
+import threading
+import time
+
+import pytest
+
+from task_scheduler import run_bounded
+
+
+class InFlightCounter:
+    """task_function recording the highest number of tasks running at the same time"""
+
+    def __init__(self, task_sec=0.01):
+        self.task_sec = task_sec
+        self.lock = threading.Lock()
+        self.num_in_flight = 0
+        self.max_in_flight = 0
+
+    def __call__(self, item):
+        with self.lock:
+            self.num_in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.num_in_flight)
+        time.sleep(self.task_sec * (1 + item % 3))  # uneven durations: workers pull new items at different times
+        with self.lock:
+            self.num_in_flight -= 1
+        return item * 2
+
+
+@pytest.mark.parametrize("max_workers", [1, 3, 8])
+def test_in_flight_tasks_never_exceed_max_workers(max_workers):
+    task_function = InFlightCounter()
+    outcomes = run_bounded(range(40), task_function=task_function, max_workers=max_workers)
+    assert task_function.max_in_flight == max_workers
+    assert sorted(i.result for i in outcomes) == [i * 2 for i in range(40)]
+
+
+def test_items_are_consumed_lazily():
+    num_pulled = 0
+    num_started = []
+
+    def items():
+        nonlocal num_pulled
+        for item in range(20):
+            num_pulled += 1
+            yield item
+
+    def task_function(item):
+        num_started.append(num_pulled)
+        time.sleep(0.01)
+
+    run_bounded(items(), task_function=task_function, max_workers=2)
+    # the queue holds max_workers items: no more than the running tasks and one queue ahead of them are pulled
+    assert max(started - index for index, started in enumerate(num_started)) <= 2 * 2
+
+
+def test_every_outcome_reaches_on_outcome():
+    received_outcomes = []
+    lock = threading.Lock()
+
+    def on_outcome(outcome):
+        with lock:
+            received_outcomes.append(outcome)
+
+    outcomes = run_bounded(range(25), task_function=lambda item: item, max_workers=4, on_outcome=on_outcome)
+    assert len(outcomes) == 25
+    assert sorted(received_outcomes) == sorted(outcomes)
+
+
+def test_raising_task_is_a_failed_outcome():
+    def task_function(item):
+        if item == 2:
+            raise ValueError("no rooms")
+        return item
+
+    outcomes = {i.item: i for i in run_bounded(range(4), task_function=task_function, max_workers=2)}
+    assert [i.is_success for _, i in sorted(outcomes.items())] == [True, True, False, True]
+    assert outcomes[2].error == "ValueError: no rooms"
+    assert outcomes[2].result is None
+    assert outcomes[2].duration_sec >= 0
+
+
+def test_raising_on_outcome_does_not_stop_the_other_tasks():
+    def on_outcome(outcome):
+        if outcome.item == 1:
+            raise RuntimeError("writer queue closed")
+
+    outcomes = run_bounded(range(5), task_function=lambda item: item, max_workers=2, on_outcome=on_outcome)
+    assert sorted(i.item for i in outcomes) == list(range(5))
@@ -0,0 +1,81 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from models import (
+    CALENDAR_DAY_VALUE_COLUMNS,
+    AirBnbRoom,
+    AirBnbRoomCalendarDay,
+    Base,
+    CalendarDayState,
+    bulk_save_or_update_airbnb_dates,
+    fetch_room_calendar_days,
+    reconstruct_calendar_day_state,
+    save_or_update_airbnb_date,
+)
+from room_calendar import CalendarDayRow
+
+ROOM_ID = "room-1"
+CALENDAR_DAY = date(2030, 9, 1)
+
+# (state, price, minimum nights, extra attributes) written one after the other. the price only changes are within
+# the tolerance or without a state change, so the rules do not give them a transition type of their own
+WRITE_SEQUENCE = [
+    (CalendarDayState.AVAILABLE, 100.0, 2, {}),
+    (CalendarDayState.AVAILABLE, 105.0, 2, {}),
+    (CalendarDayState.UNAVAILABLE, 105.0, 2, {}),
+    (CalendarDayState.UNAVAILABLE, 105.0, 3, {}),
+    (CalendarDayState.UNAVAILABLE, 105.0, 3, {"weekly_discount": 5}),
+    (CalendarDayState.AVAILABLE, 108.0, 3, {"weekly_discount": 5}),
+    (CalendarDayState.AVAILABLE, 150.0, 3, {"weekly_discount": 5}),
+    (CalendarDayState.AVAILABLE, 150.0, 3, {"weekly_discount": 5}),
+]
+
+
+@pytest.fixture
+def session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'airbnb.db'}")
+    Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        session.add(AirBnbRoom(id=ROOM_ID))
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+def make_row(state, price, minimum_stay_nights, extra_attributes):
+    return CalendarDayRow(
+        room_id=ROOM_ID,
+        calendar_day=CALENDAR_DAY,
+        state=state,
+        price=price,
+        latest_prices_array=[{"check_in": "2030-09-01", "check_out": "2030-09-02", "price": price}],
+        minimum_stay_nights=minimum_stay_nights,
+        cleaning_fee=10.0,
+        currency="EUR",
+        extra_attributes=extra_attributes,
+        price_checked_at=None,
+    )
+
+
+def assert_reconstructed_as_stored(session, step):
+    stored_day = fetch_room_calendar_days(session, ROOM_ID)[CALENDAR_DAY]
+    reconstructed_day = reconstruct_calendar_day_state(session, ROOM_ID, CALENDAR_DAY)
+    for column in CALENDAR_DAY_VALUE_COLUMNS:
+        assert reconstructed_day.get(column) == getattr(stored_day, column), (step, column)
+
+
+def test_bulk_writes_are_reconstructed_at_every_step(session):
+    for step, values in enumerate(WRITE_SEQUENCE):
+        bulk_save_or_update_airbnb_dates([make_row(*values)], session)
+        session.commit()
+        assert_reconstructed_as_stored(session, step)
+
+
+def test_single_day_writes_are_reconstructed_at_every_step(session):
+    for step, values in enumerate(WRITE_SEQUENCE):
+        save_or_update_airbnb_date(AirBnbRoomCalendarDay(**make_row(*values)._asdict()), session)
+        session.commit()
+        assert_reconstructed_as_stored(session, step)